@@ -7,7 +7,7 @@ This module uses Pydantic's settings management to:
 3. Validate the configuration values
 4. Provide strongly-typed access to settings throughout the app
 """
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings
 import logging
@@ -15,11 +15,22 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class OpenAIBackendSettings(BaseModel):
+    """One Azure OpenAI endpoint/deployment that can serve chat completions"""
+    endpoint: str
+    gpt_deployment: str
+    # Relative share of traffic when all backends are equally fast
+    weight: float = 1.0
+    name: Optional[str] = ""
+
+
 class OpenAISettings(BaseModel):
     """Azure OpenAI settings"""
     endpoint: str
     gpt_deployment: str
     embedding_deployment: Optional[str] = ""
+    # Chat completion backends; the first one is the primary endpoint/deployment above
+    backends: List[OpenAIBackendSettings] = []
 
 
 class SearchSettings(BaseModel):
@@ -31,22 +42,62 @@ class SearchSettings(BaseModel):
 class AppSettings(BaseSettings):
     # Evaluation logging
     azure_evaluation_blob: str = Field("evaluation.jsonl", env="AZURE_EVALUATION_BLOB")
+    # "hourly": one blob per hour and worker, <AZURE_EVALUATION_PREFIX>/yyyy/mm/dd/hh-<worker>.jsonl;
+    # "single": everything in AZURE_EVALUATION_BLOB (read either way, for older logs)
+    evaluation_log_layout: Literal["hourly", "single"] = Field("hourly", env="EVALUATION_LOG_LAYOUT")
+    azure_evaluation_prefix: str = Field("evaluation", env="AZURE_EVALUATION_PREFIX")
+    # Names this process's partitions; defaults to <hostname>-<pid>
+    evaluation_log_worker_id: str = Field("", env="EVALUATION_LOG_WORKER_ID")
+    # Where scripts.compact_evaluations writes the columnar files of closed hours
+    azure_evaluation_columnar_prefix: str = Field("evaluation-columnar", env="AZURE_EVALUATION_COLUMNAR_PREFIX")
     """Application settings with environment variable loading capabilities"""
     # Azure OpenAI Settings
     azure_openai_endpoint: str = Field(..., env="AZURE_OPENAI_ENDPOINT")
     azure_openai_gpt_deployment: str = Field(..., env="AZURE_OPENAI_GPT_DEPLOYMENT")
     azure_openai_embedding_deployment: str = Field("", env="AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    # Additional deployments (e.g. other regions) of the same model, as JSON:
+    # [{"endpoint": "https://...", "gpt_deployment": "gpt-4o", "weight": 1}]
+    azure_openai_backends: List[OpenAIBackendSettings] = Field([], env="AZURE_OPENAI_BACKENDS")
+    # Circuit breaker: consecutive failures before a backend is taken out of rotation, and for how long
+    openai_backend_failure_threshold: int = Field(3, env="OPENAI_BACKEND_FAILURE_THRESHOLD")
+    openai_backend_cooldown_seconds: float = Field(30.0, env="OPENAI_BACKEND_COOLDOWN_SECONDS")
     
     # Azure AI Search Settings
     azure_search_service_url: str = Field(..., env="AZURE_SEARCH_SERVICE_URL")
     azure_search_index_name: str = Field(..., env="AZURE_SEARCH_INDEX_NAME")
+    # Bump after re-indexing to invalidate cached answers grounded in the old index
+    azure_search_index_version: str = Field("1", env="AZURE_SEARCH_INDEX_VERSION")
     
+    # Retrieval backend: "azure_search" ("On Your Data") or "local" (in-process index
+    # built with `python -m scripts.build_local_index`)
+    retriever_backend: Literal["azure_search", "local"] = Field("azure_search", env="RETRIEVER_BACKEND")
+    local_index_path: str = Field("data/local-index", env="LOCAL_INDEX_PATH")
+    retriever_top_k: int = Field(5, env="RETRIEVER_TOP_K")
+    # Embeddings computed by the app (local retriever queries, ingestion) are cached
+    # on disk and shared by all worker processes
+    embedding_cache_enabled: bool = Field(True, env="EMBEDDING_CACHE_ENABLED")
+    embedding_cache_path: str = Field("data/embedding-cache", env="EMBEDDING_CACHE_PATH")
+    embedding_cache_max_entries: int = Field(100000, env="EMBEDDING_CACHE_MAX_ENTRIES")
+    # Answer questions that match a FAQ entry with at least this confidence (0-1) with
+    # its curated answer, without calling Azure OpenAI. Skipped if there is no index
+    # at the path (build it with `python -m scripts.build_faq_index`).
+    faq_fast_path_enabled: bool = Field(True, env="FAQ_FAST_PATH_ENABLED")
+    faq_index_path: str = Field("data/faq-index", env="FAQ_INDEX_PATH")
+    faq_min_confidence: float = Field(0.65, env="FAQ_MIN_CONFIDENCE")
+    faq_lexical_weight: float = Field(0.5, env="FAQ_LEXICAL_WEIGHT")
+
     # Other settings
     system_prompt: str = Field(
         "You are an AI assistant that helps people find information from their documents. Always cite your sources using the document title.",
         env="SYSTEM_PROMPT"
     )
     
+    # Chat history sent to the model: the system prompt and latest turn are always
+    # kept, older turns are added newest-first until the token budget is reached
+    chat_history_token_budget: int = Field(6000, env="CHAT_HISTORY_TOKEN_BUDGET")
+    # Replace turns that no longer fit with a cached rolling summary
+    chat_history_summary_enabled: bool = Field(False, env="CHAT_HISTORY_SUMMARY_ENABLED")
+    
     # Optional port setting
     port: int = Field(8080, env="PORT")
 
@@ -54,6 +105,68 @@ class AppSettings(BaseSettings):
     azure_blob_account_url: str = Field(..., env="AZURE_BLOB_ACCOUNT_URL")  # e.g. https://<account>.blob.core.windows.net
     azure_blob_container: str = Field(..., env="AZURE_BLOB_CONTAINER")
     azure_blob_feedback_blob: str = Field("feedback.jsonl", env="AZURE_BLOB_FEEDBACK_BLOB")
+    # Output of the offline feedback compaction (evaluation records with feedback merged)
+    azure_evaluation_merged_blob: str = Field("evaluation.merged.jsonl", env="AZURE_EVALUATION_MERGED_BLOB")
+
+    # Background telemetry writer (evaluation and feedback records)
+    telemetry_batch_size: int = Field(100, env="TELEMETRY_BATCH_SIZE")
+    telemetry_flush_interval_seconds: float = Field(1.0, env="TELEMETRY_FLUSH_INTERVAL_SECONDS")
+    telemetry_queue_max: int = Field(10000, env="TELEMETRY_QUEUE_MAX")
+    # "drop" discards records when the queue is full, "block" waits briefly for room first
+    telemetry_overflow_policy: Literal["drop", "block"] = Field("drop", env="TELEMETRY_OVERFLOW_POLICY")
+    telemetry_shutdown_timeout_seconds: float = Field(10.0, env="TELEMETRY_SHUTDOWN_TIMEOUT_SECONDS")
+
+    # Connection pool limits for the shared Azure OpenAI and Blob Storage clients
+    http_pool_max_connections: int = Field(100, env="HTTP_POOL_MAX_CONNECTIONS")
+    http_pool_max_keepalive: int = Field(20, env="HTTP_POOL_MAX_KEEPALIVE")
+    http_pool_keepalive_expiry_seconds: float = Field(30.0, env="HTTP_POOL_KEEPALIVE_EXPIRY_SECONDS")
+
+    # Client-side throttling of chat completions. Set the RPM/TPM limits to the
+    # deployment's quota (0 = no local estimate, rely on 429s alone).
+    openai_rpm_limit: int = Field(0, env="OPENAI_RPM_LIMIT")
+    openai_tpm_limit: int = Field(0, env="OPENAI_TPM_LIMIT")
+    openai_concurrency_initial: int = Field(16, env="OPENAI_CONCURRENCY_INITIAL")
+    openai_concurrency_min: int = Field(1, env="OPENAI_CONCURRENCY_MIN")
+    openai_concurrency_max: int = Field(64, env="OPENAI_CONCURRENCY_MAX")
+    # Calls slower than this count as congestion and reduce concurrency
+    openai_latency_target_seconds: float = Field(30.0, env="OPENAI_LATENCY_TARGET_SECONDS")
+    # Upper bound on queueing plus retries for one request
+    openai_request_deadline_seconds: float = Field(60.0, env="OPENAI_REQUEST_DEADLINE_SECONDS")
+    openai_max_retries: int = Field(4, env="OPENAI_MAX_RETRIES")
+
+    # Response cache for repeated questions (in-memory LRU, optional shared Redis tier)
+    response_cache_enabled: bool = Field(True, env="RESPONSE_CACHE_ENABLED")
+    response_cache_max_entries: int = Field(1000, env="RESPONSE_CACHE_MAX_ENTRIES")
+    response_cache_ttl_seconds: float = Field(3600, env="RESPONSE_CACHE_TTL_SECONDS")
+    response_cache_redis_url: str = Field("", env="RESPONSE_CACHE_REDIS_URL")
+    # Identical concurrent chat requests share one Azure OpenAI call
+    single_flight_enabled: bool = Field(True, env="SINGLE_FLIGHT_ENABLED")
+
+    # Full citation text of recent compact-format answers, served by /api/citations
+    citation_store_max_entries: int = Field(5000, env="CITATION_STORE_MAX_ENTRIES")
+    # Server-side chat sessions: per-process LRU with an idle TTL, or Redis shared by all workers
+    session_store_max_entries: int = Field(10000, env="SESSION_STORE_MAX_ENTRIES")
+    session_ttl_seconds: float = Field(3600, env="SESSION_TTL_SECONDS")
+    session_max_messages: int = Field(100, env="SESSION_MAX_MESSAGES")
+    session_redis_url: str = Field("", env="SESSION_REDIS_URL")
+    # Brotli (if the brotli package is installed) or gzip for responses of at least this size
+    response_compression_enabled: bool = Field(True, env="RESPONSE_COMPRESSION_ENABLED")
+    response_compression_min_bytes: int = Field(1000, env="RESPONSE_COMPRESSION_MIN_BYTES")
+    # Entra ID tokens are refreshed in the background this long before they expire
+    # (more than the Azure SDK's own 5-minute window, so SDK refreshes hit the cache)
+    token_refresh_margin_seconds: float = Field(600.0, env="TOKEN_REFRESH_MARGIN_SECONDS")
+    token_refresh_retry_seconds: float = Field(30.0, env="TOKEN_REFRESH_RETRY_SECONDS")
+    # End-to-end deadline of a chat request (0 disables it): retrieval may use up to
+    # its own cap, generation the rest, minus the reserve for queueing the evaluation log
+    request_deadline_seconds: float = Field(90.0, env="REQUEST_DEADLINE_SECONDS")
+    request_deadline_retrieval_seconds: float = Field(15.0, env="REQUEST_DEADLINE_RETRIEVAL_SECONDS")
+    request_deadline_logging_seconds: float = Field(1.0, env="REQUEST_DEADLINE_LOGGING_SECONDS")
+    # Acquire tokens and open connections in the background at startup; /api/health
+    # reports ready once that has finished or timed out
+    startup_warmup_enabled: bool = Field(True, env="STARTUP_WARMUP_ENABLED")
+    startup_warmup_timeout_seconds: float = Field(30.0, env="STARTUP_WARMUP_TIMEOUT_SECONDS")
+    # Send per-stage timings to the browser in a Server-Timing header (/metrics is always on)
+    server_timing_enabled: bool = Field(True, env="SERVER_TIMING_ENABLED")
     
     class Config:
         env_file = ".env"
@@ -66,10 +179,16 @@ class AppSettings(BaseSettings):
     @property
     def openai(self) -> OpenAISettings:
         """Return OpenAI settings in the format used by the application"""
+        primary = OpenAIBackendSettings(
+            endpoint=self.azure_openai_endpoint,
+            gpt_deployment=self.azure_openai_gpt_deployment,
+            name="primary",
+        )
         return OpenAISettings(
             endpoint=self.azure_openai_endpoint,
             gpt_deployment=self.azure_openai_gpt_deployment,
-            embedding_deployment=self.azure_openai_embedding_deployment
+            embedding_deployment=self.azure_openai_embedding_deployment,
+            backends=[primary] + list(self.azure_openai_backends),
         )
     
     @property
@@ -0,0 +1,35 @@
+"""
+FastAPI dependencies that hand out the application-scoped resources
+
+Endpoints declare what they need (for example
+`rag_chat_service: RagChatService = Depends(get_rag_chat_service)`) instead of
+constructing clients themselves.
+"""
+from fastapi import Request
+
+from app.services.citation_store import CitationStore
+from app.services.rag_chat_service import RagChatService
+from app.services.resources import AppResources
+from app.services.session_store import SessionStore
+from app.services.telemetry_writer import TelemetryWriter
+
+
+def get_resources(request: Request) -> AppResources:
+    """Return the resource registry created in the application lifespan"""
+    return request.app.state.resources
+
+
+def get_rag_chat_service(request: Request) -> RagChatService:
+    return get_resources(request).rag_chat_service
+
+
+def get_telemetry_writer(request: Request) -> TelemetryWriter:
+    return get_resources(request).telemetry_writer
+
+
+def get_citation_store(request: Request) -> CitationStore:
+    return get_resources(request).citation_store
+
+
+def get_session_store(request: Request) -> SessionStore:
+    return get_resources(request).session_store
@@ -9,7 +9,7 @@ This module defines Pydantic models that:
 
 The models focus on the core message structures needed for the chat interface.
 """
-from typing import List
+from typing import List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -27,4 +27,14 @@ class ChatMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     """Chat completion request model for the API endpoint"""
-    messages: List[ChatMessage] = Field(..., description="List of chat messages")
+    messages: List[ChatMessage] = Field(
+        ..., description="List of chat messages; with a session_id, only the messages new since the last answer"
+    )
+    session_id: Optional[str] = Field(
+        None, description="Server-side session from POST /api/sessions that holds the earlier messages"
+    )
+    format: Literal["full", "compact"] = Field(
+        "full",
+        description="'compact' returns the answer with citation stubs; citation text is fetched "
+        "from /api/citations/{response_id}/{n}",
+    )
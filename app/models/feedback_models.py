@@ -11,4 +11,5 @@ class FeedbackRequest(BaseModel):
     answer: str = Field(..., description="App's answer")
     feedback: Literal['thumb_up', 'thumb_down'] = Field(..., description="User feedback: 'thumb_up' or 'thumb_down'")
     grounded_answer: Optional[str] = Field("", description="User-provided correct answer if original answer was incorrect")
+    failed_reason: Optional[str] = Field("", description="Why the original answer was rated thumb_down")
     timestamp: datetime = Field(..., description="Timestamp of feedback (ISO format)")
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Latency- and error-aware routing across Azure OpenAI deployments
+
+With several regional deployments of the same model, `BackendRouter` picks
+one per request by power of two choices: it samples two healthy backends
+(weighted by their configured `weight`) and takes the one with the lower
+expected cost, `EWMA latency x (in-flight + 1) / weight`. Slow or busy
+backends get less traffic; a backend nobody has measured yet looks fast, so
+every backend is tried early.
+
+Each backend has a circuit breaker. After `failure_threshold` consecutive
+backend faults (throttling, timeouts, 5xx, connection errors) it is taken out
+of rotation for `cooldown_seconds`. Then a single probe request is let
+through: success closes the breaker, failure reopens it, and a probe that is
+cancelled before it has an outcome reopens it with the cooldown already over,
+so the next request probes again. If every backend is open, the one whose
+cooldown ends first is used rather than failing outright.
+
+Errors caused by the request itself (e.g. 400 content filter) are neither
+counted against the backend nor as a success: they do not reset the failure
+streak or feed the latency average. The one exception is a half-open probe
+answered with a client error, which shows the backend is reachable again.
+"""
+import logging
+import random
+import time
+from typing import List, Optional
+
+import openai
+
+from app.services.throttling import ThrottledError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_backend_fault(error: Exception) -> bool:
+    """True if the error says the backend is unhealthy rather than the request is invalid"""
+    if isinstance(error, (ThrottledError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class Backend:
+    """One Azure OpenAI endpoint/deployment and its health"""
+
+    def __init__(self, name: str, endpoint: str, deployment: str, weight: float, client):
+        self.name = name
+        self.endpoint = endpoint
+        self.deployment = deployment
+        self.weight = weight
+        self.client = client
+        self.ewma_latency: Optional[float] = None
+        self.in_flight = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def cost(self) -> float:
+        # Untried backends look fast, so each one gets sampled early
+        latency = self.ewma_latency if self.ewma_latency is not None else 0.0
+        return (latency + 0.001) * (self.in_flight + 1) / self.weight
+
+
+class BackendRouter:
+    """Power-of-two-choices balancer with a circuit breaker per backend"""
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        ewma_alpha: float = 0.3,
+    ):
+        if not backends:
+            raise ValueError("At least one Azure OpenAI backend is required")
+        self.backends = backends
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.ewma_alpha = ewma_alpha
+
+    @property
+    def primary(self) -> Backend:
+        return self.backends[0]
+
+    def _available(self, backend: Backend, now: float) -> bool:
+        if backend.state == CLOSED:
+            return True
+        if backend.state == OPEN and now >= backend.open_until:
+            return True
+        # Half-open: only one probe at a time
+        return False
+
+    def pick(self, exclude: Optional[List[Backend]] = None) -> Backend:
+        """Choose a backend for one request; call `release` when the request ends"""
+        now = time.monotonic()
+        exclude = exclude or []
+        candidates = [b for b in self.backends if b not in exclude and self._available(b, now)]
+        if not candidates:
+            # Everything is open: fail over to whichever recovers first rather than refusing
+            remaining = [b for b in self.backends if b not in exclude] or self.backends
+            chosen = min(remaining, key=lambda b: b.open_until)
+        elif len(candidates) == 1:
+            chosen = candidates[0]
+        else:
+            first, second = self._sample_two(candidates)
+            chosen = first if first.cost() <= second.cost() else second
+
+        if chosen.state == OPEN:
+            chosen.state = HALF_OPEN
+        chosen.in_flight += 1
+        chosen.requests += 1
+        return chosen
+
+    @staticmethod
+    def _sample_two(candidates: List[Backend]):
+        first = random.choices(candidates, weights=[b.weight for b in candidates])[0]
+        rest = [b for b in candidates if b is not first]
+        second = random.choices(rest, weights=[b.weight for b in rest])[0]
+        return first, second
+
+    def release(self, backend: Backend, latency: Optional[float] = None, error: Optional[Exception] = None):
+        """Record the outcome of a request sent to `backend`"""
+        backend.in_flight -= 1
+        if error is not None and not is_backend_fault(error):
+            self._release_client_error(backend, error)
+            return
+        if error is not None:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.state == HALF_OPEN or backend.consecutive_failures >= self.failure_threshold:
+                if backend.state != OPEN:
+                    logger.warning(f"Azure OpenAI backend {backend.name} is unhealthy; cooling down for {self.cooldown_seconds:.0f}s")
+                backend.state = OPEN
+                backend.open_until = time.monotonic() + self.cooldown_seconds
+            return
+        if backend.state == HALF_OPEN:
+            logger.info(f"Azure OpenAI backend {backend.name} recovered")
+        backend.state = CLOSED
+        backend.consecutive_failures = 0
+        if latency is not None:
+            if backend.ewma_latency is None:
+                backend.ewma_latency = latency
+            else:
+                backend.ewma_latency += self.ewma_alpha * (latency - backend.ewma_latency)
+
+    def _release_client_error(self, backend: Backend, error: Exception):
+        """The request failed for a reason of its own: the backend's health is unchanged"""
+        if backend.state != HALF_OPEN:
+            return
+        if isinstance(error, openai.APIStatusError):
+            # The probe got an HTTP answer, so the backend is reachable and serving again
+            logger.info(f"Azure OpenAI backend {backend.name} recovered")
+            backend.state = CLOSED
+            backend.consecutive_failures = 0
+        else:
+            # No answer from the backend either way: probe again with the next request
+            self._cancel_probe(backend)
+
+    def _cancel_probe(self, backend: Backend):
+        """A half-open probe ended without an outcome: let the next request probe instead"""
+        if backend.state == HALF_OPEN:
+            backend.state = OPEN
+            backend.open_until = time.monotonic()
+
+    def abandon(self, backend: Backend):
+        """
+        The request to `backend` was cancelled by the caller: free its slot
+
+        A cancellation says nothing about the backend's health, so it is not
+        counted; if the request was the half-open probe, the backend would
+        otherwise stay half-open (and out of rotation) forever.
+        """
+        backend.in_flight -= 1
+        self._cancel_probe(backend)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            backend.name: {
+                "deployment": backend.deployment,
+                "weight": backend.weight,
+                "state": backend.state,
+                "cooldown_remaining_s": round(max(0.0, backend.open_until - now), 1) if backend.state == OPEN else 0,
+                "ewma_latency_ms": round(backend.ewma_latency * 1000, 1) if backend.ewma_latency is not None else None,
+                "in_flight": backend.in_flight,
+                "requests": backend.requests,
+                "failures": backend.failures,
+                "throttling": backend.client.stats() if hasattr(backend.client, "stats") else None,
+            }
+            for backend in self.backends
+        }
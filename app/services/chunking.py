@@ -0,0 +1,126 @@
+"""
+Markdown chunking for retrieval indexes
+
+Documents are split on headings and then packed into chunks of at most
+`max_tokens` tokens, so each chunk stays on one topic and fits comfortably in
+the grounding prompt. The chunker reads lines one at a time and yields chunks
+as soon as they are complete; a large document is never held in memory as a
+whole.
+
+Chunk IDs are `<filepath>#<section>-<n>`: the heading path of the chunk's
+section and its ordinal within that section. Editing one section leaves the
+IDs (and so the unchanged content hashes) of every other section alone, so
+incremental ingestion only re-embeds the chunks of the section that changed.
+
+Every chunk carries the document title and its heading path, and converts to
+the same citation shape that Azure OpenAI "On Your Data" returns (`title`,
+`content`, `filepath`, `url`, `chunk_id`), so the frontend renders local and
+Azure AI Search citations the same way.
+"""
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.services.history_packer import count_tokens
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens used for lexical scoring and hashing embeddings"""
+    return WORD_PATTERN.findall(text.casefold())
+
+
+class Chunk:
+    """One retrievable piece of a document"""
+
+    def __init__(self, chunk_id: str, title: str, content: str, filepath: str, url: str = ""):
+        self.chunk_id = chunk_id
+        self.title = title
+        self.content = content
+        self.filepath = filepath
+        self.url = url
+
+    def to_citation(self) -> dict:
+        return {
+            "title": self.title,
+            "content": self.content,
+            "filepath": self.filepath,
+            "url": self.url,
+            "chunk_id": self.chunk_id,
+        }
+
+    @classmethod
+    def from_citation(cls, citation: dict) -> "Chunk":
+        return cls(
+            citation["chunk_id"],
+            citation.get("title", ""),
+            citation.get("content", ""),
+            citation.get("filepath", ""),
+            citation.get("url", ""),
+        )
+
+
+def chunk_markdown(
+    lines: Iterable[str],
+    filepath: str,
+    max_tokens: int = 400,
+    url: str = "",
+) -> Iterator[Chunk]:
+    """
+    Split a markdown document into chunks
+
+    Args:
+        lines: The document, line by line (e.g. an open file)
+        filepath: Name recorded in the citations; also the fallback title
+        max_tokens: Upper bound for the body of one chunk. A single line longer
+            than this becomes a chunk of its own.
+        url: Optional link recorded in the citations
+    """
+    title: Optional[str] = None
+    headings: List[str] = []
+    body: List[str] = []
+    body_tokens = 0
+    # Chunks emitted so far per section, for IDs that do not shift when another section changes
+    ordinals: Dict[str, int] = {}
+
+    def emit() -> Optional[Chunk]:
+        text = "\n".join(body).strip()
+        if not text:
+            return None
+        # Prefix the heading path so a chunk is understandable on its own
+        path = " > ".join(headings[1:] if title and headings and headings[0] == title else headings)
+        content = f"{path}\n\n{text}" if path else text
+        section = "-".join(tokenize(" ".join(headings)))
+        ordinal = ordinals.get(section, 0)
+        ordinals[section] = ordinal + 1
+        chunk_id = f"{filepath}#{section}-{ordinal}" if section else f"{filepath}#{ordinal}"
+        return Chunk(chunk_id, title or os.path.splitext(os.path.basename(filepath))[0], content, filepath, url)
+
+    for raw_line in lines:
+        line = raw_line.rstrip("\n")
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            chunk = emit()
+            if chunk:
+                yield chunk
+            body, body_tokens = [], 0
+            level, text = len(heading.group(1)), heading.group(2)
+            if level == 1 and title is None:
+                title = text
+            headings = headings[:level - 1] + [text]
+            continue
+
+        line_tokens = count_tokens(line) + 1
+        if body and body_tokens + line_tokens > max_tokens:
+            chunk = emit()
+            if chunk:
+                yield chunk
+            body, body_tokens = [], 0
+        body.append(line)
+        body_tokens += line_tokens
+
+    chunk = emit()
+    if chunk:
+        yield chunk
@@ -0,0 +1,60 @@
+"""
+Server-side citation text for compact chat responses
+
+A grounded answer usually cites several documents, and each citation carries
+the full text of its chunk. Most of them are never opened, so with the
+compact response format the client only receives stubs (number, title,
+file path, URL) and fetches the text of a citation when the user clicks it
+(`GET /api/citations/{response_id}/{n}`).
+
+The full citations of recent answers are kept in a per-process LRU keyed by
+response_id. When an answer has been evicted, or the request lands on another
+worker, the citations are read back from the answer's evaluation record,
+which is looked up only in the hour encoded in the response_id; ids without
+one get a 404 rather than a scan of the evaluation log.
+"""
+import logging
+from typing import List, Optional
+
+from app.services.response_cache import MemoryCacheTier
+
+logger = logging.getLogger(__name__)
+
+
+def citation_stub(citation: dict, number: int) -> dict:
+    """What the compact format sends for a citation: everything but the text"""
+    return {
+        "id": number,
+        "title": citation.get("title") or "",
+        "filePath": citation.get("filepath") or citation.get("filePath") or "",
+        "url": citation.get("url") or "",
+    }
+
+
+def citation_detail(citation: dict, number: int) -> dict:
+    """A full citation in the shape the chat UI displays"""
+    return {**citation_stub(citation, number), "content": citation.get("content") or ""}
+
+
+class CitationStore:
+    """LRU of the full citations of recent answers, keyed by response_id"""
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 3600):
+        self._entries = MemoryCacheTier(max_entries, ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+
+    async def put(self, response_id: str, citations: List[dict]) -> None:
+        if citations:
+            await self._entries.set(response_id, {"citations": citations})
+
+    async def get(self, response_id: str) -> Optional[List[dict]]:
+        entry = await self._entries.get(response_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["citations"]
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
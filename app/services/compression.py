@@ -0,0 +1,153 @@
+"""
+Response compression (brotli or gzip)
+
+`CompressionMiddleware` compresses response bodies for clients that send a
+matching `Accept-Encoding`. Brotli is preferred when the optional `brotli`
+package is installed; otherwise gzip is used. JSON answers with citations
+and the static JavaScript and CSS compress several times over.
+
+Bodies smaller than `minimum_size`, bodies that are already encoded, partial
+content (206: its byte ranges refer to the uncompressed body) and
+Server-Sent Events are passed through unchanged: SSE events are small, and
+holding them in a compressor would delay them. `Accept-Encoding` is added to
+the response's own `Vary` header rather than sent as a second one.
+"""
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+SKIPPED_CONTENT_TYPES = (b"text/event-stream", b"image/", b"font/woff", b"application/zip")
+
+
+def merge_vary(headers: list, field: bytes = b"Accept-Encoding") -> list:
+    """`headers` with `field` added to its Vary header, or a Vary header added"""
+    merged, found = [], False
+    for name, value in headers:
+        if name == b"vary":
+            found = True
+            listed = [part.strip().lower() for part in value.split(b",")]
+            if b"*" not in listed and field.lower() not in listed:
+                value = value + b", " + field
+        merged.append((name, value))
+    if not found:
+        merged.append((b"vary", field))
+    return merged
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31: gzip container
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported encoding the client accepts ("br", "gzip" or None)"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """ASGI middleware that brotli- or gzip-compresses responses"""
+
+    def __init__(self, app, minimum_size: int = 1000, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers", []))
+                content_type = headers.get(b"content-type", b"")
+                if (
+                    b"content-encoding" in headers
+                    or message.get("status") == 206
+                    or any(content_type.startswith(t) for t in SKIPPED_CONTENT_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Wait for the first body chunk to decide
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = [
+                    (name, value) for name, value in start.get("headers", [])
+                    if name not in (b"content-length", b"etag")
+                ]
+                headers.append((b"content-encoding", encoding.encode("ascii")))
+                headers = merge_vary(headers)
+                if not more_body:
+                    body = compressor.finish(body)
+                    headers.append((b"content-length", str(len(body)).encode("ascii")))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send({**start, "headers": headers})
+
+            chunk = compressor.compress(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,173 @@
+"""
+Per-request deadlines and client disconnects
+
+Under load, requests nobody is waiting for any more are the most expensive
+kind: they hold an Azure OpenAI concurrency slot and use quota, and their
+answer is thrown away. Two things stop them early.
+
+**Deadline budget.** Each chat request gets an end-to-end budget
+(`REQUEST_DEADLINE_SECONDS`), split across its stages:
+
+- retrieval: at most `REQUEST_DEADLINE_RETRIEVAL_SECONDS`
+- llm (generation, including rate-limit queueing): whatever is left, minus
+  the logging reserve
+- telemetry: the reserved `REQUEST_DEADLINE_LOGGING_SECONDS`
+
+A stage that runs out raises `DeadlineExceeded`; the endpoints turn it into
+a 504 (or an SSE `error` event) instead of letting the request hang.
+
+**Client disconnects.** `run_for_client` runs the answer as a task and
+cancels it when the client closes the connection, which closes the HTTP
+connection to Azure OpenAI so the service stops generating. Streams are
+cancelled by Starlette when the client disconnects.
+
+Both are counted in `/metrics` (`rag_deadline_exceeded_total`,
+`rag_client_disconnects_total`).
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Optional
+
+from app.services.metrics import REGISTRY, current_timer
+
+
+class DeadlineExceeded(Exception):
+    """A stage of the request ran out of its share of the deadline budget"""
+
+    def __init__(self, stage: str, budget: Optional[float]):
+        self.stage = stage
+        super().__init__(f"Request deadline exceeded during {stage} ({budget or 0:.1f}s left for it)")
+
+
+class ClientDisconnected(Exception):
+    """The client closed the connection before the answer was ready"""
+
+
+class RequestBudget:
+    """The time left for each stage of one request"""
+
+    def __init__(self, total_seconds: float, retrieval_seconds: float, logging_seconds: float):
+        self.started = time.monotonic()
+        self.total = total_seconds
+        self.retrieval = retrieval_seconds
+        self.logging = logging_seconds
+
+    def remaining(self) -> float:
+        return self.total - (time.monotonic() - self.started)
+
+    def timeout_for(self, stage: str) -> float:
+        """Seconds `stage` may still take"""
+        if stage == "telemetry":
+            return self.logging
+        # Everything before logging leaves the logging reserve untouched
+        left = max(0.0, self.remaining() - self.logging)
+        if stage == "retrieval":
+            return min(self.retrieval, left)
+        return left
+
+
+_current_budget: ContextVar[Optional[RequestBudget]] = ContextVar("request_budget", default=None)
+
+
+def start_budget(total_seconds: float, retrieval_seconds: float, logging_seconds: float) -> Optional[RequestBudget]:
+    """Start the deadline budget of the current request (a total of 0 disables it)"""
+    budget = RequestBudget(total_seconds, retrieval_seconds, logging_seconds) if total_seconds > 0 else None
+    _current_budget.set(budget)
+    return budget
+
+
+def current_budget() -> Optional[RequestBudget]:
+    return _current_budget.get()
+
+
+def stage_timeout(stage: str) -> Optional[float]:
+    """Seconds `stage` may take in the current request, or None without a budget"""
+    budget = _current_budget.get()
+    return budget.timeout_for(stage) if budget else None
+
+
+def _endpoint() -> str:
+    timer = current_timer()
+    return timer.endpoint if timer else "background"
+
+
+def count_deadline_exceeded(error: DeadlineExceeded):
+    REGISTRY.inc(
+        "rag_deadline_exceeded_total",
+        "Requests that ran out of their deadline budget, by stage",
+        {"endpoint": _endpoint(), "stage": error.stage},
+    )
+
+
+def count_disconnect():
+    REGISTRY.inc(
+        "rag_client_disconnects_total",
+        "Requests abandoned by the client before the answer was complete",
+        {"endpoint": _endpoint()},
+    )
+
+
+async def within(stage: str, awaitable: Awaitable[Any]) -> Any:
+    """Await `awaitable` within the stage's share of the request deadline"""
+    timeout = stage_timeout(stage)
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage, timeout) from None
+
+
+async def iterate_within(stage: str, events: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """Iterate `events`, giving up when the stage's share of the deadline is used up"""
+    iterator = events.__aiter__()
+    try:
+        while True:
+            timeout = stage_timeout(stage)
+            try:
+                event = await asyncio.wait_for(iterator.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(stage, timeout) from None
+            yield event
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+async def _wait_for_disconnect(receive):
+    # The request body has been read, so the next message is the disconnect
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+def _consume_result(task: asyncio.Task):
+    # A cancelled task may still end with an error; nobody is waiting for it
+    if not task.cancelled():
+        task.exception()
+
+
+async def run_for_client(request, awaitable: Awaitable[Any], stage: Optional[str] = "llm") -> Any:
+    """
+    Await `awaitable` unless the client disconnects or `stage` runs out of time first
+
+    The work is cancelled in both cases, and `ClientDisconnected` or
+    `DeadlineExceeded` is raised.
+    """
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request.receive))
+    timeout = stage_timeout(stage) if stage else None
+    try:
+        done, _ = await asyncio.wait({work, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
+            work.add_done_callback(_consume_result)
+    if work in done:
+        return work.result()
+    if watcher in done:
+        raise ClientDisconnected()
+    raise DeadlineExceeded(stage, timeout)
@@ -0,0 +1,298 @@
+"""
+Persistent embedding cache shared by all worker processes
+
+Most questions are repeats, and re-ingesting a corpus re-embeds mostly
+identical chunks. `CachedEmbedder` wraps an embedder and only sends texts it
+has not embedded before; vectors are keyed by (model, normalized text hash).
+
+Storage is a directory of generations. Each generation is an append-only pair
+of files:
+
+- `gen-<n>.f32`: float32 vectors, one row per entry, read through `numpy.memmap`
+- `gen-<n>.idx`: fixed-size (16-byte key digest, row) entries
+
+Writers append under an exclusive `fcntl` lock, vectors first and index
+entries second, so readers never see an index entry for a vector that is not
+written yet. Readers need no lock: they tail the index file for new entries.
+Lookups and writes do file I/O, so `CachedEmbedder` runs them in worker
+threads; within a process they are serialized by a thread lock.
+
+Eviction is generational. When the current generation holds `max_entries`
+rows, a new generation starts and the one before the previous is deleted.
+Hits in the previous generation are copied forward, so frequently used
+entries survive and the cache never exceeds two generations.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.services.embeddings import Embedder
+
+try:
+    import fcntl
+except ImportError:  # Windows: the cache still works, but only within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_ENTRY = struct.Struct("<16sI")
+GENERATION_FILE = "generation"
+META_FILE = "meta.json"
+
+
+def embedding_cache_key(model: str, text: str) -> bytes:
+    """16-byte digest of the model and the whitespace-collapsed, case-folded text"""
+    normalized = " ".join(text.split()).casefold()
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).digest()[:16]
+
+
+class _Generation:
+    """One append-only vector file and its index, as seen by this process"""
+
+    def __init__(self, directory: str, number: int, dimensions: int):
+        self.number = number
+        self.dimensions = dimensions
+        self.row_bytes = dimensions * 4
+        self.vectors_path = os.path.join(directory, f"gen-{number}.f32")
+        self.index_path = os.path.join(directory, f"gen-{number}.idx")
+        self.rows: Dict[bytes, int] = {}
+        self._index_file = None
+        self._partial = b""
+        self._vectors: Optional[np.memmap] = None
+
+    def refresh(self):
+        """Read index entries appended since the last refresh"""
+        if self._index_file is None:
+            if not os.path.exists(self.index_path):
+                return
+            self._index_file = open(self.index_path, "rb")
+        data = self._partial + self._index_file.read()
+        complete = len(data) - len(data) % INDEX_ENTRY.size
+        for key, row in INDEX_ENTRY.iter_unpack(data[:complete]):
+            self.rows[key] = row
+        self._partial = data[complete:]
+
+    def vector(self, row: int) -> np.ndarray:
+        if self._vectors is None or row >= len(self._vectors):
+            # The file grew since it was mapped
+            count = os.path.getsize(self.vectors_path) // self.row_bytes
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dimensions))
+        return np.array(self._vectors[row])
+
+    def row_count(self) -> int:
+        try:
+            return os.path.getsize(self.vectors_path) // self.row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def append(self, keys: List[bytes], vectors: np.ndarray):
+        """Append entries; the caller holds the write lock"""
+        first_row = self.row_count()
+        with open(self.vectors_path, "ab") as f:
+            # Drop a torn row left by a crashed writer, so rows stay aligned
+            f.truncate(first_row * self.row_bytes)
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.index_path, "ab") as f:
+            f.write(b"".join(INDEX_ENTRY.pack(key, first_row + i) for i, key in enumerate(keys)))
+
+    def close(self):
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+        self._vectors = None
+
+    def delete_files(self):
+        for path in (self.vectors_path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class EmbeddingCache:
+    """Memory-mapped, multi-process embedding store with generational eviction"""
+
+    def __init__(self, directory: str, max_entries: int = 100000):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, "lock")
+        self.dimensions: Optional[int] = None
+        self._generation_stamp = None
+        self._current: Optional[_Generation] = None
+        self._previous: Optional[_Generation] = None
+        # The per-process view of the files (index offsets, mapped vectors) is shared by all threads
+        self._thread_lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.promotions = 0
+        self.rotations = 0
+
+    @contextmanager
+    def _write_lock(self):
+        with open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_generation(self) -> int:
+        try:
+            with open(os.path.join(self.directory, GENERATION_FILE), encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _sync(self):
+        """Pick up a new generation or new dimensions written by any process"""
+        if self.dimensions is None:
+            meta_path = os.path.join(self.directory, META_FILE)
+            if not os.path.exists(meta_path):
+                return
+            with open(meta_path, encoding="utf-8") as f:
+                self.dimensions = json.load(f)["dimensions"]
+        try:
+            stat = os.stat(os.path.join(self.directory, GENERATION_FILE))
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if self._current is None or stamp != self._generation_stamp:
+            self._generation_stamp = stamp
+            number = self._read_generation()
+            if self._current is None or self._current.number != number:
+                for generation in (self._current, self._previous):
+                    if generation is not None:
+                        generation.close()
+                self._current = _Generation(self.directory, number, self.dimensions)
+                self._previous = _Generation(self.directory, number - 1, self.dimensions) if number > 0 else None
+        self._current.refresh()
+        if self._previous is not None:
+            self._previous.refresh()
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Return the cached vector for each key, or None"""
+        with self._thread_lock:
+            return self._get_many(keys)
+
+    def _get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        self._sync()
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        promote_keys, promote_vectors = [], []
+        for i, key in enumerate(keys):
+            if self._current is None:
+                break
+            row = self._current.rows.get(key)
+            if row is not None:
+                results[i] = self._current.vector(row)
+                continue
+            if self._previous is not None:
+                row = self._previous.rows.get(key)
+                if row is not None:
+                    try:
+                        results[i] = self._previous.vector(row)
+                    except FileNotFoundError:
+                        # Evicted by another process in the meantime
+                        continue
+                    promote_keys.append(key)
+                    promote_vectors.append(results[i])
+        found = sum(1 for vector in results if vector is not None)
+        self.hits += found
+        self.misses += len(keys) - found
+        if promote_keys:
+            # Keep entries that are still in use when their generation is evicted
+            self.promotions += len(promote_keys)
+            self.put_many(promote_keys, np.stack(promote_vectors))
+        return results
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        """Store vectors (one row per key)"""
+        if not keys:
+            return
+        with self._thread_lock, self._write_lock():
+            if self.dimensions is None:
+                self._sync()
+            if self.dimensions is None:
+                meta_path = os.path.join(self.directory, META_FILE)
+                with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump({"dimensions": int(vectors.shape[1])}, f)
+                os.replace(f"{meta_path}.tmp", meta_path)
+                self.dimensions = int(vectors.shape[1])
+            if vectors.shape[1] != self.dimensions:
+                logger.warning(f"Not caching {vectors.shape[1]}-dimension embeddings in a {self.dimensions}-dimension cache")
+                return
+            self._sync()
+            if self._current.row_count() + len(keys) > self.max_entries:
+                self._rotate()
+            self._current.append(keys, vectors)
+            self.writes += len(keys)
+
+    def _rotate(self):
+        """Start a new generation and delete the oldest one; the caller holds the write lock"""
+        number = self._current.number + 1
+        if self._previous is not None:
+            self._previous.close()
+            self._previous.delete_files()
+        path = os.path.join(self.directory, GENERATION_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(str(number))
+        os.replace(f"{path}.tmp", path)
+        self.rotations += 1
+        self._generation_stamp = None
+        self._sync()
+
+    def stats(self) -> dict:
+        with self._thread_lock:
+            # Rows written by any process, in the generations that are current now
+            self._sync()
+            entries = sum(generation.row_count() for generation in (self._current, self._previous) if generation)
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "writes": self.writes,
+            "promotions": self.promotions,
+            "rotations": self.rotations,
+            "entries": entries,
+        }
+
+
+class CachedEmbedder(Embedder):
+    """Embedder that serves repeated texts from an `EmbeddingCache`"""
+
+    def __init__(self, embedder: Embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.name = embedder.name
+
+    @property
+    def model(self) -> str:
+        return self.embedder.model
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        return self.embedder.dimensions
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        keys = [embedding_cache_key(self.model, text) for text in texts]
+        # The cache reads memory-mapped files and waits for a file lock: keep that off the event loop
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            fresh = await self.embedder.embed([texts[i] for i in missing])
+            await asyncio.to_thread(self.cache.put_many, [keys[i] for i in missing], fresh)
+            for i, vector in zip(missing, fresh):
+                cached[i] = vector
+        return np.stack(cached).astype(np.float32, copy=False)
@@ -0,0 +1,107 @@
+"""
+Text embedders for the local retrieval index
+
+- `HashingEmbedder` maps word and word-pair features into a fixed number of
+  dimensions with a stable hash. It needs no model and no network, so the
+  app, scripts and benchmarks can run fully offline. Quality is lexical, not
+  semantic.
+- `AzureOpenAIEmbedder` calls the Azure OpenAI embedding deployment
+  (`AZURE_OPENAI_EMBEDDING_DEPLOYMENT`).
+
+Both return L2-normalized float32 rows, so cosine similarity is a dot product.
+"""
+import zlib
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+from app.services.chunking import tokenize
+
+# Without IDF weighting, function words would dominate the hashed vectors
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or "
+    "the this to was what when where which who why will with you your".split()
+)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale every row to unit length (all-zero rows stay zero)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class Embedder(ABC):
+    """Turns texts into embedding vectors"""
+
+    name = "embedder"
+    dimensions: Optional[int] = None
+
+    @property
+    def model(self) -> str:
+        """Identifies the vectors this embedder produces (e.g. for cache keys)"""
+        return f"{self.name}-{self.dimensions}"
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Return one normalized float32 row per text"""
+
+
+class HashingEmbedder(Embedder):
+    """Offline feature-hashing embedder"""
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _embed_one(self, text: str, row: np.ndarray):
+        tokens = [t for t in tokenize(text) if t not in STOPWORDS]
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(feature.encode("utf-8"))
+            row[h % self.dimensions] += 1.0 if (h >> 31) & 1 else -1.0
+        # Sublinear term frequency, so repeated words do not swamp the rest
+        np.copyto(row, np.sign(row) * np.log1p(np.abs(row)))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            self._embed_one(text, matrix[i])
+        return normalize_rows(matrix)
+
+
+class AzureOpenAIEmbedder(Embedder):
+    """Embeddings from an Azure OpenAI embedding deployment"""
+
+    name = "azure_openai"
+
+    def __init__(self, openai_client, deployment: str, dimensions: Optional[int] = None):
+        self.openai_client = openai_client
+        self.deployment = deployment
+        self.dimensions = dimensions
+
+    @property
+    def model(self) -> str:
+        return self.deployment
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        response = await self.openai_client.embeddings.create(model=self.deployment, input=texts)
+        rows = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        matrix = normalize_rows(np.array(rows, dtype=np.float32))
+        self.dimensions = matrix.shape[1]
+        return matrix
+
+
+def build_embedder(name: str, dimensions: Optional[int] = None, openai_client=None, deployment: str = "") -> Embedder:
+    """Create the embedder an index was built with"""
+    if name == HashingEmbedder.name:
+        return HashingEmbedder(dimensions or 512)
+    if name == AzureOpenAIEmbedder.name:
+        if openai_client is None or not deployment:
+            raise ValueError("The azure_openai embedder needs an OpenAI client and an embedding deployment")
+        return AzureOpenAIEmbedder(openai_client, deployment, dimensions)
+    raise ValueError(f"Unknown embedder: {name}")
@@ -1,31 +1,80 @@
 """
 Helper for appending evaluation data to Azure Blob Storage as JSONL
+
+With a `prefix`, records go to hourly partitions written by this worker
+(`<prefix>/yyyy/mm/dd/hh-<worker_id>.jsonl`); otherwise to the single
+segmented log `blob_name`.
+
+Response ids start with the UTC hour the answer was given in
+(`2024050113-<uuid4>`), so the record of one answer can be found by reading
+only that hour's partitions (see `feedback_join.find_evaluation_record`).
 """
-import json
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
-from datetime import datetime
+import calendar
+import re
+import time
+import uuid
+from typing import Iterable, List, Optional
+
+from azure.storage.blob.aio import ContainerClient
+
+from app.services.log_writer import AppendBlobLogWriter, LogWriter, PartitionedLogWriter
+
+_RESPONSE_ID_PATTERN = re.compile(r"^(\d{10})-[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def new_response_id(now: Optional[float] = None) -> str:
+    """A response id carrying the current UTC hour"""
+    return f"{time.strftime('%Y%m%d%H', time.gmtime(now))}-{uuid.uuid4()}"
+
+
+def response_id_hour(response_id: str) -> Optional[str]:
+    """The "yyyy/mm/dd/hh" partition a response id was created in, or None for ids without one"""
+    match = _RESPONSE_ID_PATTERN.match(response_id)
+    if match is None:
+        return None
+    try:
+        created = time.strptime(match.group(1), "%Y%m%d%H")
+    except ValueError:
+        return None
+    return time.strftime("%Y/%m/%d/%H", created)
+
+
+def lookup_hours(response_id: str) -> List[str]:
+    """
+    Partitions that may hold the record of `response_id`: its hour and the next
+
+    Records are partitioned by the time they are written, and the telemetry
+    writer may flush an answer given just before the hour ends after it.
+    """
+    hour = response_id_hour(response_id)
+    if hour is None:
+        return []
+    next_hour = calendar.timegm(time.strptime(hour, "%Y/%m/%d/%H")) + 3600
+    return [hour, time.strftime("%Y/%m/%d/%H", time.gmtime(next_hour))]
+
 
 class EvaluationBlobStorage:
-    def __init__(self, account_url: str, container_name: str, blob_name: str):
-        self.account_url = account_url
-        self.container_name = container_name
+    def __init__(
+        self,
+        container_client: ContainerClient,
+        blob_name: str,
+        prefix: Optional[str] = None,
+        worker_id: str = "",
+    ):
+        # The container client is shared application-wide; the container
+        # itself is created once at startup by the resource registry
+        self.container_client = container_client
         self.blob_name = blob_name
-        self.credential = DefaultAzureCredential()
-        self.client = BlobServiceClient(account_url=self.account_url, credential=self.credential)
-        self.container_client = self.client.get_container_client(self.container_name)
-        try:
-            self.container_client.create_container()
-        except Exception:
-            pass
-
-    def append_evaluation(self, eval_dict: dict):
-        try:
-            blob_client = self.container_client.get_blob_client(self.blob_name)
-            existing = blob_client.download_blob().readall().decode('utf-8')
-        except Exception:
-            existing = ''
-        new_line = json.dumps(eval_dict, default=str) + '\n'
-        updated = existing + new_line
-        blob_client = self.container_client.get_blob_client(self.blob_name)
-        blob_client.upload_blob(updated, overwrite=True)
+        self.prefix = prefix
+        self.writer: LogWriter = (
+            PartitionedLogWriter(self.container_client, prefix, worker_id)
+            if prefix
+            else AppendBlobLogWriter(self.container_client, self.blob_name)
+        )
+
+    async def append_evaluation(self, eval_dict: dict):
+        # Single append_block call; never downloads the existing log
+        await self.writer.append(eval_dict)
+
+    async def append_evaluations(self, eval_dicts: Iterable[dict]):
+        await self.writer.append_many(eval_dicts)
@@ -0,0 +1,154 @@
+"""
+Compressed columnar files for compacted evaluation logs
+
+An evaluation record repeats the whole chat history and the full text of
+every citation, so most of a JSONL log is the same messages and documents over
+and over: turn N of a conversation carries turns 1..N-1 again, and popular
+documents are cited by many answers. A columnar file stores them once:
+
+- chat messages and citations are kept in dictionaries keyed by a content
+  hash; each row holds only the list of hashes (`history_hashes`,
+  `citation_hashes`)
+- every other field is a column: one JSON array per field
+
+The file is a deflate-compressed zip archive with one member per column plus
+`meta.json`, which holds the row count, the time range and the distinct
+intents and feedback values. Readers open `meta.json` first to skip whole
+files, then decompress only the columns a query filters on, and only load the
+remaining columns (and the dictionaries) for rows that match.
+
+Columns are plain JSON arrays, so a file can also be loaded into pandas with
+a few lines of Python.
+"""
+import hashlib
+import io
+import json
+import zipfile
+from typing import Dict, Iterable, List, Optional, Sequence
+
+FORMAT = "evaluation-columnar"
+VERSION = 1
+
+# Fields stored in dictionaries rather than columns
+HISTORY_FIELD = "user_chat_history"
+CITATIONS_FIELD = "ai_search_results"
+
+
+def content_hash(value) -> str:
+    """Stable short hash of a JSON value"""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def encode_columnar(records: Sequence[dict], partition: str = "") -> bytes:
+    """Encode evaluation records (with feedback merged, if any) as a columnar file"""
+    messages: Dict[str, dict] = {}
+    citations: Dict[str, dict] = {}
+    names: List[str] = []
+    for record in records:
+        for name in record:
+            if name not in names and name not in (HISTORY_FIELD, CITATIONS_FIELD):
+                names.append(name)
+    columns: Dict[str, list] = {name: [] for name in names}
+    columns["history_hashes"] = []
+    columns["citation_hashes"] = []
+
+    for record in records:
+        for name in names:
+            columns[name].append(record.get(name))
+        history_hashes = []
+        for message in record.get(HISTORY_FIELD) or []:
+            key = content_hash(message)
+            messages.setdefault(key, message)
+            history_hashes.append(key)
+        columns["history_hashes"].append(history_hashes)
+        citation_hashes = []
+        for citation in record.get(CITATIONS_FIELD) or []:
+            key = content_hash(citation)
+            citations.setdefault(key, citation)
+            citation_hashes.append(key)
+        columns["citation_hashes"].append(citation_hashes)
+
+    timestamps = [t for t in columns.get("timestamp", []) if t]
+    meta = {
+        "format": FORMAT,
+        "version": VERSION,
+        "partition": partition,
+        "rows": len(records),
+        "columns": list(columns),
+        "min_timestamp": min(timestamps) if timestamps else None,
+        "max_timestamp": max(timestamps) if timestamps else None,
+        "intents": sorted({str(i) for i in columns.get("detected_intent", []) if i}),
+        "feedback": sorted({str(f) for f in columns.get("feedback", []) if f}),
+        "unique_messages": len(messages),
+        "unique_citations": len(citations),
+    }
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        archive.writestr("meta.json", json.dumps(meta))
+        for name, values in columns.items():
+            archive.writestr(f"columns/{name}.json", json.dumps(values, default=str))
+        archive.writestr("dictionaries/messages.json", json.dumps(messages, default=str))
+        archive.writestr("dictionaries/citations.json", json.dumps(citations, default=str))
+    return buffer.getvalue()
+
+
+class ColumnarFile:
+    """Lazy reader for a file written by `encode_columnar`"""
+
+    def __init__(self, data: bytes):
+        self._archive = zipfile.ZipFile(io.BytesIO(data))
+        self.meta = json.loads(self._archive.read("meta.json"))
+        if self.meta.get("format") != FORMAT:
+            raise ValueError("Not an evaluation columnar file")
+        self._columns: Dict[str, list] = {}
+        self._dictionaries: Dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def column(self, name: str) -> list:
+        """Values of one column (None for every row if the column does not exist)"""
+        if name not in self._columns:
+            if name in self.meta["columns"]:
+                self._columns[name] = json.loads(self._archive.read(f"columns/{name}.json"))
+            else:
+                self._columns[name] = [None] * len(self)
+        return self._columns[name]
+
+    def _dictionary(self, name: str) -> dict:
+        if name not in self._dictionaries:
+            self._dictionaries[name] = json.loads(self._archive.read(f"dictionaries/{name}.json"))
+        return self._dictionaries[name]
+
+    def records(self, rows: Iterable[int], fields: Optional[List[str]] = None) -> Iterable[dict]:
+        """Rebuild the records at `rows`, with all fields or only `fields`"""
+        names = fields or [n for n in self.meta["columns"] if n not in ("history_hashes", "citation_hashes")] + [
+            HISTORY_FIELD,
+            CITATIONS_FIELD,
+        ]
+        for row in rows:
+            record = {}
+            for name in names:
+                if name == HISTORY_FIELD:
+                    messages = self._dictionary("messages")
+                    record[name] = [messages[key] for key in self.column("history_hashes")[row]]
+                elif name == CITATIONS_FIELD:
+                    citations = self._dictionary("citations")
+                    record[name] = [citations[key] for key in self.column("citation_hashes")[row]]
+                else:
+                    record[name] = self.column(name)[row]
+            yield record
+
+
+def columnar_blob_name(prefix: str, hour: str) -> str:
+    """Blob name of the compacted file for an hourly partition ("yyyy/mm/dd/hh")"""
+    return f"{prefix}/{hour}.zip"
+
+
+def columnar_hour(prefix: str, blob_name: str) -> Optional[str]:
+    """The partition of a compacted file, or None if `blob_name` is not one"""
+    if not blob_name.startswith(prefix + "/") or not blob_name.endswith(".zip"):
+        return None
+    return blob_name[len(prefix) + 1:-len(".zip")]
@@ -0,0 +1,210 @@
+"""
+Curated answers for frequently asked questions
+
+Many questions are asked almost word for word as they appear in the FAQ
+documents (`sample-docs/contoso-faq.md`), and the FAQ already has a curated
+answer for them. `FaqIndex` matches the user's question against the FAQ
+questions; when the best match is confident enough, `RagChatService` returns
+the curated answer, with the FAQ entry as its citation, without retrieval or
+an Azure OpenAI completion. Follow-up questions are never matched, since they
+depend on the earlier turns of the conversation.
+
+The index is built offline with `python -m scripts.build_faq_index`. It is a
+`LocalVectorIndex` directory whose chunks are the FAQ entries (`title` is the
+question, `content` the answer) and whose embeddings are of the questions.
+The confidence of a match blends two similarities between the user's
+question and a FAQ question, both between 0 and 1:
+
+- lexical: cosine of IDF-weighted word sets, so words the FAQ questions share
+  ("contoso", "products") count for less than distinctive ones ("warranty"),
+  and words that appear in no FAQ question count against the match
+- embedding: cosine of the embeddings, computed with the embedder the index
+  was built with
+"""
+import logging
+import math
+import uuid
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+
+from app.services.chunking import HEADING_PATTERN, Chunk, tokenize
+from app.services.embeddings import STOPWORDS, Embedder
+from app.services.local_index import LocalVectorIndex
+
+logger = logging.getLogger(__name__)
+
+# detected_intent of answers served from the FAQ
+FAQ_INTENT = "faq_fast_path"
+
+
+def parse_faq(lines: Iterable[str], filepath: str, url: str = "") -> Iterator[Chunk]:
+    """
+    Split a FAQ document into question/answer entries
+
+    Every heading that ends with a question mark starts an entry; its answer
+    is the text up to the next heading. Other sections are skipped.
+    """
+    question: Optional[str] = None
+    body: List[str] = []
+    index = 0
+
+    def emit() -> Optional[Chunk]:
+        nonlocal index
+        answer = "\n".join(body).strip()
+        if not question or not answer:
+            return None
+        chunk = Chunk(f"{filepath}#faq{index}", question, answer, filepath, url)
+        index += 1
+        return chunk
+
+    for raw_line in lines:
+        line = raw_line.rstrip("\n")
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            chunk = emit()
+            if chunk:
+                yield chunk
+            text = heading.group(2)
+            question = text if text.endswith("?") else None
+            body = []
+            continue
+        body.append(line)
+
+    chunk = emit()
+    if chunk:
+        yield chunk
+
+
+def _terms(text: str) -> Set[str]:
+    # Single letters are mostly split-off possessives and contractions ("contoso's")
+    return {t for t in tokenize(text) if len(t) > 1 and t not in STOPWORDS}
+
+
+class FaqMatch:
+    """The FAQ entry closest to a question"""
+
+    def __init__(self, entry: dict, confidence: float, lexical: float, semantic: Optional[float]):
+        self.entry = entry
+        self.confidence = confidence
+        self.lexical = lexical
+        # None without an embedder
+        self.semantic = semantic
+
+
+class FaqIndex:
+    """Matches questions against the FAQ entries of a `LocalVectorIndex`"""
+
+    def __init__(
+        self,
+        index: LocalVectorIndex,
+        embedder: Optional[Embedder],
+        min_confidence: float = 0.65,
+        lexical_weight: float = 0.5,
+    ):
+        """
+        Args:
+            index: FAQ index written by `scripts.build_faq_index`
+            embedder: Embeds questions like the index was built; None for lexical matching only
+            min_confidence: Matches below this are not answered from the FAQ
+            lexical_weight: Share of the lexical similarity in the confidence
+                (the rest is the embedding similarity)
+        """
+        self.index = index
+        self.embedder = embedder
+        self.min_confidence = min_confidence
+        self.lexical_weight = lexical_weight if embedder is not None else 1.0
+        self.questions = [_terms(entry["title"]) for entry in index.chunks]
+
+        document_frequency: Dict[str, int] = {}
+        for terms in self.questions:
+            for term in terms:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        count = len(self.questions)
+        self.idf = {
+            term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()
+        }
+        # Words no FAQ question uses get the weight of the rarest possible word
+        self.unknown_idf = math.log(1 + (count + 0.5) / 0.5)
+        self.question_norms = np.array(
+            [math.sqrt(sum(self.idf[t] ** 2 for t in terms)) for terms in self.questions], dtype=np.float32
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> str:
+        return self.index.version
+
+    def __len__(self):
+        return len(self.index)
+
+    def lexical_scores(self, question: str) -> np.ndarray:
+        """Weighted word-set cosine between `question` and every FAQ question"""
+        terms = _terms(question)
+        scores = np.zeros(len(self.questions), dtype=np.float32)
+        if not terms or not len(scores):
+            return scores
+        query_norm = math.sqrt(sum(self.idf.get(t, self.unknown_idf) ** 2 for t in terms))
+        for row, faq_terms in enumerate(self.questions):
+            shared = terms & faq_terms
+            if shared and self.question_norms[row]:
+                scores[row] = sum(self.idf[t] ** 2 for t in shared) / (query_norm * self.question_norms[row])
+        return scores
+
+    async def match(self, question: str) -> Optional[FaqMatch]:
+        """The best FAQ entry for `question`, or None if it is not a confident match"""
+        if not question.strip() or not len(self.questions):
+            self.misses += 1
+            return None
+        lexical = self.lexical_scores(question)
+        semantic = None
+        confidence = lexical
+        if self.embedder is not None:
+            query = (await self.embedder.embed([question]))[0]
+            # A FAQ has a few hundred entries at most, so the whole matrix is scored at once
+            semantic = np.clip(np.asarray(self.index.embeddings) @ query, 0.0, 1.0)
+            confidence = self.lexical_weight * lexical + (1 - self.lexical_weight) * semantic
+        row = int(np.argmax(confidence))
+        if confidence[row] < self.min_confidence:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return FaqMatch(
+            self.index.chunks[row],
+            float(confidence[row]),
+            float(lexical[row]),
+            None if semantic is None else float(semantic[row]),
+        )
+
+    @staticmethod
+    def response(match: FaqMatch) -> dict:
+        """The curated answer in the shape of an Azure OpenAI chat completion with its citation"""
+        entry = match.entry
+        return {
+            "id": f"faq-{uuid.uuid4()}",
+            "object": "chat.completion",
+            "model": "faq",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": f"{entry['content']} [doc1]",
+                    "context": {"citations": [dict(entry)], "intent": FAQ_INTENT},
+                },
+            }],
+            "usage": None,
+        }
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "version": self.version,
+            "min_confidence": self.min_confidence,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "directory": self.index.directory,
+        }
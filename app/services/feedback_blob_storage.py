@@ -1,34 +1,97 @@
 """
 Helper for appending feedback to Azure Blob Storage as JSONL
+
+Besides the append-only feedback log, the latest feedback for each answer is
+kept in a small blob of its own (`feedback/<response_id>.json` next to
+`feedback.jsonl`), so reading the feedback of one answer costs one download
+instead of a scan of the whole log.
 """
+import asyncio
 import json
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
+import logging
+import posixpath
+from typing import Dict, Iterable, List, Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob.aio import ContainerClient
+
+from app.services.evaluation_blob_storage import response_id_hour
+from app.services.log_writer import AppendBlobLogWriter, LogWriter
+
+logger = logging.getLogger(__name__)
+
+
+def latest_feedback_blob_name(feedback_blob: str, response_id: str) -> str:
+    """Blob holding the latest feedback event for one answer"""
+    return f"{posixpath.splitext(feedback_blob)[0]}/{response_id}.json"
+
+
+async def read_latest_feedback(container_client: ContainerClient, feedback_blob: str, response_id: str) -> Optional[dict]:
+    """The latest feedback event for `response_id`, or None"""
+    # Only well-formed ids have a blob, and arbitrary path input never reaches a blob name
+    if response_id_hour(response_id) is None:
+        return None
+    blob_client = container_client.get_blob_client(latest_feedback_blob_name(feedback_blob, response_id))
+    try:
+        downloader = await blob_client.download_blob()
+    except ResourceNotFoundError:
+        return None
+    return json.loads(await downloader.readall())
+
+
+class FeedbackLogWriter(LogWriter):
+    """
+    Appends feedback events to the log, then stores the latest event per answer
+
+    The log stays the source of truth (`scripts/compact_feedback.py` reads
+    it); a failed write of a per-answer blob is logged and only affects the
+    read API.
+    """
+
+    def __init__(self, container_client: ContainerClient, blob_name: str):
+        self.container_client = container_client
+        self.blob_name = blob_name
+        self.log = AppendBlobLogWriter(container_client, blob_name)
+
+    async def write_lines(self, lines: List[bytes]) -> None:
+        await self.log.write_lines(lines)
+
+    async def append(self, record: dict) -> None:
+        await self.append_many([record])
+
+    async def append_many(self, records: Iterable[dict]) -> None:
+        records = list(records)
+        await self.log.append_many(records)
+        # Events of one batch are in arrival order, so the last one per answer wins
+        latest: Dict[str, dict] = {}
+        for record in records:
+            response_id = record.get("response_id")
+            if response_id and response_id_hour(response_id) is not None:
+                latest[response_id] = record
+        results = await asyncio.gather(
+            *(self._put_latest(response_id, record) for response_id, record in latest.items()),
+            return_exceptions=True,
+        )
+        for response_id, result in zip(latest, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to store the latest feedback for {response_id}: {result}")
+
+    async def _put_latest(self, response_id: str, record: dict) -> None:
+        blob_client = self.container_client.get_blob_client(latest_feedback_blob_name(self.blob_name, response_id))
+        await blob_client.upload_blob(json.dumps(record, default=str).encode("utf-8"), overwrite=True)
+
 
 class FeedbackBlobStorage:
-    def __init__(self, account_url: str, container_name: str, blob_name: str):
-        self.account_url = account_url
-        self.container_name = container_name
+    def __init__(self, container_client: ContainerClient, blob_name: str):
+        # The container client is shared application-wide; the container
+        # itself is created once at startup by the resource registry
+        self.container_client = container_client
         self.blob_name = blob_name
-        self.credential = DefaultAzureCredential()
-        self.client = BlobServiceClient(account_url=self.account_url, credential=self.credential)
-        self.container_client = self.client.get_container_client(self.container_name)
-        # Create container if not exists
-        try:
-            self.container_client.create_container()
-        except Exception:
-            pass
-
-    def append_feedback(self, feedback_dict: dict):
-        # Download existing blob content (if any)
-        try:
-            blob_client = self.container_client.get_blob_client(self.blob_name)
-            existing = blob_client.download_blob().readall().decode('utf-8')
-        except Exception:
-            existing = ''
-        # Append new feedback as JSONL
-        new_line = json.dumps(feedback_dict, default=str) + '\n'
-        updated = existing + new_line
-        # Upload back
-        blob_client = self.container_client.get_blob_client(self.blob_name)
-        blob_client.upload_blob(updated, overwrite=True)
+        self.writer = FeedbackLogWriter(self.container_client, self.blob_name)
+
+    async def append_feedback(self, feedback_dict: dict):
+        # Append new feedback as a JSONL line to the append blob
+        await self.writer.append(feedback_dict)
+
+    async def append_feedbacks(self, feedback_dicts: Iterable[dict]):
+        await self.writer.append_many(feedback_dicts)
@@ -0,0 +1,189 @@
+"""
+Event-sourced feedback: merge feedback events into evaluation records
+
+Thumbs up/down clicks are stored only as append-only events in the feedback
+log, keyed by `response_id`, so a click costs one append no matter how large
+the evaluation log is. Feedback is joined with the evaluation records when
+they are read:
+
+- `merge_feedback` performs a hash join: the (small) feedback log is loaded
+  into a dict of the latest event per response_id, then the evaluation log
+  is streamed through it. Used by the offline compaction command.
+- `get_evaluation_with_feedback` looks up one evaluation record with its
+  latest feedback merged. Used by the read API, so it never scans the logs:
+  the record is searched only in the hour encoded in its response_id, and the
+  feedback is read from the answer's latest-feedback blob.
+"""
+import logging
+from typing import AsyncIterable, AsyncIterator, Dict, Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob.aio import ContainerClient
+
+from app.services.evaluation_blob_storage import lookup_hours
+from app.services.evaluation_columnar import ColumnarFile, columnar_blob_name, columnar_hour
+from app.services.feedback_blob_storage import read_latest_feedback
+from app.services.log_writer import iter_blob_records, iter_log_records, list_partitions
+
+logger = logging.getLogger(__name__)
+
+
+def apply_feedback(record: dict, feedback: dict) -> dict:
+    """Return a copy of an evaluation record with a feedback event merged in"""
+    merged = dict(record)
+    merged["feedback"] = feedback["feedback"]
+    merged["feedback_timestamp"] = feedback.get("timestamp")
+    # Edge case 1: Thumb up clears grounded_answer and failed_reason
+    if feedback["feedback"] == "thumb_up":
+        merged["grounded_answer"] = ""
+        merged["failed_reason"] = ""
+    # Edge case 2: Thumb down overwrites grounded_answer and failed_reason
+    elif feedback["feedback"] == "thumb_down":
+        merged["grounded_answer"] = feedback.get("grounded_answer") or ""
+        merged["failed_reason"] = feedback.get("failed_reason") or ""
+    return merged
+
+
+def _is_newer(candidate: dict, current: Optional[dict]) -> bool:
+    # Events are appended in arrival order, so ties keep the later event
+    return current is None or str(candidate.get("timestamp") or "") >= str(current.get("timestamp") or "")
+
+
+async def build_feedback_index(feedback_records: AsyncIterable[dict]) -> Dict[str, dict]:
+    """Build side of the hash join: latest feedback event per response_id"""
+    index: Dict[str, dict] = {}
+    async for event in feedback_records:
+        response_id = event.get("response_id")
+        if response_id and _is_newer(event, index.get(response_id)):
+            index[response_id] = event
+    return index
+
+
+async def merge_feedback(
+    evaluation_records: AsyncIterable[dict],
+    feedback_index: Dict[str, dict],
+) -> AsyncIterator[dict]:
+    """Probe side of the hash join: stream evaluation records with feedback merged"""
+    async for record in evaluation_records:
+        feedback = feedback_index.get(record.get("response_id"))
+        yield apply_feedback(record, feedback) if feedback else record
+
+
+async def _read_columnar(container_client: ContainerClient, blob_name: str) -> Optional[ColumnarFile]:
+    try:
+        downloader = await container_client.get_blob_client(blob_name).download_blob()
+    except ResourceNotFoundError:
+        return None
+    return ColumnarFile(await downloader.readall())
+
+
+async def _iter_hourly_records(
+    container_client: ContainerClient,
+    evaluation_prefix: Optional[str],
+    columnar_prefix: Optional[str],
+    newest_first: bool,
+) -> AsyncIterator[dict]:
+    """Records of every hour: compacted hours from their columnar file, the others from their JSONL partitions"""
+    partitions = dict(await list_partitions(container_client, evaluation_prefix)) if evaluation_prefix else {}
+    compacted = set()
+    if columnar_prefix:
+        async for blob in container_client.list_blobs(name_starts_with=columnar_prefix + "/"):
+            hour = columnar_hour(columnar_prefix, blob.name)
+            if hour:
+                compacted.add(hour)
+    for hour in sorted(set(partitions) | compacted, reverse=newest_first):
+        if hour in compacted:
+            # Holds every record of the hour, and its JSONL may have been deleted
+            columnar = await _read_columnar(container_client, columnar_blob_name(columnar_prefix, hour))
+            if columnar is not None:
+                for record in columnar.records(range(len(columnar))):
+                    yield record
+                continue
+        for blob_name in partitions.get(hour, []):
+            async for record in iter_blob_records(container_client, blob_name):
+                yield record
+
+
+async def iter_evaluation_records(
+    container_client: ContainerClient,
+    evaluation_blob: str,
+    evaluation_prefix: Optional[str] = None,
+    newest_first: bool = False,
+    columnar_prefix: Optional[str] = None,
+) -> AsyncIterator[dict]:
+    """
+    Stream the evaluation log: the hourly partitions under `evaluation_prefix`
+    and the single-blob log `evaluation_blob` written by older versions
+
+    Hours compacted by `scripts/compact_evaluations.py` are read from their
+    columnar file under `columnar_prefix` instead of their JSONL blobs, so
+    they are still included after `--delete-source`.
+    """
+    if newest_first:
+        async for record in _iter_hourly_records(container_client, evaluation_prefix, columnar_prefix, True):
+            yield record
+    async for record in iter_log_records(container_client, evaluation_blob):
+        yield record
+    if not newest_first:
+        async for record in _iter_hourly_records(container_client, evaluation_prefix, columnar_prefix, False):
+            yield record
+
+
+async def _find_in_columnar(container_client: ContainerClient, blob_name: str, response_id: str) -> Optional[dict]:
+    columnar = await _read_columnar(container_client, blob_name)
+    if columnar is None:
+        return None
+    try:
+        row = columnar.column("response_id").index(response_id)
+    except ValueError:
+        return None
+    return next(iter(columnar.records([row])))
+
+
+async def find_evaluation_record(
+    container_client: ContainerClient,
+    response_id: str,
+    evaluation_prefix: Optional[str] = None,
+    columnar_prefix: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Return the evaluation record of one answer (without feedback), or None
+
+    Only the hours that can hold the record are read (see
+    `evaluation_blob_storage.lookup_hours`): their compacted file under
+    `columnar_prefix` if there is one, then their hourly partitions. Records of response ids without an
+    hour, and records in the single-blob log, are not looked up; they can be
+    found offline with `scripts/query_evaluations.py`.
+    """
+    if not evaluation_prefix:
+        return None
+    for hour in lookup_hours(response_id):
+        if columnar_prefix:
+            record = await _find_in_columnar(container_client, columnar_blob_name(columnar_prefix, hour), response_id)
+            if record is not None:
+                return record
+        blob_names = [
+            blob.name
+            async for blob in container_client.list_blobs(name_starts_with=f"{evaluation_prefix}/{hour}-")
+            if blob.name.endswith(".jsonl")
+        ]
+        for blob_name in sorted(blob_names):
+            async for candidate in iter_blob_records(container_client, blob_name):
+                if candidate.get("response_id") == response_id:
+                    return candidate
+    return None
+
+
+async def get_evaluation_with_feedback(
+    container_client: ContainerClient,
+    feedback_blob: str,
+    response_id: str,
+    evaluation_prefix: Optional[str] = None,
+    columnar_prefix: Optional[str] = None,
+) -> Optional[dict]:
+    """Return one evaluation record with its latest feedback merged, or None"""
+    record = await find_evaluation_record(container_client, response_id, evaluation_prefix, columnar_prefix)
+    if record is None:
+        return None
+    latest = await read_latest_feedback(container_client, feedback_blob, response_id)
+    return apply_feedback(record, latest) if latest else record
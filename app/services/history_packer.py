@@ -0,0 +1,239 @@
+"""
+Token-budget-aware chat history packing
+
+A fixed "last 20 messages" cut wastes nothing on short chats but lets a few
+pasted long messages blow up prompt tokens, latency and cost. `HistoryPacker`
+instead counts tokens locally and fills a configurable budget:
+
+1. The system prompt and the latest user turn are always kept.
+2. Earlier turns are added newest-first while they fit in the budget.
+3. Optionally, the turns that did not fit are replaced by a rolling summary
+   produced by `HistorySummarizer` (off by default).
+
+Token counts use `tiktoken` when it is installed and its encoding is
+available, and fall back to a ~4 characters-per-token estimate otherwise.
+The encoding is loaded off the event loop at startup (`load_encoding_async`);
+until it is, counts on the event loop are estimates.
+Per-message counts are memoized, so re-packing a growing conversation only
+tokenizes the new turns.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fixed per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+_background_load: Optional[asyncio.Future] = None
+
+
+def load_encoding():
+    """
+    Load the tiktoken encoding, or give up and estimate token counts
+
+    Blocking: the first load in a machine downloads the encoding unless it is
+    already in `TIKTOKEN_CACHE_DIR`, so the app calls `load_encoding_async`
+    during warm-up and offline scripts call this before they count tokens.
+    A failed load is not retried.
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken unavailable ({e}); estimating tokens from text length")
+            _encoding_loaded = True
+            # Counts memoized before the encoding was available were estimates
+            count_message_tokens.cache_clear()
+    return _encoding
+
+
+async def load_encoding_async():
+    """`load_encoding` in a worker thread, off the event loop"""
+    return await asyncio.to_thread(load_encoding)
+
+
+def _get_encoding():
+    global _background_load
+    if _encoding_loaded:
+        return _encoding
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # No event loop to block
+        return load_encoding()
+    # Never make a request wait for the download: estimate until it is done
+    if _background_load is None:
+        _background_load = loop.run_in_executor(None, load_encoding)
+    return None
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in a piece of text"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+@lru_cache(maxsize=8192)
+def count_message_tokens(role: str, content: str) -> int:
+    """Tokens used by one chat message (memoized)"""
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+class PackedHistory:
+    """Result of packing: the messages to send and what was left out"""
+
+    def __init__(self, messages: List[dict], dropped: List[dict], prompt_tokens: int):
+        self.messages = messages
+        self.dropped = dropped
+        self.prompt_tokens = prompt_tokens
+
+
+class HistoryPacker:
+    """Selects the conversation turns that fit in a token budget"""
+
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+
+    def pack(self, system_prompt: str, history: List[dict], summary: Optional[str] = None) -> PackedHistory:
+        """
+        Pack the system prompt, an optional summary and as much recent history as fits
+
+        Args:
+            system_prompt: System prompt, always kept
+            history: Conversation as role/content dicts, oldest first; the last entry is the latest turn
+            summary: Optional summary of earlier turns, added after the system prompt when there is room
+        """
+        system_message = {"role": "system", "content": system_prompt}
+        used = count_message_tokens("system", system_prompt)
+
+        # The latest turn is always sent, even if it alone exceeds the budget
+        kept: List[dict] = []
+        if history:
+            latest = history[-1]
+            kept.append(latest)
+            used += count_message_tokens(latest["role"], latest["content"])
+
+        cut = len(history) - 1
+        while cut > 0:
+            msg = history[cut - 1]
+            tokens = count_message_tokens(msg["role"], msg["content"])
+            if used + tokens > self.token_budget:
+                break
+            kept.append(msg)
+            used += tokens
+            cut -= 1
+        kept.reverse()
+        dropped = history[:max(cut, 0)]
+
+        messages = [system_message]
+        if summary and dropped:
+            summary_message = {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+            summary_tokens = count_message_tokens("system", summary_message["content"])
+            if used + summary_tokens <= self.token_budget:
+                messages.append(summary_message)
+                used += summary_tokens
+        messages.extend(kept)
+        return PackedHistory(messages, dropped, used)
+
+
+def _add_turn(digest, turn: dict) -> None:
+    digest.update(turn["role"].encode("utf-8") + b"\0" + turn["content"].encode("utf-8") + b"\0")
+
+
+def _turns_key(turns: List[dict]) -> str:
+    digest = hashlib.sha256()
+    for turn in turns:
+        _add_turn(digest, turn)
+    return digest.hexdigest()
+
+
+def _prefix_keys(turns: List[dict]) -> List[str]:
+    """`_turns_key` of every prefix of `turns` (shortest first), in one pass"""
+    digest = hashlib.sha256()
+    keys = []
+    for turn in turns:
+        _add_turn(digest, turn)
+        keys.append(digest.copy().hexdigest())
+    return keys
+
+
+class HistorySummarizer:
+    """
+    Cached rolling summary of the turns that no longer fit in the budget
+
+    `get` never waits for the model: it returns the newest cached summary that
+    covers a prefix of the dropped turns and, if that summary is stale,
+    refreshes it in the background by summarizing the previous summary plus the
+    newly dropped turns.
+    """
+
+    def __init__(self, openai_client, deployment: str, max_entries: int = 1000, max_summary_tokens: int = 300):
+        self.openai_client = openai_client
+        self.deployment = deployment
+        self.max_summary_tokens = max_summary_tokens
+        self.max_entries = max_entries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._pending = set()
+        self._tasks = set()
+
+    def get(self, dropped: List[dict]) -> Optional[str]:
+        """Return the best available summary of the dropped turns"""
+        if not dropped:
+            return None
+        summary, covered = self._longest_cached_prefix(dropped)
+        if covered < len(dropped):
+            key = _turns_key(dropped)
+            if key not in self._pending:
+                self._pending.add(key)
+                task = asyncio.create_task(self._refresh(key, summary, dropped[covered:]))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return summary
+
+    def _longest_cached_prefix(self, dropped: List[dict]) -> Tuple[Optional[str], int]:
+        keys = _prefix_keys(dropped)
+        for length in range(len(keys), 0, -1):
+            key = keys[length - 1]
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                return summary, length
+        return None, 0
+
+    async def _refresh(self, key: str, previous: Optional[str], new_turns: List[dict]):
+        try:
+            transcript = "\n".join(f"{t['role']}: {t['content']}" for t in new_turns)
+            prompt = (
+                "Summarize this conversation so far in a few sentences, keeping names, "
+                "products, order numbers and open questions.\n\n"
+            )
+            if previous:
+                prompt += f"Earlier summary:\n{previous}\n\n"
+            prompt += f"Conversation:\n{transcript}"
+            response = await self.openai_client.chat.completions.create(
+                model=self.deployment,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=self.max_summary_tokens,
+            )
+            self._summaries[key] = response.choices[0].message.content or ""
+            while len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
+        except Exception as e:
+            logger.warning(f"Could not summarize chat history: {e}")
+        finally:
+            self._pending.discard(key)
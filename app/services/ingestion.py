@@ -0,0 +1,344 @@
+"""
+Document ingestion pipeline for Azure AI Search
+
+Documents flow through three bounded stages so throughput is limited by the
+services, not by the script, and memory stays flat for any corpus size:
+
+1. Files are read line by line through the markdown chunker. Chunks whose
+   content hash is already in the manifest are skipped.
+2. Changed chunks are grouped into embedding batches bounded by item count
+   and token count, and embedded with at most `embed_concurrency` requests
+   in flight.
+3. Embedded chunks are uploaded in bulk batches. Whole-batch throttling
+   (429/503) and per-document transient failures are retried with
+   exponential backoff; a batch that is too large is split.
+
+The manifest is only updated for chunks the index accepted, so an
+interrupted run resumes where it stopped. Chunks that disappeared from a
+re-ingested file are deleted from the index; they stay in the manifest as
+pending deletions until the index confirms them, so a later run finishes
+the job if this one is interrupted.
+
+Documents use the field names of Azure AI Search integrated vectorization
+(`chunk_id`, `parent_id`, `chunk`, `title`, `text_vector`), so the "On Your
+Data" configuration in `RagChatService` works unchanged.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from azure.core.exceptions import HttpResponseError
+
+from app.services.chunking import Chunk, chunk_markdown
+from app.services.embeddings import Embedder
+from app.services.history_packer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Per-document status codes worth retrying (conflicts and throttling)
+RETRYABLE_STATUS_CODES = {409, 422, 429, 503}
+
+
+def document_key(value: str) -> str:
+    """Search document keys only allow letters, digits, '_', '-' and '='"""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:32]
+
+
+def chunk_hash(chunk: Chunk, embedding_model: str) -> str:
+    """Identifies a chunk's content together with the model that embeds it"""
+    digest = hashlib.sha256()
+    for part in (embedding_model, chunk.title, chunk.content, chunk.url):
+        digest.update(part.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """
+    Content hashes of the chunks already in the index
+
+    Stored as a local JSON file: `{"chunks": {chunk_id: hash}, "files": {filepath: [chunk_id, ...]},
+    "stale": [chunk_id, ...]}`, where `stale` lists chunks still to be deleted from the index.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.chunks: Dict[str, str] = {}
+        self.files: Dict[str, List[str]] = {}
+        self.stale: List[str] = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.chunks = data.get("chunks", {})
+            self.files = data.get("files", {})
+            self.stale = data.get("stale", [])
+
+    def is_current(self, chunk_id: str, content_hash: str) -> bool:
+        return self.chunks.get(chunk_id) == content_hash
+
+    def save(self):
+        """Write the manifest atomically"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"chunks": self.chunks, "files": self.files, "stale": self.stale}, f)
+        os.replace(tmp_path, self.path)
+
+
+class IngestionStats:
+    """Counters reported at the end of a run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.files = 0
+        self.chunks = 0
+        self.skipped = 0
+        self.embedded = 0
+        self.embedded_tokens = 0
+        self.embedding_requests = 0
+        self.uploaded = 0
+        self.deleted = 0
+        self.failed = 0
+        self.upload_retries = 0
+
+    def summary(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "files": self.files,
+            "chunks": self.chunks,
+            "skipped_unchanged": self.skipped,
+            "embedded": self.embedded,
+            "embedding_requests": self.embedding_requests,
+            "uploaded": self.uploaded,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "upload_retries": self.upload_retries,
+            "seconds": round(elapsed, 2),
+            "docs_per_second": round(self.files / elapsed, 2),
+            "chunks_per_second": round(self.chunks / elapsed, 2),
+            "tokens_per_second": round(self.embedded_tokens / elapsed, 1),
+        }
+
+
+def iter_markdown_files(paths: Iterable[str]) -> Iterator[str]:
+    """Expand files and directories into markdown files, in a stable order"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".md") and name.lower() != "readme.md":
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def embedding_batches(chunks: Iterable[Chunk], max_items: int, max_tokens: int) -> Iterator[List[Chunk]]:
+    """Group chunks into batches bounded by item count and total tokens"""
+    batch: List[Chunk] = []
+    batch_tokens = 0
+    for chunk in chunks:
+        tokens = count_tokens(embedding_text(chunk))
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def embedding_text(chunk: Chunk) -> str:
+    return f"{chunk.title}\n{chunk.content}"
+
+
+class DocumentIngestor:
+    """Streams markdown files into an Azure AI Search index"""
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        search_client,
+        manifest: IngestionManifest,
+        embedding_model: str,
+        max_chunk_tokens: int = 400,
+        embed_batch_size: int = 64,
+        embed_batch_tokens: int = 32000,
+        embed_concurrency: int = 4,
+        upload_batch_size: int = 500,
+        max_retries: int = 5,
+        retry_base_delay: float = 1.0,
+    ):
+        self.embedder = embedder
+        self.search_client = search_client
+        self.manifest = manifest
+        self.embedding_model = embedding_model
+        self.max_chunk_tokens = max_chunk_tokens
+        self.embed_batch_size = embed_batch_size
+        self.embed_batch_tokens = embed_batch_tokens
+        self.embed_concurrency = embed_concurrency
+        self.upload_batch_size = upload_batch_size
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.stats = IngestionStats()
+        # Embedded documents waiting for upload; bounded for backpressure
+        self._upload_queue: "asyncio.Queue[Optional[tuple]]" = asyncio.Queue(maxsize=upload_batch_size * 2)
+
+    def _changed_chunks(self, paths: Iterable[str]) -> Iterator[Chunk]:
+        for path in iter_markdown_files(paths):
+            self.stats.files += 1
+            filepath = os.path.relpath(path)
+            chunk_ids = []
+            with open(path, encoding="utf-8") as f:
+                for chunk in chunk_markdown(f, filepath, self.max_chunk_tokens):
+                    self.stats.chunks += 1
+                    chunk_ids.append(chunk.chunk_id)
+                    if self.manifest.is_current(chunk.chunk_id, chunk_hash(chunk, self.embedding_model)):
+                        self.stats.skipped += 1
+                        continue
+                    yield chunk
+            # Chunks that no longer exist in this file are removed from the index. They are
+            # recorded as pending deletions (saved with the manifest) until the index confirms.
+            stale = set(self.manifest.files.get(filepath, [])) - set(chunk_ids)
+            self.manifest.files[filepath] = chunk_ids
+            for chunk_id in stale:
+                self.manifest.chunks.pop(chunk_id, None)
+                if chunk_id not in self.manifest.stale:
+                    self.manifest.stale.append(chunk_id)
+
+    async def ingest(self, paths: Iterable[str]) -> dict:
+        """Ingest every markdown file under `paths` and return the run statistics"""
+        uploader = asyncio.create_task(self._upload_loop())
+        slots = asyncio.Semaphore(self.embed_concurrency)
+        tasks = set()
+
+        def stop_producers(task: asyncio.Task):
+            # A failed uploader never drains the queue again, so the producers blocked
+            # on it are cancelled and its error is raised below
+            if not task.cancelled() and task.exception() is not None:
+                for producer in list(tasks):
+                    producer.cancel()
+
+        uploader.add_done_callback(stop_producers)
+        try:
+            for batch in embedding_batches(self._changed_chunks(paths), self.embed_batch_size, self.embed_batch_tokens):
+                await slots.acquire()
+                if uploader.done():
+                    break
+                task = asyncio.create_task(self._embed_batch(batch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if not uploader.done():
+                end = asyncio.ensure_future(self._upload_queue.put(None))
+                await asyncio.wait({end, uploader}, return_when=asyncio.FIRST_COMPLETED)
+                end.cancel()
+            # Raises the uploader's error, if any
+            await uploader
+        except BaseException:
+            uploader.cancel()
+            for producer in list(tasks):
+                producer.cancel()
+            raise
+        await self._delete_stale()
+        self.manifest.save()
+        return self.stats.summary()
+
+    async def _embed_batch(self, batch: List[Chunk]):
+        texts = [embedding_text(chunk) for chunk in batch]
+        try:
+            vectors = await self.embedder.embed(texts)
+        except Exception as e:
+            # Not in the manifest, so the next run embeds these chunks again
+            self.stats.failed += len(batch)
+            logger.error(f"Could not embed {len(batch)} chunks ({batch[0].chunk_id}, ...): {e}")
+            return
+        self.stats.embedding_requests += 1
+        self.stats.embedded += len(batch)
+        self.stats.embedded_tokens += sum(count_tokens(text) for text in texts)
+        for chunk, vector in zip(batch, vectors):
+            document = {
+                "chunk_id": document_key(chunk.chunk_id),
+                "parent_id": document_key(chunk.filepath),
+                "title": chunk.title,
+                "chunk": chunk.content,
+                "text_vector": vector.tolist(),
+            }
+            await self._upload_queue.put((chunk, document))
+
+    async def _upload_loop(self):
+        pending: List[tuple] = []
+        while True:
+            item = await self._upload_queue.get()
+            if item is not None:
+                pending.append(item)
+            if pending and (item is None or len(pending) >= self.upload_batch_size):
+                await self._upload(pending)
+                # Checkpoint, so an interrupted run does not re-embed what is already indexed
+                self.manifest.save()
+                pending = []
+            if item is None:
+                return
+
+    async def _upload(self, items: List[tuple]):
+        """Upload one batch, retrying throttled requests and transient per-document failures"""
+        by_key = {document["chunk_id"]: (chunk, document) for chunk, document in items}
+        remaining = list(by_key)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.upload_retries += 1
+                await asyncio.sleep(self.retry_base_delay * 2 ** (attempt - 1) * (0.5 + random.random()))
+            try:
+                results = await self.search_client.upload_documents([by_key[key][1] for key in remaining])
+            except HttpResponseError as e:
+                if e.status_code == 413 and len(remaining) > 1:
+                    # Too large for one request: upload each half on its own
+                    middle = len(remaining) // 2
+                    await self._upload([by_key[key] for key in remaining[:middle]])
+                    await self._upload([by_key[key] for key in remaining[middle:]])
+                    return
+                if e.status_code in (429, 503) and attempt < self.max_retries:
+                    logger.warning(f"Index upload throttled ({e.status_code}), retrying {len(remaining)} documents")
+                    continue
+                raise
+            retry = []
+            for result in results:
+                if result.succeeded:
+                    chunk = by_key[result.key][0]
+                    self.manifest.chunks[chunk.chunk_id] = chunk_hash(chunk, self.embedding_model)
+                    self.stats.uploaded += 1
+                elif result.status_code in RETRYABLE_STATUS_CODES:
+                    retry.append(result.key)
+                else:
+                    self.stats.failed += 1
+                    logger.error(f"Could not index {by_key[result.key][0].chunk_id}: {result.error_message}")
+            remaining = retry
+            if not remaining:
+                return
+        self.stats.failed += len(remaining)
+        logger.error(f"Gave up on {len(remaining)} documents after {self.max_retries} retries")
+
+    async def _delete_stale(self):
+        """Delete the pending stale chunks and drop them from the manifest once the index confirms"""
+        # A chunk id that is back in a file was uploaded again in this run: keep it
+        current = {chunk_id for chunk_ids in self.manifest.files.values() for chunk_id in chunk_ids}
+        self.manifest.stale = [chunk_id for chunk_id in self.manifest.stale if chunk_id not in current]
+        # Persist the pending deletions before the index is touched
+        self.manifest.save()
+        by_key = {document_key(chunk_id): chunk_id for chunk_id in self.manifest.stale}
+        keys = list(by_key)
+        for start in range(0, len(keys), self.upload_batch_size):
+            batch = keys[start:start + self.upload_batch_size]
+            results = await self.search_client.delete_documents([{"chunk_id": key} for key in batch])
+            deleted = {result.key for result in results if result.succeeded}
+            self.stats.deleted += len(deleted)
+            self.manifest.stale = [chunk_id for chunk_id in self.manifest.stale if document_key(chunk_id) not in deleted]
+            self.manifest.save()
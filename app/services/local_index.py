@@ -0,0 +1,193 @@
+"""
+In-process retrieval index over chunked documents
+
+The index is a directory with three files:
+
+- `embeddings.f32`: a row-major float32 matrix (one normalized row per chunk),
+  opened with `numpy.memmap` so only the pages touched by a search are read
+  and several worker processes share the OS page cache
+- `chunks.jsonl`: the chunks as citation dicts, in row order
+- `meta.json`: row count, dimensions, the embedder used and a content
+  version (written last, so a half-written index is never loaded)
+
+Search combines a batched cosine top-k over the matrix with a BM25 lexical
+scorer, fused by reciprocal rank. Build an index with
+`python -m scripts.build_local_index`.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.chunking import Chunk, tokenize
+from app.services.embeddings import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.f32"
+CHUNKS_FILE = "chunks.jsonl"
+META_FILE = "meta.json"
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class BM25:
+    """Okapi BM25 over tokenized documents, with postings stored as NumPy arrays"""
+
+    def __init__(self, documents: List[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_count = len(documents)
+        self.doc_lengths = np.array([len(doc) for doc in documents], dtype=np.float32)
+        self.avg_length = float(self.doc_lengths.mean()) if self.doc_count else 0.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, doc in enumerate(documents):
+            for term, tf in Counter(doc).items():
+                postings[term].append((doc_id, tf))
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        for term, entries in postings.items():
+            doc_ids, tfs = zip(*entries)
+            self.postings[term] = (np.array(doc_ids, dtype=np.int64), np.array(tfs, dtype=np.float32))
+            df = len(entries)
+            self.idf[term] = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def scores(self, query_tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        if not self.doc_count:
+            return scores
+        for term in set(query_tokens):
+            if term not in self.postings:
+                continue
+            doc_ids, tfs = self.postings[term]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_ids] / self.avg_length)
+            scores[doc_ids] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int) -> List[Tuple[int, float]]:
+        scores = self.scores(query_tokens)
+        return [(int(i), float(scores[i])) for i in top_k_indices(scores, k) if scores[i] > 0]
+
+
+class LocalVectorIndex:
+    """Memory-mapped embedding matrix plus BM25 over the same chunks"""
+
+    def __init__(self, directory: str, embeddings: np.ndarray, chunks: List[dict], meta: dict):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.chunks = chunks
+        self.meta = meta
+        self.bm25 = BM25([tokenize(f"{c.get('title', '')} {c['content']}") for c in chunks])
+
+    @property
+    def version(self) -> str:
+        return self.meta.get("version", "")
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @classmethod
+    def write(cls, directory: str, chunks: List[Chunk], embeddings: np.ndarray, embedder: str) -> "LocalVectorIndex":
+        """Write a new index to `directory`, replacing any index already there"""
+        if len(chunks) != len(embeddings):
+            raise ValueError(f"{len(chunks)} chunks but {len(embeddings)} embeddings")
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        embeddings = normalize_rows(embeddings)
+        embeddings.tofile(os.path.join(directory, EMBEDDINGS_FILE))
+
+        digest = hashlib.sha256(embedder.encode("utf-8"))
+        with open(os.path.join(directory, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                line = json.dumps(chunk.to_citation(), ensure_ascii=False)
+                digest.update(line.encode("utf-8"))
+                f.write(line + "\n")
+
+        meta = {
+            "count": len(chunks),
+            "dimensions": int(embeddings.shape[1]) if len(chunks) else 0,
+            "embedder": embedder,
+            "version": digest.hexdigest()[:16],
+        }
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "LocalVectorIndex":
+        """Open an index written by `write`"""
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, CHUNKS_FILE), encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        if len(chunks) != meta["count"]:
+            raise ValueError(f"Index at {directory} is inconsistent: {len(chunks)} chunks, meta says {meta['count']}")
+        if meta["count"]:
+            embeddings = np.memmap(
+                os.path.join(directory, EMBEDDINGS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(meta["count"], meta["dimensions"]),
+            )
+        else:
+            embeddings = np.zeros((0, meta["dimensions"]), dtype=np.float32)
+        logger.info(f"Loaded local index {directory}: {meta['count']} chunks, {meta['dimensions']} dimensions")
+        return cls(directory, embeddings, chunks, meta)
+
+    def vector_search(self, query: np.ndarray, k: int, batch_rows: int = 8192) -> List[Tuple[int, float]]:
+        """Cosine top-k, scanning the matrix in batches of rows to bound memory"""
+        query = normalize_rows(query.reshape(1, -1))[0]
+        candidate_ids: List[np.ndarray] = []
+        candidate_scores: List[np.ndarray] = []
+        for start in range(0, len(self.embeddings), batch_rows):
+            scores = np.asarray(self.embeddings[start:start + batch_rows]) @ query
+            best = top_k_indices(scores, k)
+            candidate_ids.append(best + start)
+            candidate_scores.append(scores[best])
+        if not candidate_ids:
+            return []
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        return [(int(ids[i]), float(scores[i])) for i in top_k_indices(scores, k)]
+
+    def lexical_search(self, query_text: str, k: int) -> List[Tuple[int, float]]:
+        return self.bm25.top_k(tokenize(query_text), k)
+
+    def hybrid_search(
+        self,
+        query_text: str,
+        query_vector: Optional[np.ndarray],
+        k: int,
+        candidates: int = 50,
+        rrf_k: int = 60,
+    ) -> List[Tuple[dict, float]]:
+        """
+        Reciprocal rank fusion of vector and BM25 results
+
+        Returns (citation, fused score) pairs, best first.
+        """
+        fused: Dict[int, float] = defaultdict(float)
+        result_lists = [self.lexical_search(query_text, candidates)]
+        if query_vector is not None:
+            result_lists.append(self.vector_search(query_vector, candidates))
+        for results in result_lists:
+            for rank, (row, _) in enumerate(results):
+                fused[row] += 1.0 / (rrf_k + rank + 1)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.chunks[row], score) for row, score in ranked]
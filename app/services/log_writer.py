@@ -0,0 +1,301 @@
+"""
+Append-only JSONL log writers backed by Azure Blob Storage
+
+The evaluation and feedback logs are written one record at a time from the
+request path. Downloading the whole blob and uploading it again makes every
+write cost O(size of log) and lets concurrent writers overwrite each other.
+Append blobs avoid both problems: each write is a single `append_block` call
+that the service serializes server-side, so the cost of a write does not
+depend on how large the log already is.
+
+An append blob accepts at most 50,000 blocks. When a blob is full (or the
+existing blob is not an append blob, e.g. a log created by an older version
+of this app), the writer rolls over to the next numbered segment:
+`evaluation.jsonl`, `evaluation.0001.jsonl`, `evaluation.0002.jsonl`, ...
+
+`PartitionedLogWriter` instead starts a new blob every hour, one per writer
+process: `evaluation/2024/05/01/13-<worker>.jsonl`. Hours that have ended are
+never written again, so they can be compacted offline, and readers can skip
+whole hours by name.
+"""
+import json
+import logging
+import posixpath
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import StorageErrorCode
+from azure.storage.blob.aio import ContainerClient
+
+logger = logging.getLogger(__name__)
+
+# Service limits for append blobs
+APPEND_BLOB_MAX_BLOCKS = 50_000
+APPEND_BLOB_MAX_BLOCK_BYTES = 4 * 1024 * 1024
+
+# Errors that mean "this segment cannot take more data, move to the next one"
+_ROLLOVER_ERRORS = {
+    StorageErrorCode.BLOCK_COUNT_EXCEEDS_LIMIT,
+    StorageErrorCode.INVALID_BLOB_TYPE,
+}
+
+
+def encode_jsonl(records: Iterable[dict]) -> List[bytes]:
+    """Serialize records to JSONL lines (one bytes object per record)"""
+    return [(json.dumps(record, default=str) + "\n").encode("utf-8") for record in records]
+
+
+def segment_blob_name(blob_name: str, segment: int) -> str:
+    """Return the blob name for a log segment (segment 0 is the base name)"""
+    if segment == 0:
+        return blob_name
+    stem, ext = posixpath.splitext(blob_name)
+    return f"{stem}.{segment:04d}{ext or '.jsonl'}"
+
+
+def partition_blob_name(prefix: str, when: time.struct_time, worker_id: str) -> str:
+    """Blob name of one writer's log for the hour containing `when` (UTC)"""
+    return f"{prefix}/{time.strftime('%Y/%m/%d/%H', when)}-{worker_id}.jsonl"
+
+
+def partition_hour(prefix: str, blob_name: str) -> Optional[str]:
+    """The "yyyy/mm/dd/hh" partition of a blob written by `PartitionedLogWriter`, or None"""
+    if not blob_name.startswith(prefix + "/"):
+        return None
+    hour = blob_name[len(prefix) + 1:len(prefix) + 14]
+    try:
+        time.strptime(hour, "%Y/%m/%d/%H")
+    except ValueError:
+        return None
+    return hour
+
+
+async def list_partitions(container_client: ContainerClient, prefix: str) -> List[Tuple[str, List[str]]]:
+    """Hourly partitions under `prefix` as (hour, blob names), oldest hour first"""
+    partitions: Dict[str, List[str]] = defaultdict(list)
+    async for blob in container_client.list_blobs(name_starts_with=prefix + "/"):
+        hour = partition_hour(prefix, blob.name)
+        if hour is not None:
+            partitions[hour].append(blob.name)
+    return sorted((hour, sorted(names)) for hour, names in partitions.items())
+
+
+async def iter_blob_records(container_client: ContainerClient, blob_name: str) -> AsyncIterator[dict]:
+    """Stream the records of a single JSONL blob (no segments)"""
+    try:
+        downloader = await container_client.get_blob_client(blob_name).download_blob()
+    except ResourceNotFoundError:
+        return
+    async for record in _iter_downloaded(downloader, blob_name):
+        yield record
+
+
+async def _iter_downloaded(downloader, blob_name: str) -> AsyncIterator[dict]:
+    pending = b""
+    async for chunk in downloader.chunks():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            record = _parse_line(line, blob_name)
+            if record is not None:
+                yield record
+    record = _parse_line(pending, blob_name)
+    if record is not None:
+        yield record
+
+
+async def iter_partitioned_records(
+    container_client: ContainerClient, prefix: str, newest_first: bool = False
+) -> AsyncIterator[dict]:
+    """Stream the records of every hourly partition under `prefix`"""
+    partitions = await list_partitions(container_client, prefix)
+    if newest_first:
+        partitions.reverse()
+    for _, blob_names in partitions:
+        for blob_name in blob_names:
+            async for record in iter_blob_records(container_client, blob_name):
+                yield record
+
+
+async def iter_log_records(container_client: ContainerClient, blob_name: str) -> AsyncIterator[dict]:
+    """
+    Stream every record of a segmented JSONL log, oldest segment first
+
+    Segments are downloaded chunk by chunk, so memory use is bounded by the
+    chunk size rather than the size of the log. Lines that are not valid JSON
+    are skipped with a warning.
+    """
+    segment = 0
+    while True:
+        name = segment_blob_name(blob_name, segment)
+        try:
+            downloader = await container_client.get_blob_client(name).download_blob()
+        except ResourceNotFoundError:
+            return
+        async for record in _iter_downloaded(downloader, name):
+            yield record
+        segment += 1
+
+
+def _parse_line(line: bytes, blob_name: str):
+    if not line.strip():
+        return None
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        logger.warning(f"Skipping unreadable record in {blob_name}: {e}")
+        return None
+
+
+class LogWriter(ABC):
+    """
+    Common interface for append-only JSONL logs
+
+    Implementations only need to provide `write_lines`; callers use
+    `append` for a single record and `append_many` for a batch. All methods
+    are coroutines so writes never block the event loop.
+    """
+
+    @abstractmethod
+    async def write_lines(self, lines: List[bytes]) -> None:
+        """Durably append already-encoded JSONL lines to the log"""
+
+    async def append(self, record: dict) -> None:
+        """Append a single record to the log"""
+        await self.write_lines(encode_jsonl([record]))
+
+    async def append_many(self, records: Iterable[dict]) -> None:
+        """Append a batch of records to the log"""
+        lines = encode_jsonl(records)
+        if lines:
+            await self.write_lines(lines)
+
+
+class AppendBlobLogWriter(LogWriter):
+    """
+    LogWriter that appends to an Azure append blob with automatic rollover
+
+    Each call packs the given lines into as few blocks as possible (up to
+    4 MiB per block), so a batch of records costs one round trip in the
+    common case. Writes never read the existing blob.
+    """
+
+    def __init__(
+        self,
+        container_client: ContainerClient,
+        blob_name: str,
+        max_blocks: int = APPEND_BLOB_MAX_BLOCKS,
+        max_block_bytes: int = APPEND_BLOB_MAX_BLOCK_BYTES,
+    ):
+        self.container_client = container_client
+        self.blob_name = blob_name
+        self.max_blocks = max_blocks
+        self.max_block_bytes = max_block_bytes
+        # The current segment is discovered lazily: a full segment is skipped
+        # the first time an append to it is rejected.
+        self._segment = 0
+
+    @property
+    def current_blob_name(self) -> str:
+        """Name of the segment currently receiving appends"""
+        return segment_blob_name(self.blob_name, self._segment)
+
+    async def write_lines(self, lines: List[bytes]) -> None:
+        for block in self._pack_blocks(lines):
+            await self._append_block(block)
+
+    def _pack_blocks(self, lines: List[bytes]) -> List[bytes]:
+        """Group lines into blocks without splitting a line across blocks"""
+        blocks, current, size = [], [], 0
+        for line in lines:
+            if current and size + len(line) > self.max_block_bytes:
+                blocks.append(b"".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += len(line)
+        if current:
+            blocks.append(b"".join(current))
+        return blocks
+
+    async def _create_container(self) -> None:
+        logger.warning(f"Container of log {self.blob_name} not found; creating it")
+        try:
+            await self.container_client.create_container()
+        except ResourceExistsError:
+            pass
+
+    def _rollover(self, from_segment: int) -> None:
+        """Advance to the next segment unless a concurrent append already did"""
+        if self._segment == from_segment:
+            self._segment += 1
+            logger.info(f"Log {self.blob_name} rolled over to {self.current_blob_name}")
+
+    async def _append_block(self, block: bytes) -> None:
+        while True:
+            segment = self._segment
+            blob_client = self.container_client.get_blob_client(segment_blob_name(self.blob_name, segment))
+            try:
+                result = await blob_client.append_block(block, length=len(block))
+            except ResourceNotFoundError:
+                # First write to this segment: create it without clobbering a
+                # blob that a concurrent writer may have created meanwhile
+                try:
+                    await blob_client.create_append_blob(if_none_match="*")
+                except ResourceExistsError:
+                    pass
+                except ResourceNotFoundError as e:
+                    if e.error_code != StorageErrorCode.CONTAINER_NOT_FOUND:
+                        raise
+                    # Not bootstrapped yet (or deleted since): create the container too
+                    await self._create_container()
+                continue
+            except HttpResponseError as e:
+                if e.error_code in _ROLLOVER_ERRORS:
+                    self._rollover(segment)
+                    continue
+                raise
+
+            # Roll over proactively so the next append does not fail first
+            if int(result.get("blob_committed_block_count") or 0) >= self.max_blocks:
+                self._rollover(segment)
+            return
+
+
+class PartitionedLogWriter(LogWriter):
+    """
+    LogWriter that appends to one append blob per hour and writer
+
+    Each process passes its own `worker_id`, so concurrent workers never
+    append to the same blob. The partition is chosen by the time of the
+    write (UTC), so a record logged just before the hour ends may land in
+    the next hour's blob; readers filtering on `timestamp` allow for that.
+    """
+
+    def __init__(
+        self,
+        container_client: ContainerClient,
+        prefix: str,
+        worker_id: str,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.container_client = container_client
+        self.prefix = prefix.rstrip("/")
+        self.worker_id = worker_id
+        self.clock = clock
+        self._writers: Dict[str, AppendBlobLogWriter] = {}
+
+    @property
+    def current_blob_name(self) -> str:
+        return partition_blob_name(self.prefix, time.gmtime(self.clock()), self.worker_id)
+
+    async def write_lines(self, lines: List[bytes]) -> None:
+        blob_name = self.current_blob_name
+        writer = self._writers.get(blob_name)
+        if writer is None:
+            # Earlier hours are closed: drop their writers
+            writer = AppendBlobLogWriter(self.container_client, blob_name)
+            self._writers = {blob_name: writer}
+        await writer.write_lines(lines)
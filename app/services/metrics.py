@@ -0,0 +1,249 @@
+"""
+Lightweight request tracing and Prometheus metrics
+
+Code marks the stages of a request with `stage("name")` (a context manager)
+or `record_stage(name, seconds)`. Durations go to two places:
+
+- the current request's `RequestTimer`, which `MetricsMiddleware` sends to the
+  browser as a `Server-Timing` header (visible in the browser dev tools) and
+  which is copied into the evaluation record
+- the process-wide `REGISTRY`, as a histogram per stage and endpoint
+
+`GET /metrics` renders the registry in the Prometheus text format, together
+with counters and gauges collected from the components' own `stats()` at
+scrape time. Recording a stage is a `perf_counter()` pair, a dict update and
+a bisect into a fixed bucket list, so it is cheap enough to leave on.
+
+The current request is tracked in a context variable. Work that runs outside
+a request (e.g. the background telemetry writer) is recorded with the
+endpoint label "background".
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; spans cache lookups (sub-millisecond) to long completions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by label values, plus scrape-time collectors"""
+
+    def __init__(self):
+        # name -> (type, help, label names, {label values: Histogram or float})
+        self._metrics: Dict[str, Tuple[str, str, Tuple[str, ...], dict]] = {}
+        self._collectors: List[Callable[[], Iterator[Tuple[str, str, str, dict, float]]]] = []
+
+    def _series(self, name: str, kind: str, help_text: str, label_names: Tuple[str, ...]) -> dict:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = (kind, help_text, label_names, {})
+        return metric[3]
+
+    def observe(self, name: str, help_text: str, labels: Dict[str, str], value: float):
+        series = self._series(name, "histogram", help_text, tuple(labels))
+        key = tuple(labels.values())
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, help_text: str, labels: Dict[str, str], amount: float = 1):
+        series = self._series(name, "counter", help_text, tuple(labels))
+        key = tuple(labels.values())
+        series[key] = series.get(key, 0) + amount
+
+    def add_collector(self, collector: Callable[[], Iterator[Tuple[str, str, str, dict, float]]]):
+        """Register a function yielding (name, type, help, labels, value) samples at scrape time"""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        for name, (kind, help_text, label_names, series) in self._metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in series.items():
+                if kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        labels = _format_labels(label_names, key, 'le="%s"' % bound)
+                        lines.append(f"{name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(label_names, key, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{labels} {value.count}")
+                    lines.append(f"{name}_sum{_format_labels(label_names, key)} {value.sum}")
+                    lines.append(f"{name}_count{_format_labels(label_names, key)} {value.count}")
+                else:
+                    lines.append(f"{name}{_format_labels(label_names, key)} {value}")
+
+        collected: Dict[str, Tuple[str, str, List[str]]] = {}
+        for collector in self._collectors:
+            for name, kind, help_text, labels, value in collector():
+                if value is None:
+                    continue
+                entry = collected.setdefault(name, (kind, help_text, []))
+                entry[2].append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {float(value)}")
+        for name, (kind, help_text, samples) in collected.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _route_label(scope) -> str:
+    # The route template ("/api/evaluations/{response_id}") keeps label cardinality bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class RequestTimer:
+    """Stage durations of one request"""
+
+    def __init__(self, scope: dict):
+        # Routing fills in scope["route"] before the endpoint runs
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @property
+    def endpoint(self) -> str:
+        return _route_label(self.scope)
+
+    def add(self, name: str, seconds: float):
+        # A stage that runs more than once (e.g. token refresh) is summed
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def timings_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+
+
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+
+def current_timer() -> Optional[RequestTimer]:
+    return _current_timer.get()
+
+
+def record_stage(name: str, seconds: float):
+    """Record a stage duration for the current request and the stage histogram"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+    REGISTRY.observe(
+        "rag_stage_duration_seconds",
+        "Duration of each request stage",
+        {"stage": name, "endpoint": timer.endpoint if timer else "background"},
+        seconds,
+    )
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as one stage of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def count_error(error: Exception):
+    """Count an error handled inside an endpoint (the HTTP status may still be 200)"""
+    timer = _current_timer.get()
+    REGISTRY.inc(
+        "rag_errors_total",
+        "Errors raised while answering, by endpoint and exception type",
+        {"endpoint": timer.endpoint if timer else "background", "error": type(error).__name__},
+    )
+
+
+def timed_token_provider(token_provider, name: str = "auth"):
+    """Wrap an async bearer token provider so token acquisition shows up as a stage"""
+    async def provider():
+        with stage(name):
+            return await token_provider()
+    return provider
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request
+
+    Adds the `Server-Timing` header (stages finished before the response
+    starts; for a stream that is everything up to the first event) and
+    records the request duration per route, method and status.
+    """
+
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = RequestTimer(scope)
+        token = _current_timer.set(timer)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timer.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REGISTRY.observe(
+                "http_request_duration_seconds",
+                "HTTP request duration, including streaming the body",
+                {"route": timer.endpoint, "method": scope.get("method", ""), "status": str(status["code"])},
+                time.perf_counter() - timer.started,
+            )
+            _current_timer.reset(token)
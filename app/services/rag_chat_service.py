@@ -5,12 +5,23 @@ This module implements a Retrieval Augmented Generation (RAG) service that conne
 Azure OpenAI with Azure AI Search. RAG enhances LLM responses by grounding them in
 your enterprise data stored in Azure AI Search.
 """
+import asyncio
+import copy
 import logging
-from typing import List
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+import time
+from typing import AsyncIterator, List, Optional, Tuple
 from openai import AsyncAzureOpenAI
 from app.models.chat_models import ChatMessage
 from app.config import settings
+from app.services.backend_router import Backend, BackendRouter, is_backend_fault
+from app.services.deadline import within
+from app.services.faq_index import FaqIndex
+from app.services.history_packer import HistoryPacker, HistorySummarizer, count_tokens
+from app.services.metrics import stage
+from app.services.response_cache import ResponseCache, make_cache_key
+from app.services.retrievers import AzureSearchRetriever, Retriever
+from app.services.single_flight import SingleFlight
+from app.services.throttling import ReleasingStream
 
 logger = logging.getLogger(__name__)
 
@@ -21,40 +32,181 @@ class RagChatService:
     by connecting Azure OpenAI with Azure AI Search for grounded responses.
     
     This service:
-    1. Handles authentication to Azure services using Managed Identity
+    1. Uses the application-scoped Azure OpenAI client (authenticated with Managed Identity)
     2. Implements the "On Your Data" pattern using Azure AI Search as a data source
     3. Processes user queries and returns AI-generated responses grounded in your data
+    4. Serves repeated questions from an optional response cache
+    5. Coalesces identical in-flight requests into one upstream call
+    6. Spreads requests across Azure OpenAI deployments with a `BackendRouter`
+    7. Answers questions that match a FAQ entry with its curated answer (`FaqIndex`)
+    
+    Retrieval is delegated to a pluggable `Retriever`: Azure AI Search as an
+    "On Your Data" data source by default, or the in-process local index.
     """
     
-    def __init__(self):
-        """Initialize the RAG chat service using settings from app config"""
+    def __init__(
+        self,
+        openai_client: AsyncAzureOpenAI,
+        response_cache: Optional[ResponseCache] = None,
+        retriever: Optional[Retriever] = None,
+        router: Optional[BackendRouter] = None,
+        faq_index: Optional[FaqIndex] = None,
+    ):
+        """
+        Initialize the RAG chat service using settings from app config
+
+        Args:
+            openai_client: Shared Azure OpenAI client owned by the application's resource registry
+            response_cache: Optional cache consulted before calling Azure OpenAI
+            retriever: Retrieval backend; defaults to Azure AI Search "On Your Data"
+            router: Chooses the Azure OpenAI deployment per request; defaults to
+                `openai_client` with the configured GPT deployment
+            faq_index: Optional FAQ index consulted before anything else
+        """
         # Store settings for easy access
         self.openai_endpoint = settings.azure_openai_endpoint
         self.gpt_deployment = settings.azure_openai_gpt_deployment
         self.embedding_deployment = settings.azure_openai_embedding_deployment
         self.search_url = settings.azure_search_service_url
         self.search_index_name = settings.azure_search_index_name
+        self.search_index_version = settings.azure_search_index_version
         self.system_prompt = settings.system_prompt
-        
-        # Create Azure credentials for managed identity
-        # This allows secure, passwordless authentication to Azure services
-        self.credential = DefaultAzureCredential()
-        token_provider = get_bearer_token_provider(
-            self.credential,
-            "https://cognitiveservices.azure.com/.default"
+        self.retriever = retriever or AzureSearchRetriever(
+            self.search_url, self.search_index_name, self.search_index_version, self.embedding_deployment
+        )
+        self.response_cache = response_cache
+        self.faq_index = faq_index
+        self.single_flight = SingleFlight() if settings.single_flight_enabled else None
+        self.history_packer = HistoryPacker(settings.chat_history_token_budget)
+        self.history_summarizer = (
+            HistorySummarizer(openai_client, self.gpt_deployment) if settings.chat_history_summary_enabled else None
         )
         
-        # Create Azure OpenAI client
-        # We use the latest Azure OpenAI Python SDK with async support
-        self.openai_client = AsyncAzureOpenAI(
-            azure_endpoint=self.openai_endpoint,
-            azure_ad_token_provider=token_provider,
-            api_version="2024-10-21"
+        # The client (and its connection pool and credential) is created once per
+        # application, not per service instance or per request
+        self.openai_client = openai_client
+        self.router = router or BackendRouter(
+            [Backend("primary", self.openai_endpoint, self.gpt_deployment, 1.0, openai_client)]
         )
         
         logger.info("RagChatService initialized with environment variables")
     
-    async def get_chat_completion(self, history: List[ChatMessage]):
+    def _build_messages(self, history: List[ChatMessage], metadata: dict) -> List[dict]:
+        """Format the system prompt and conversation history for Azure OpenAI"""
+        with stage("history"):
+            return self._pack_history(history, metadata)
+
+    def _pack_history(self, history: List[ChatMessage], metadata: dict) -> List[dict]:
+        # Convert to Azure OpenAI compatible message format
+        turns = [{"role": msg.role, "content": msg.content} for msg in history]
+        
+        # Keep the system prompt and latest turn, then as much recent history as
+        # fits in the token budget (instead of a fixed number of messages)
+        packed = self.history_packer.pack(self.system_prompt, turns)
+        if packed.dropped and self.history_summarizer:
+            summary = self.history_summarizer.get(packed.dropped)
+            if summary:
+                packed = self.history_packer.pack(self.system_prompt, turns, summary)
+        
+        metadata["history_messages_sent"] = len(turns) - len(packed.dropped)
+        metadata["history_messages_dropped"] = len(packed.dropped)
+        metadata["input_tokens"] = packed.prompt_tokens
+        return packed.messages
+
+    @staticmethod
+    def _record_usage(response: dict, metadata: dict) -> None:
+        """Record input/output token counts, preferring the service's own usage numbers"""
+        usage = response.get("usage") or {}
+        if usage.get("prompt_tokens"):
+            metadata["input_tokens"] = usage["prompt_tokens"]
+        if usage.get("completion_tokens"):
+            metadata["output_tokens"] = usage["completion_tokens"]
+        else:
+            choices = response.get("choices") or [{}]
+            metadata["output_tokens"] = count_tokens((choices[0].get("message") or {}).get("content") or "")
+
+    @staticmethod
+    def _trim_citations(context) -> None:
+        """
+        Post-process citations to robustly trim parent_id if present
+
+        Only trims if the last line matches >80 random alphanumeric characters
+        """
+        if not context or 'citations' not in context:
+            return
+        for citation in context['citations']:
+            if 'content' in citation:
+                lines = citation['content'].split('\n')
+                # Check if last line is a long random string (parent_id)
+                if len(lines) > 1 and len(lines[-1]) > 80 and lines[-1].isalnum():
+                    # Remove the last line
+                    citation['content'] = '\n'.join(lines[:-1]).strip()
+                else:
+                    citation['content'] = citation['content'].strip()
+
+    def _cache_key(self, messages: List[dict]) -> str:
+        return make_cache_key(messages, self.retriever.index_name, self.retriever.index_version, self.gpt_deployment)
+
+    async def _cache_get(self, key: str, metadata: dict) -> Optional[dict]:
+        """Look up a cached response and record the cache status in metadata"""
+        if self.response_cache is None:
+            metadata["cache_status"] = "BYPASS"
+            return None
+        with stage("cache"):
+            cached = await self.response_cache.get(key)
+        metadata["cache_status"] = "HIT" if cached is not None else "MISS"
+        # Callers annotate the response (e.g. response_id), so never hand out the cached object
+        return copy.deepcopy(cached) if cached is not None else None
+
+    async def _cache_set(self, key: str, response: dict) -> None:
+        """Cache only complete answers, not truncated or filtered ones"""
+        if self.response_cache is None:
+            return
+        choices = response.get("choices") or []
+        if choices and choices[0].get("finish_reason") == "stop" and choices[0]["message"].get("content"):
+            await self.response_cache.set(key, copy.deepcopy(response))
+
+    async def _faq_answer(self, history: List[ChatMessage], metadata: dict) -> Optional[dict]:
+        """
+        The curated FAQ answer if the question matches a FAQ entry confidently enough
+
+        Only the first question of a conversation is matched: a follow-up
+        ("and for the Premium line?") depends on the earlier turns, which the
+        FAQ match cannot see.
+        """
+        if self.faq_index is None:
+            return None
+        latest = max((i for i, m in enumerate(history) if m.role == "user"), default=None)
+        if latest is None or any(m.role in ("user", "assistant") for m in history[:latest]):
+            return None
+        question = history[latest].content
+        try:
+            with stage("faq"):
+                match = await self.faq_index.match(question)
+        except Exception as e:
+            # E.g. the embedding deployment is unavailable: answer the usual way
+            logger.warning(f"FAQ lookup failed: {e}")
+            return None
+        if match is None:
+            return None
+        metadata["fast_path"] = "faq"
+        metadata["faq_confidence"] = round(match.confidence, 3)
+        response = self.faq_index.response(match)
+        self._record_usage(response, metadata)
+        return response
+
+    @staticmethod
+    def _replay(response: dict) -> List[dict]:
+        """A complete response (cached or curated) as stream events"""
+        choice = response["choices"][0]
+        events = []
+        if choice["message"].get("context"):
+            events.append({"type": "context", "context": choice["message"]["context"]})
+        events.append({"type": "delta", "content": choice["message"]["content"]})
+        events.append({"type": "done", "finish_reason": choice.get("finish_reason")})
+        return events
+
+    async def get_chat_completion(self, history: List[ChatMessage], metadata: Optional[dict] = None) -> dict:
         """
         Process a chat completion request with RAG capabilities by integrating with Azure AI Search
         
@@ -66,87 +218,215 @@ class RagChatService:
         
         Args:
             history: List of chat messages from the conversation history
+            metadata: Optional dict that receives per-request details for the
+                evaluation record (e.g. "cache_status": HIT, MISS or BYPASS)
             
         Returns:
-            Raw response from the OpenAI API with citations from Azure AI Search
+            The OpenAI API response as a dict, with citations from Azure AI Search
         """
+        metadata = {} if metadata is None else metadata
         try:
-            # Limit chat history to the 20 most recent messages to prevent token limit issues
-            recent_history = history[-20:] if len(history) > 20 else history
-            
-            # Convert to Azure OpenAI compatible message format
-            messages = []
-            
-            # Add system message
-            messages.append({
-                "role": "system", 
-                "content": self.system_prompt
-            })
-            
-            # Add conversation history
-            for msg in recent_history:
-                messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-            
-            # Configure Azure AI Search data source according to the "On Your Data" pattern
-            # This connects Azure OpenAI directly to your search index without needing to
-            # manually implement vector search, chunking, or semantic rankers
-            data_source = {
-                "type": "azure_search",
-                "parameters": {
-                    "endpoint": self.search_url,
-                    "index_name": self.search_index_name,
-                    "authentication": {
-                        "type": "system_assigned_managed_identity"
-                    },
-                    # Combines vector and traditional search
-                    "query_type": "vector_semantic_hybrid",
-                    # The naming pattern for semantic configuration is generated by Azure AI Search 
-                    # during integrated vectorization and cannot be customized
-                    "semantic_configuration": f"{self.search_index_name}-semantic-configuration",
-                    "embedding_dependency": {
-                        "type": "deployment_name",
-                        "deployment_name": self.embedding_deployment
-                    }
-                }
-            }
-            
-            # Call Azure OpenAI for completion with the data_sources parameter directly
-            response = await self.openai_client.chat.completions.create(
-                model=self.gpt_deployment,
-                messages=messages,
-                extra_body={
-                    "data_sources": [data_source]
-                },
-                stream=False
-            )
-
-            # Post-process citations in the response to robustly trim parent_id if present
-            # Only trim if the last line matches >80 random alphanumeric characters
-            if hasattr(response, 'choices') and response.choices:
-                for choice in response.choices:
-                    context = getattr(choice.message, 'context', None)
-                    if context and 'citations' in context:
-                        for citation in context['citations']:
-                            if 'content' in citation:
-                                lines = citation['content'].split('\n')
-                                # Check if last line is a long random string (parent_id)
-                                if len(lines) > 1 and len(lines[-1]) > 80 and lines[-1].isalnum():
-                                    # Remove the last line
-                                    citation['content'] = '\n'.join(lines[:-1]).strip()
-                                else:
-                                    citation['content'] = citation['content'].strip()
+            # FAQ questions are answered without retrieval or generation
+            faq_answer = await self._faq_answer(history, metadata)
+            if faq_answer is not None:
+                return faq_answer
 
-            # Return the processed response
-            return response
+            messages = self._build_messages(history, metadata)
+            cache_key = self._cache_key(messages)
+            cached = await self._cache_get(cache_key, metadata)
+            if cached is not None:
+                self._record_usage(cached, metadata)
+                return cached
+
+            # Identical concurrent requests share one upstream call
+            if self.single_flight is not None:
+                (result, backend), shared = await self.single_flight.do(
+                    cache_key, lambda: self._complete(messages, cache_key)
+                )
+                metadata["coalesced"] = shared
+                # Every waiter gets its own copy, since callers annotate the response
+                result = copy.deepcopy(result)
+            else:
+                result, backend = await self._complete(messages, cache_key)
+            metadata["backend"] = backend
+            self._record_usage(result, metadata)
+            return result
             
         except Exception as e:
             logger.error(f"Error in get_chat_completion: {str(e)}")
             # Propagate all errors to the controller layer
             raise
 
+    async def stream_chat_completion(
+        self, history: List[ChatMessage], metadata: Optional[dict] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Stream a chat completion with RAG capabilities as it is generated
+        
+        Yields events as dicts:
+        - {"type": "context", "context": {...}}: the "On Your Data" context (citations, intent),
+          with the same parent_id trimming as get_chat_completion. Azure OpenAI sends it
+          with the first chunk, before any answer text.
+        - {"type": "delta", "content": "..."}: the next piece of answer text
+        - {"type": "done", "finish_reason": "..."}: the completion finished
+        
+        A curated FAQ answer or a cached answer is replayed as the same events.
+        A streamed answer is assembled and cached once it completes.
+        
+        Args:
+            history: List of chat messages from the conversation history
+            metadata: Optional dict that receives per-request details (see get_chat_completion)
+        """
+        metadata = {} if metadata is None else metadata
+        try:
+            faq_answer = await self._faq_answer(history, metadata)
+            if faq_answer is not None:
+                for event in self._replay(faq_answer):
+                    yield event
+                return
+
+            messages = self._build_messages(history, metadata)
+            cache_key = self._cache_key(messages)
+            cached = await self._cache_get(cache_key, metadata)
+            if cached is not None:
+                self._record_usage(cached, metadata)
+                for event in self._replay(cached):
+                    yield event
+                return
+
+            # Identical concurrent requests share one upstream stream
+            if self.single_flight is not None:
+                events, shared = self.single_flight.stream(cache_key, lambda: self._stream(messages, cache_key))
+                metadata["coalesced"] = shared
+            else:
+                events = self._stream(messages, cache_key)
+            content_parts = []
+            try:
+                async for event in events:
+                    if event["type"] == "backend":
+                        metadata["backend"] = event["backend"]
+                        continue
+                    if event["type"] == "delta":
+                        content_parts.append(event["content"])
+                    yield event
+            finally:
+                # If the caller stops early (client disconnect), stop the upstream stream too
+                await events.aclose()
+            metadata["output_tokens"] = count_tokens("".join(content_parts))
+        except Exception as e:
+            logger.error(f"Error in stream_chat_completion: {str(e)}")
+            raise
+
+    async def _create(self, **kwargs) -> Tuple[object, Backend]:
+        """
+        Create a chat completion on the backend chosen by the router
+
+        If a backend fails (throttled, unavailable), the request is retried once
+        on each of the other backends before the error is raised.
+        """
+        tried: List[Backend] = []
+        while True:
+            backend = self.router.pick(exclude=tried)
+            started = time.monotonic()
+            try:
+                # For streams this returns once the response headers arrive; the backend
+                # stays in flight until the stream is closed
+                with stage("llm"):
+                    response = await backend.client.chat.completions.create(model=backend.deployment, **kwargs)
+            except asyncio.CancelledError:
+                # Client disconnect or deadline: says nothing about the backend's health
+                self.router.abandon(backend)
+                raise
+            except Exception as e:
+                self.router.release(backend, error=e)
+                tried.append(backend)
+                if not is_backend_fault(e) or len(tried) >= len(self.router.backends):
+                    raise
+                logger.warning(f"Azure OpenAI backend {backend.name} failed ({e}); trying another backend")
+                continue
+            if kwargs.get("stream"):
+                return ReleasingStream(response, self._stream_closed(backend, started)), backend
+            self.router.release(backend, time.monotonic() - started)
+            return response, backend
+
+    def _stream_closed(self, backend: Backend, started: float):
+        """Release `backend` once its stream ends, timing the whole answer rather than the headers"""
+        async def release(error: Optional[Exception], completed: bool):
+            if error is not None:
+                self.router.release(backend, error=error)
+            else:
+                # A stream closed early (client disconnect) still shows the backend is healthy,
+                # but its duration is not that of an answer
+                self.router.release(backend, time.monotonic() - started if completed else None)
+
+        return release
+
+    async def _complete(self, messages: List[dict], cache_key: str) -> Tuple[dict, str]:
+        """Call Azure OpenAI once (no cache, no coalescing), cache the result and return it with the backend name"""
+        with stage("retrieval"):
+            grounding = await within("retrieval", self.retriever.ground(messages))
+        # With "On Your Data" the data_sources parameter is passed directly in extra_body
+        response, backend = await self._create(
+            messages=grounding.messages,
+            extra_body=grounding.extra_body,
+            stream=False
+        )
+
+        with stage("serialize"):
+            if hasattr(response, 'choices') and response.choices:
+                for choice in response.choices:
+                    self._trim_citations(getattr(choice.message, 'context', None))
+
+            # Return the processed response
+            result = response.model_dump()
+            if grounding.context is not None:
+                for choice in result.get("choices") or []:
+                    choice["message"]["context"] = copy.deepcopy(grounding.context)
+        await self._cache_set(cache_key, result)
+        return result, backend.name
+
+    async def _stream(self, messages: List[dict], cache_key: str) -> AsyncIterator[dict]:
+        """Stream one Azure OpenAI completion as events and cache the assembled answer"""
+        with stage("retrieval"):
+            grounding = await within("retrieval", self.retriever.ground(messages))
+        stream, backend = await self._create(
+            messages=grounding.messages,
+            extra_body=grounding.extra_body,
+            stream=True
+        )
+        # Internal event: consumed by stream_chat_completion, not passed to callers
+        yield {"type": "backend", "backend": backend.name}
+        # Citations from an explicit retriever are known before the first token
+        context = grounding.context
+        if context is not None:
+            yield {"type": "context", "context": context}
+        content_parts = []
+        finish_reason = None
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta_context = getattr(choice.delta, 'context', None) if choice.delta else None
+                if delta_context:
+                    context = delta_context
+                    self._trim_citations(context)
+                    yield {"type": "context", "context": context}
+                if choice.delta and choice.delta.content:
+                    content_parts.append(choice.delta.content)
+                    yield {"type": "delta", "content": choice.delta.content}
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                    yield {"type": "done", "finish_reason": finish_reason}
+        finally:
+            # Closing the HTTP response makes Azure OpenAI stop generating an abandoned answer
+            await stream.close()
 
-# Create singleton instance
-rag_chat_service = RagChatService()
+        message = {"role": "assistant", "content": "".join(content_parts)}
+        if context:
+            message["context"] = context
+        await self._cache_set(cache_key, {
+            "object": "chat.completion",
+            "model": self.gpt_deployment,
+            "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+        })
@@ -0,0 +1,441 @@
+"""
+Application-scoped resource registry
+
+Azure clients are expensive to build: a `DefaultAzureCredential` probes its
+credential chain, and each new client opens its own TLS connections. Instead
+of constructing them per request, `AppResources` builds one credential, one
+token cache (`app.services.token_cache`), one async blob client and one Azure
+OpenAI client at startup, with connection pools sized from `AppSettings`, and
+closes them on shutdown.
+
+Building the clients makes no network calls. The blob container is created
+and tokens and connections are warmed up in the background afterwards (see
+`app.services.startup`), and `ready` turns true once that is done.
+
+FastAPI endpoints receive these objects through the dependencies in
+`app.dependencies`.
+"""
+import asyncio
+import logging
+import os
+import socket
+from typing import Dict, Optional
+
+import aiohttp
+import httpx
+import openai
+from azure.core.exceptions import ResourceExistsError
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.identity.aio import DefaultAzureCredential
+from azure.storage.blob.aio import BlobServiceClient, ContainerClient
+from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+
+from app.config import AppSettings
+from app.services.backend_router import Backend, BackendRouter
+from app.services.citation_store import CitationStore
+from app.services.embedding_cache import CachedEmbedder, EmbeddingCache
+from app.services.embeddings import HashingEmbedder, build_embedder
+from app.services.evaluation_blob_storage import EvaluationBlobStorage
+from app.services.faq_index import FaqIndex
+from app.services.feedback_blob_storage import FeedbackBlobStorage
+from app.services.history_packer import load_encoding_async
+from app.services.rag_chat_service import RagChatService
+from app.services.local_index import META_FILE, LocalVectorIndex
+from app.services.metrics import timed_token_provider
+from app.services.response_cache import MemoryCacheTier, RedisCacheTier, ResponseCache
+from app.services.retrievers import LocalRetriever, Retriever
+from app.services.session_store import SessionStore
+from app.services.startup import StartupReport
+from app.services.telemetry_writer import TelemetryWriter
+from app.services.throttling import ThrottledOpenAIClient
+from app.services.token_cache import TokenCache, TokenCacheCredential
+
+logger = logging.getLogger(__name__)
+
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+STORAGE_SCOPE = "https://storage.azure.com/.default"
+
+
+class AppResources:
+    """
+    Owns every long-lived client used by the application
+
+    Call `startup()` once from the FastAPI lifespan and `shutdown()` when the
+    application stops.
+    """
+
+    def __init__(self, settings: AppSettings, report: Optional[StartupReport] = None):
+        self.settings = settings
+        # Durations of the init and warm-up phases; main.py passes the one that also timed the imports
+        self.report = report or StartupReport()
+        self.credential: Optional[DefaultAzureCredential] = None
+        # A credential passed to startup() belongs to the caller, which closes it
+        self._owns_credential = False
+        self.token_cache: Optional[TokenCache] = None
+        self.token_provider = None
+        self.ssl_context = None
+        self.blob_session: Optional[aiohttp.ClientSession] = None
+        self.blob_service_client: Optional[BlobServiceClient] = None
+        self.container_client: Optional[ContainerClient] = None
+        self.openai_client: Optional[AsyncAzureOpenAI] = None
+        self.openai_clients: Dict[str, AsyncAzureOpenAI] = {}
+        self.router: Optional[BackendRouter] = None
+        self.response_cache: Optional[ResponseCache] = None
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        self.faq_index: Optional[FaqIndex] = None
+        self.citation_store: Optional[CitationStore] = None
+        self.session_store: Optional[SessionStore] = None
+        self.rag_chat_service: Optional[RagChatService] = None
+        self.eval_storage: Optional[EvaluationBlobStorage] = None
+        self.feedback_storage: Optional[FeedbackBlobStorage] = None
+        self.telemetry_writer: Optional[TelemetryWriter] = None
+        self.warmup_task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """True once the blob container exists and warm-up has finished (or timed out)"""
+        return self.report.ready
+
+    async def startup(self, credential=None, container_client: Optional[ContainerClient] = None):
+        """
+        Create the shared credential and clients, then bootstrap the blob container
+        and warm up in the background
+
+        Args:
+            credential: Async token credential to use instead of `DefaultAzureCredential`
+            container_client: Blob container to use instead of one built from the
+                settings (the load benchmark passes in-memory stand-ins for both)
+        """
+        settings = self.settings
+        report = self.report
+
+        with report.phase("init.credential"):
+            # One credential and one token cache shared by every Azure client. Tokens are
+            # refreshed in the background, so requests do not wait for the credential chain.
+            self._owns_credential = credential is None
+            self.credential = credential or DefaultAzureCredential()
+            self.token_cache = TokenCache(
+                self.credential,
+                refresh_margin_seconds=settings.token_refresh_margin_seconds,
+                retry_seconds=settings.token_refresh_retry_seconds,
+            )
+            self.token_cache.start()
+            # Token lookups (a cache hit after warm-up) show up as the "auth" stage
+            self.token_provider = timed_token_provider(self.token_cache.provider(COGNITIVE_SERVICES_SCOPE))
+
+        with report.phase("init.blob"):
+            if container_client is not None:
+                self.container_client = container_client
+            else:
+                # Blob storage: one aiohttp session with a bounded connection pool
+                self.blob_session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=settings.http_pool_max_connections,
+                        keepalive_timeout=settings.http_pool_keepalive_expiry_seconds,
+                        ttl_dns_cache=300,
+                    )
+                )
+                self.blob_service_client = BlobServiceClient(
+                    account_url=settings.azure_blob_account_url,
+                    credential=TokenCacheCredential(self.token_cache),
+                    transport=AioHttpTransport(session=self.blob_session, session_owner=False),
+                )
+                self.container_client = self.blob_service_client.get_container_client(settings.azure_blob_container)
+
+        with report.phase("init.openai"):
+            # Loading the CA bundle takes tens of milliseconds, so the clients share one TLS context
+            self.ssl_context = httpx.create_ssl_context()
+            # Azure OpenAI: one client (and httpx pool) per endpoint. Chat completions are
+            # routed across the configured deployments, each with its own rate limiting.
+            self.router = self._build_router()
+            self.openai_client = self._get_openai_client(settings.azure_openai_endpoint)
+
+        with report.phase("init.retriever"):
+            self.response_cache = self._build_response_cache()
+            self.citation_store = CitationStore(settings.citation_store_max_entries)
+            self.session_store = self._build_session_store()
+            self.faq_index = self._build_faq_index()
+            self.rag_chat_service = RagChatService(
+                self.router.primary.client, self.response_cache, self._build_retriever(), self.router, self.faq_index
+            )
+
+        with report.phase("init.telemetry"):
+            self.eval_storage = EvaluationBlobStorage(
+                self.container_client,
+                settings.azure_evaluation_blob,
+                prefix=self._evaluation_prefix(),
+                worker_id=settings.evaluation_log_worker_id or f"{socket.gethostname()}-{os.getpid()}",
+            )
+            self.feedback_storage = FeedbackBlobStorage(self.container_client, settings.azure_blob_feedback_blob)
+            self.telemetry_writer = TelemetryWriter(
+                sinks={"evaluation": self.eval_storage.writer, "feedback": self.feedback_storage.writer},
+                max_batch_size=settings.telemetry_batch_size,
+                flush_interval=settings.telemetry_flush_interval_seconds,
+                high_water_mark=settings.telemetry_queue_max,
+                overflow_policy=settings.telemetry_overflow_policy,
+            )
+            self.telemetry_writer.start()
+        logger.info("Application resources initialized")
+
+        # Readiness waits for the container bootstrap whether or not warm-up is enabled
+        self.warmup_task = asyncio.create_task(self._prepare())
+
+    async def _prepare(self):
+        """Bootstrap the blob container and warm up, then report ready"""
+        warm_up = asyncio.create_task(self.warm_up()) if self.settings.startup_warmup_enabled else None
+        try:
+            await self._bootstrap_container()
+            if warm_up is not None:
+                await warm_up
+        except asyncio.CancelledError:
+            if warm_up is not None:
+                warm_up.cancel()
+            raise
+        self.report.mark_ready()
+
+    async def _bootstrap_container(self):
+        """
+        Create the blob container once, instead of create_container() per request
+
+        Evaluation and feedback records cannot be written without it, so unlike
+        the warm-up steps this is retried until it succeeds, and the instance
+        is not ready before it has.
+        """
+        delay = 1.0
+        with self.report.phase("init.container"):
+            while True:
+                try:
+                    await self.container_client.create_container()
+                    return
+                except ResourceExistsError:
+                    return
+                except Exception as e:
+                    logger.warning(f"Could not create the blob container ({e}); retrying in {delay:.0f}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+
+    async def warm_up(self):
+        """
+        Pay the cold-start costs before the first request does
+
+        Acquires the Azure OpenAI and storage tokens, opens a connection to every
+        Azure OpenAI endpoint and loads the tokenizer. Steps that fail are
+        logged and left to the first request; warm-up ends either way once
+        they have finished or `STARTUP_WARMUP_TIMEOUT_SECONDS` has passed.
+        """
+        report = self.report
+
+        async def warm_openai():
+            with report.phase("warmup.token", raise_errors=False):
+                # Fetched once here, then kept fresh by the token cache
+                scopes = [COGNITIVE_SERVICES_SCOPE] + ([STORAGE_SCOPE] if self.blob_service_client else [])
+                await asyncio.gather(*(self.token_cache.get_token(scope) for scope in scopes))
+            await asyncio.gather(*(warm_endpoint(endpoint, client) for endpoint, client in self.openai_clients.items()))
+
+        async def warm_endpoint(endpoint: str, client: AsyncAzureOpenAI):
+            with report.phase(f"warmup.openai:{httpx.URL(endpoint).host}", raise_errors=False):
+                try:
+                    # Any HTTP response means DNS, TLS and the pooled connection are done
+                    await client.models.list()
+                except openai.APIStatusError:
+                    pass
+
+        async def warm_tokenizer():
+            with report.phase("warmup.tokenizer", raise_errors=False):
+                # Downloads the encoding unless it is cached in TIKTOKEN_CACHE_DIR
+                await load_encoding_async()
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(warm_openai(), warm_tokenizer()),
+                self.settings.startup_warmup_timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Warm-up did not finish within {self.settings.startup_warmup_timeout_seconds}s")
+
+    def _evaluation_prefix(self) -> Optional[str]:
+        return self.settings.azure_evaluation_prefix if self.settings.evaluation_log_layout == "hourly" else None
+
+    def _get_openai_client(self, endpoint: str) -> AsyncAzureOpenAI:
+        if endpoint not in self.openai_clients:
+            settings = self.settings
+            self.openai_clients[endpoint] = AsyncAzureOpenAI(
+                azure_endpoint=endpoint,
+                azure_ad_token_provider=self.token_provider,
+                api_version="2024-10-21",
+                http_client=DefaultAsyncHttpxClient(
+                    verify=self.ssl_context,
+                    limits=httpx.Limits(
+                        max_connections=settings.http_pool_max_connections,
+                        max_keepalive_connections=settings.http_pool_max_keepalive,
+                        keepalive_expiry=settings.http_pool_keepalive_expiry_seconds,
+                    )
+                ),
+            )
+        return self.openai_clients[endpoint]
+
+    def _build_router(self) -> BackendRouter:
+        settings = self.settings
+        backends = []
+        for i, backend in enumerate(settings.openai.backends):
+            # Quotas are per deployment, so each backend gets its own rate-limit-aware wrapper
+            client = ThrottledOpenAIClient(
+                self._get_openai_client(backend.endpoint),
+                rpm_limit=settings.openai_rpm_limit,
+                tpm_limit=settings.openai_tpm_limit,
+                initial_concurrency=settings.openai_concurrency_initial,
+                min_concurrency=settings.openai_concurrency_min,
+                max_concurrency=settings.openai_concurrency_max,
+                latency_target=settings.openai_latency_target_seconds,
+                deadline=settings.openai_request_deadline_seconds,
+                max_retries=settings.openai_max_retries,
+            )
+            name = backend.name or f"{httpx.URL(backend.endpoint).host}/{backend.gpt_deployment}"
+            backends.append(Backend(name, backend.endpoint, backend.gpt_deployment, backend.weight, client))
+        return BackendRouter(
+            backends,
+            failure_threshold=settings.openai_backend_failure_threshold,
+            cooldown_seconds=settings.openai_backend_cooldown_seconds,
+        )
+
+    def _build_response_cache(self) -> Optional[ResponseCache]:
+        settings = self.settings
+        if not settings.response_cache_enabled:
+            return None
+        tiers = [MemoryCacheTier(settings.response_cache_max_entries, settings.response_cache_ttl_seconds)]
+        if settings.response_cache_redis_url:
+            tiers.append(RedisCacheTier(settings.response_cache_redis_url, settings.response_cache_ttl_seconds))
+        return ResponseCache(tiers)
+
+    def _build_session_store(self) -> SessionStore:
+        settings = self.settings
+        if settings.session_redis_url:
+            tier = RedisCacheTier(
+                settings.session_redis_url, settings.session_ttl_seconds, prefix="rag:session:", setting="SESSION_REDIS_URL"
+            )
+        else:
+            tier = MemoryCacheTier(settings.session_store_max_entries, settings.session_ttl_seconds)
+        return SessionStore(tier, settings.session_max_messages)
+
+    def _build_retriever(self) -> Optional[Retriever]:
+        """The local retriever if configured, or None for "On Your Data" (the service default)"""
+        settings = self.settings
+        if settings.retriever_backend == "azure_search":
+            return None
+        index = LocalVectorIndex.load(settings.local_index_path)
+        return LocalRetriever(index, self._query_embedder(index), settings.retriever_top_k)
+
+    def _build_faq_index(self) -> Optional[FaqIndex]:
+        """The FAQ fast path's index, or None if it is disabled or has not been built"""
+        settings = self.settings
+        if not settings.faq_fast_path_enabled:
+            return None
+        if not os.path.exists(os.path.join(settings.faq_index_path, META_FILE)):
+            logger.info(f"No FAQ index at {settings.faq_index_path}; every question goes to Azure OpenAI")
+            return None
+        index = LocalVectorIndex.load(settings.faq_index_path)
+        return FaqIndex(index, self._query_embedder(index), settings.faq_min_confidence, settings.faq_lexical_weight)
+
+    def _query_embedder(self, index: LocalVectorIndex):
+        """Embeds queries the same way `index` was built, through the shared embedding cache"""
+        settings = self.settings
+        embedder = build_embedder(
+            index.meta["embedder"],
+            index.meta["dimensions"],
+            self.openai_client,
+            settings.azure_openai_embedding_deployment,
+        )
+        # The hashing embedder is cheaper to run than to look up
+        if settings.embedding_cache_enabled and not isinstance(embedder, HashingEmbedder):
+            if self.embedding_cache is None:
+                self.embedding_cache = EmbeddingCache(settings.embedding_cache_path, settings.embedding_cache_max_entries)
+            embedder = CachedEmbedder(embedder, self.embedding_cache)
+        return embedder
+
+    def collect_metrics(self):
+        """Counters and gauges from the components' own stats, sampled when /metrics is scraped"""
+        for backend_name, backend in self.router.stats().items():
+            labels = {"backend": backend_name}
+            yield "rag_openai_backend_open", "gauge", "1 while the backend's circuit breaker is open", labels, int(
+                backend["state"] != "closed"
+            )
+            yield "rag_openai_backend_requests_total", "counter", "Requests routed to the backend", labels, backend["requests"]
+            yield "rag_openai_backend_failures_total", "counter", "Backend faults (429, 5xx, timeouts)", labels, backend["failures"]
+            if backend["ewma_latency_ms"] is not None:
+                yield "rag_openai_backend_latency_seconds", "gauge", "EWMA latency used for routing", labels, backend[
+                    "ewma_latency_ms"
+                ] / 1000
+            throttling = backend["throttling"]
+            if throttling:
+                yield "rag_openai_throttled_total", "counter", "Throttled (429/503) Azure OpenAI responses", labels, throttling["throttled"]
+                yield "rag_openai_retries_total", "counter", "Retried Azure OpenAI calls", labels, throttling["retries"]
+                yield "rag_openai_deadline_exceeded_total", "counter", "Calls abandoned at the request deadline", labels, throttling[
+                    "deadline_exceeded"
+                ]
+                yield "rag_openai_concurrency_limit", "gauge", "Adaptive concurrency limit", labels, throttling["concurrency_limit"]
+                yield "rag_openai_in_flight", "gauge", "Calls in flight", labels, throttling["in_flight"]
+                yield "rag_openai_queue_wait_avg_seconds", "gauge", "Average wait for rate-limit budget", labels, throttling[
+                    "queue_wait_avg_ms"
+                ] / 1000
+
+        if self.telemetry_writer:
+            telemetry = self.telemetry_writer.stats()
+            yield "rag_telemetry_queue_depth", "gauge", "Records waiting for the telemetry writer", {}, telemetry["queue_depth"]
+            for outcome in ("written", "dropped", "failed"):
+                yield "rag_telemetry_records_total", "counter", "Telemetry records by outcome", {"outcome": outcome}, telemetry[outcome]
+
+        if self.token_cache:
+            tokens = self.token_cache.stats()
+            yield "rag_token_cache_hits_total", "counter", "Bearer tokens served from the token cache", {}, tokens["hits"]
+            yield "rag_token_blocking_fetches_total", "counter", "Token lookups that waited for the credential", {}, tokens[
+                "blocking_fetches"
+            ]
+            yield "rag_token_refreshes_total", "counter", "Background token refreshes", {}, tokens["refreshes"]
+            yield "rag_token_refresh_failures_total", "counter", "Failed background token refreshes", {}, tokens["failures"]
+            for scope, seconds in tokens["expires_in_seconds"].items():
+                yield "rag_token_expires_in_seconds", "gauge", "Time until the cached token expires", {"scope": scope}, seconds
+
+        if self.response_cache:
+            cache = self.response_cache.stats()
+            for tier, hits in cache["hits"].items():
+                yield "rag_response_cache_hits_total", "counter", "Response cache hits by tier", {"tier": tier}, hits
+            yield "rag_response_cache_misses_total", "counter", "Response cache misses", {}, cache["misses"]
+        if self.embedding_cache:
+            cache = self.embedding_cache.stats()
+            yield "rag_embedding_cache_hits_total", "counter", "Embedding cache hits", {}, cache["hits"]
+            yield "rag_embedding_cache_misses_total", "counter", "Embedding cache misses", {}, cache["misses"]
+        if self.faq_index:
+            faq = self.faq_index.stats()
+            yield "rag_faq_hits_total", "counter", "Questions answered from the FAQ without Azure OpenAI", {}, faq["hits"]
+            yield "rag_faq_misses_total", "counter", "Questions with no confident FAQ match", {}, faq["misses"]
+        single_flight = self.rag_chat_service.single_flight if self.rag_chat_service else None
+        if single_flight:
+            yield "rag_single_flight_followers_total", "counter", "Requests that shared another request's call", {}, single_flight.stats()[
+                "followers"
+            ]
+
+    async def shutdown(self):
+        """Flush telemetry and close every client in reverse order of creation"""
+        if self.warmup_task and not self.warmup_task.done():
+            self.warmup_task.cancel()
+            try:
+                await self.warmup_task
+            except asyncio.CancelledError:
+                pass
+        if self.telemetry_writer:
+            await self.telemetry_writer.stop(timeout=self.settings.telemetry_shutdown_timeout_seconds)
+        if self.response_cache:
+            await self.response_cache.close()
+        if self.session_store:
+            await self.session_store.close()
+        for client in self.openai_clients.values():
+            await client.close()
+        if self.blob_service_client:
+            await self.blob_service_client.close()
+        if self.blob_session:
+            await self.blob_session.close()
+        if self.token_cache:
+            await self.token_cache.close()
+        if self.credential and self._owns_credential:
+            await self.credential.close()
+        logger.info("Application resources closed")
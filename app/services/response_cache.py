@@ -0,0 +1,188 @@
+"""
+Response cache for grounded chat completions
+
+FAQ-style traffic sends the same questions over and over. The cache sits in
+front of the Azure OpenAI call in `RagChatService` and returns a previous
+answer for a request that normalizes to the same key:
+
+    (system prompt, search index, index version, GPT deployment, trimmed history)
+
+Message text is whitespace-collapsed and case-folded, so trivial differences
+in spacing or capitalization still hit. The index version
+(`AZURE_SEARCH_INDEX_VERSION`) is part of the key: bump it after re-indexing
+and every cached answer grounded in the old index is ignored.
+
+Tiers are checked in order. `MemoryCacheTier` is a per-process LRU with a
+TTL; `RedisCacheTier` is an optional shared tier for multi-worker or
+multi-instance deployments (requires the `redis` package).
+"""
+import hashlib
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def make_cache_key(
+    messages: List[dict],
+    index_name: str,
+    index_version: str,
+    deployment: str,
+) -> str:
+    """Hash the normalized request into a cache key"""
+    normalized = {
+        "index": index_name,
+        "index_version": index_version,
+        "deployment": deployment,
+        "messages": [(m["role"], _normalize_text(m["content"])) for m in messages],
+    }
+    payload = json.dumps(normalized, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheTier(ABC):
+    """One level of the response cache"""
+
+    name = "tier"
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[dict]:
+        """Return the cached response for a key, or None"""
+
+    @abstractmethod
+    async def set(self, key: str, value: dict) -> None:
+        """Store a response under a key"""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryCacheTier(CacheTier):
+    """In-process LRU cache with a per-entry TTL"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheTier(CacheTier):
+    """Shared cache tier on any Redis-compatible server (e.g. Azure Cache for Redis)"""
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: str,
+        ttl_seconds: float = 3600,
+        prefix: str = "rag:response:",
+        setting: str = "RESPONSE_CACHE_REDIS_URL",
+    ):
+        """
+        Args:
+            setting: The environment variable `url` came from, for the error when redis is missing
+        """
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(f"{setting} is set but the 'redis' package is not installed") from e
+        self.client = redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: dict) -> None:
+        await self.client.set(self.prefix + key, json.dumps(value, default=str), ex=int(self.ttl_seconds))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class ResponseCache:
+    """
+    Multi-tier response cache
+
+    A hit in a lower tier is copied into the tiers above it. Errors in a tier
+    (e.g. Redis unavailable) are logged and treated as a miss, so the cache
+    can never fail a chat request.
+    """
+
+    def __init__(self, tiers: List[CacheTier]):
+        self.tiers = tiers
+        self.hits = {tier.name: 0 for tier in tiers}
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[dict]:
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = await tier.get(key)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Response cache {tier.name} get failed: {e}")
+                continue
+            if value is not None:
+                self.hits[tier.name] += 1
+                for upper in self.tiers[:i]:
+                    await self._set_tier(upper, key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict) -> None:
+        for tier in self.tiers:
+            await self._set_tier(tier, key, value)
+
+    async def _set_tier(self, tier: CacheTier, key: str, value: dict):
+        try:
+            await tier.set(key, value)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache {tier.name} set failed: {e}")
+
+    async def close(self) -> None:
+        for tier in self.tiers:
+            await tier.close()
+
+    def stats(self) -> dict:
+        total_hits = sum(self.hits.values())
+        lookups = total_hits + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(total_hits / lookups, 4) if lookups else 0,
+        }
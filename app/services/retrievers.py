@@ -0,0 +1,128 @@
+"""
+Retriever backends for RagChatService
+
+A retriever turns the chat messages into a grounded Azure OpenAI request:
+
+- `AzureSearchRetriever` (default) keeps the "On Your Data" pattern: the
+  request carries an `azure_search` data source and Azure OpenAI retrieves
+  and returns the citations itself.
+- `LocalRetriever` searches the in-process `LocalVectorIndex`, adds the top-k
+  chunks to the prompt as `[docN]` sources, and returns them in the same
+  `context.citations` shape as "On Your Data".
+
+Select the backend with `RETRIEVER_BACKEND` (`azure_search` or `local`).
+"""
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from app.services.embeddings import Embedder
+from app.services.local_index import LocalVectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+class Grounding:
+    """What to send to Azure OpenAI for one request"""
+
+    def __init__(self, messages: List[dict], extra_body: Optional[dict] = None, context: Optional[dict] = None):
+        self.messages = messages
+        # Extra request fields, e.g. the "On Your Data" data_sources
+        self.extra_body = extra_body
+        # Citations found by the retriever itself; None when Azure OpenAI returns them
+        self.context = context
+
+
+class Retriever(ABC):
+    """Grounds chat requests in a document index"""
+
+    name = "retriever"
+
+    def __init__(self, index_name: str, index_version: str):
+        # Both are part of the response cache key
+        self.index_name = index_name
+        self.index_version = index_version
+
+    @abstractmethod
+    async def ground(self, messages: List[dict]) -> Grounding:
+        """Return the request to send for these messages"""
+
+
+class AzureSearchRetriever(Retriever):
+    """Azure AI Search as an "On Your Data" data source"""
+
+    name = "azure_search"
+
+    def __init__(self, search_url: str, index_name: str, index_version: str, embedding_deployment: str):
+        super().__init__(index_name, index_version)
+        self.search_url = search_url
+        self.embedding_deployment = embedding_deployment
+
+    def data_source(self) -> dict:
+        """Azure AI Search data source for the "On Your Data" pattern"""
+        # This connects Azure OpenAI directly to your search index without needing to
+        # manually implement vector search, chunking, or semantic rankers
+        return {
+            "type": "azure_search",
+            "parameters": {
+                "endpoint": self.search_url,
+                "index_name": self.index_name,
+                "authentication": {
+                    "type": "system_assigned_managed_identity"
+                },
+                # Combines vector and traditional search
+                "query_type": "vector_semantic_hybrid",
+                # The naming pattern for semantic configuration is generated by Azure AI Search
+                # during integrated vectorization and cannot be customized
+                "semantic_configuration": f"{self.index_name}-semantic-configuration",
+                "embedding_dependency": {
+                    "type": "deployment_name",
+                    "deployment_name": self.embedding_deployment
+                }
+            }
+        }
+
+    async def ground(self, messages: List[dict]) -> Grounding:
+        return Grounding(messages, extra_body={"data_sources": [self.data_source()]})
+
+
+class LocalRetriever(Retriever):
+    """Explicit retrieval from the in-process hybrid index"""
+
+    name = "local"
+
+    def __init__(self, index: LocalVectorIndex, embedder: Optional[Embedder], top_k: int = 5):
+        super().__init__(f"local:{index.directory}", index.version)
+        self.index = index
+        # None means lexical (BM25) search only
+        self.embedder = embedder
+        self.top_k = top_k
+
+    async def retrieve(self, query: str) -> List[dict]:
+        """Return the top-k chunks for a query as citation dicts"""
+        query_vector = None
+        if self.embedder is not None:
+            query_vector = (await self.embedder.embed([query]))[0]
+        return [dict(citation) for citation, _ in self.index.hybrid_search(query, query_vector, self.top_k)]
+
+    async def ground(self, messages: List[dict]) -> Grounding:
+        query = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        citations = await self.retrieve(query) if query else []
+
+        sources = "\n\n".join(
+            f"[doc{i}] {citation['title']}\n{citation['content']}" for i, citation in enumerate(citations, start=1)
+        )
+        grounding_message = {
+            "role": "system",
+            "content": (
+                "Answer using only the sources below. Cite the sources you use as [doc1], [doc2], etc. "
+                "If the sources do not contain the answer, say that you don't know.\n\n"
+                f"Sources:\n{sources or '(no matching sources)'}"
+            ),
+        }
+        # After the system prompt(s), before the conversation
+        position = next((i for i, m in enumerate(messages) if m["role"] != "system"), len(messages))
+        grounded = messages[:position] + [grounding_message] + messages[position:]
+        context = {"citations": citations, "intent": json.dumps([query])}
+        return Grounding(grounded, context=context)
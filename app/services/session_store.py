@@ -0,0 +1,71 @@
+"""
+Server-side conversation sessions
+
+Without a session the browser POSTs the whole conversation on every turn,
+so request size, validation and evaluation logging grow with the length of
+the chat. With a session (`POST /api/sessions`, then `session_id` in the
+chat request) the server keeps the history and the client only sends the
+new messages. After each answer the new messages and the reply are
+appended to the session.
+
+Sessions are stored in one `CacheTier` from `app.services.response_cache`:
+the in-process LRU with an idle TTL by default, or Redis so that every
+worker and instance sees the same sessions. A session that has expired or
+was evicted is reported as missing; the client then starts a new session
+and sends its full history once.
+
+Concurrent turns in the same session are not serialized: the last answer
+to finish wins. The chat UI sends one turn at a time.
+"""
+import logging
+import uuid
+from typing import List, Optional
+
+from app.services.response_cache import CacheTier
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Conversation histories keyed by session_id"""
+
+    def __init__(self, tier: CacheTier, max_messages: int = 100):
+        """
+        Args:
+            tier: Where the sessions are kept (memory or Redis)
+            max_messages: Only the most recent messages of a session are kept
+                (the history packer trims what is sent to the model further)
+        """
+        self.tier = tier
+        self.max_messages = max_messages
+        self.created = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def create(self) -> str:
+        session_id = str(uuid.uuid4())
+        await self.tier.set(session_id, {"messages": []})
+        self.created += 1
+        return session_id
+
+    async def get(self, session_id: str) -> Optional[List[dict]]:
+        """The stored messages ({"role", "content"} dicts), or None if the session is unknown"""
+        entry = await self.tier.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["messages"]
+
+    async def save(self, session_id: str, messages: List[dict]) -> None:
+        """Replace the session's history (this also restarts its idle TTL)"""
+        await self.tier.set(session_id, {"messages": messages[-self.max_messages:]})
+
+    async def close(self) -> None:
+        await self.tier.close()
+
+    def stats(self) -> dict:
+        stats = {"backend": self.tier.name, "created": self.created, "hits": self.hits, "misses": self.misses}
+        if hasattr(self.tier, "__len__"):
+            stats["entries"] = len(self.tier)
+        return stats
@@ -0,0 +1,153 @@
+"""
+Single-flight coalescing of identical in-flight requests
+
+When many users ask the same question at the same moment, only the first
+request calls Azure OpenAI; the others wait for that call and share its
+result. Requests are keyed the same way as the response cache, so "the same
+request" means the same normalized prompt against the same index and
+deployment.
+
+- `SingleFlight.do` coalesces coroutine calls (non-streaming completions).
+- `SingleFlight.stream` coalesces async iterators (streaming completions):
+  a request that joins late first replays the events already received, then
+  follows the live stream.
+
+Errors raised by the shared call are propagated to every waiter. A waiter
+that is cancelled (e.g. its client disconnected) only stops waiting; the
+shared call is cancelled only when no waiters are left.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class _Call:
+    """One shared coroutine call and the number of requests waiting for it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Stream:
+    """One shared async iterator, buffered so late subscribers can replay it"""
+
+    def __init__(self, source: AsyncIterator[Any]):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Any]):
+        try:
+            async for event in source:
+                self.events.append(event)
+                async with self._changed:
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Shared stream was cancelled")
+            # Every subscriber left: close the source so the upstream call stops too
+            if hasattr(source, "aclose"):
+                await source.aclose()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            async with self._changed:
+                self._changed.notify_all()
+
+    def subscribe(self) -> AsyncIterator[Any]:
+        # Count the subscriber now, not when it starts iterating, so the shared
+        # stream is not cancelled in between
+        self.subscribers += 1
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        position = 0
+        try:
+            while True:
+                if position < len(self.events):
+                    yield self.events[position]
+                    position += 1
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                async with self._changed:
+                    await self._changed.wait_for(lambda: position < len(self.events) or self.done)
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.task.cancel()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one upstream call"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Stream] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `fn()` once for all concurrent callers with the same key
+
+        Returns (result, shared) where `shared` is True if this caller joined
+        a call started by another request. The result object is the same for
+        every caller; copy it before mutating.
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, call=call: self._forget(self._calls, key, call))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        call.waiters += 1
+        try:
+            # shield: cancelling one waiter must not cancel the shared call
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def stream(self, key: str, fn: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """
+        Share one `fn()` async iterator among all concurrent callers with the same key
+
+        Returns (events, shared) where `shared` is True if this caller joined a
+        stream started by another request.
+        """
+        stream = self._streams.get(key)
+        shared = stream is not None
+        if stream is None:
+            stream = _Stream(fn())
+            self._streams[key] = stream
+            stream.task.add_done_callback(lambda _, stream=stream: self._forget(self._streams, key, stream))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return stream.subscribe(), shared
+
+    @staticmethod
+    def _forget(registry: dict, key: str, entry: Any):
+        # Only remove the entry if it has not already been replaced by a newer call
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
@@ -0,0 +1,99 @@
+"""
+Startup phases, warm-up and readiness
+
+The first request after a cold start (for example an App Service scale-out)
+used to pay for everything that had not happened yet: acquiring Entra ID
+tokens through the credential chain, DNS and TLS to Azure OpenAI and Blob
+Storage, and the container bootstrap. `AppResources.startup()` builds the
+clients without any network calls, then creates the blob container and runs
+`AppResources.warm_up()` in the background while the app already answers its
+liveness probe. The container bootstrap is retried until it succeeds, even
+with warm-up disabled; the readiness probe reports ready once it has and
+warm-up has finished, so the platform only routes traffic to a warm instance
+that can record evaluations.
+
+`StartupReport` records how long each import and initialization phase took
+(`GET /api/startup/stats`, the startup log line and `/metrics`), so startup
+time can be tracked from one deployment to the next.
+
+This module only uses the standard library so that it can time the imports
+of everything else.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Durations and outcomes of the startup phases, in the order they ran"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Dict] = []
+        self.ready_at: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str, raise_errors: bool = True):
+        """
+        Time a phase
+
+        Args:
+            name: Phase name, e.g. "import.framework" or "warmup.openai"
+            raise_errors: If False, a failing phase is recorded and logged
+                instead of raised (warm-up steps are best effort)
+        """
+        start = time.perf_counter()
+        entry = {"phase": name, "duration_ms": None, "ok": True}
+        self.phases.append(entry)
+        try:
+            yield entry
+        except Exception as e:
+            entry["ok"] = False
+            entry["error"] = f"{type(e).__name__}: {e}"
+            if raise_errors:
+                raise
+            logger.warning(f"Startup phase {name} failed: {entry['error']}")
+        finally:
+            entry["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    def mark_ready(self):
+        self.ready_at = time.perf_counter()
+        failed = [p["phase"] for p in self.phases if not p["ok"]]
+        summary = ", ".join(f"{p['phase']}={p['duration_ms']}ms" for p in self.phases if p["duration_ms"] is not None)
+        logger.info(
+            f"Ready {self.seconds_to_ready():.2f}s after start ({summary})"
+            + (f"; failed: {', '.join(failed)}" if failed else "")
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def seconds_to_ready(self) -> Optional[float]:
+        return None if self.ready_at is None else self.ready_at - self.started
+
+    def stats(self) -> dict:
+        seconds = self.seconds_to_ready()
+        return {
+            "ready": self.ready,
+            "seconds_to_ready": None if seconds is None else round(seconds, 3),
+            "uptime_seconds": round(time.perf_counter() - self.started, 3),
+            "phases": self.phases,
+        }
+
+    def collect_metrics(self):
+        for p in self.phases:
+            if p["duration_ms"] is not None:
+                yield "rag_startup_phase_seconds", "gauge", "Duration of a startup phase", {"phase": p["phase"]}, p[
+                    "duration_ms"
+                ] / 1000
+        seconds = self.seconds_to_ready()
+        if seconds is not None:
+            yield "rag_startup_seconds_to_ready", "gauge", "Time from process start to ready", {}, seconds
+
+
+# Created before the application modules are imported, so their import time is included
+STARTUP_REPORT = StartupReport()
@@ -0,0 +1,167 @@
+"""
+Background batched writer for evaluation and feedback telemetry
+
+Request handlers hand records to `TelemetryWriter.submit`, which only puts
+them on an in-process asyncio queue. A single worker task started in the
+FastAPI lifespan drains the queue, groups records by stream and writes each
+group with one append to its LogWriter. A batch is flushed when it reaches
+`max_batch_size` records or when `flush_interval` seconds have passed since
+its first record, whichever comes first.
+
+The queue is bounded by a high-water mark. When it is full, `submit` either
+drops the record immediately ("drop" policy) or waits up to
+`block_timeout` seconds for room before dropping ("block" policy), so a slow
+or unavailable storage account never grows memory without bound.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Literal, Optional, Tuple
+
+from app.services.log_writer import LogWriter
+from app.services.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+OverflowPolicy = Literal["drop", "block"]
+
+
+class TelemetryWriter:
+    """Bounded asyncio queue with a batching flush worker"""
+
+    def __init__(
+        self,
+        sinks: Dict[str, LogWriter],
+        max_batch_size: int = 100,
+        flush_interval: float = 1.0,
+        high_water_mark: int = 10_000,
+        overflow_policy: OverflowPolicy = "drop",
+        block_timeout: float = 0.05,
+    ):
+        self.sinks = sinks
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.high_water_mark = high_water_mark
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self._queue: "asyncio.Queue[Tuple[str, dict]]" = asyncio.Queue(maxsize=high_water_mark)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Counters
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.max_batch_size_seen = 0
+
+    def start(self):
+        """Start the flush worker (call from the application lifespan)"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name="telemetry-writer")
+
+    async def stop(self, timeout: float = 10.0):
+        """Flush everything still queued and stop the worker"""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Telemetry writer did not flush in {timeout}s; {self._queue.qsize()} records lost")
+        finally:
+            self._task = None
+
+    async def submit(self, stream: str, record: dict, timeout: Optional[float] = None) -> bool:
+        """
+        Queue a record for the given stream without waiting for storage
+
+        With the "block" overflow policy, a full queue is waited on for at most
+        `timeout` seconds (default: the writer's block timeout). Returns False
+        if the record was dropped because the queue is full.
+        """
+        if stream not in self.sinks:
+            raise ValueError(f"Unknown telemetry stream: {stream}")
+        try:
+            self._queue.put_nowait((stream, record))
+        except asyncio.QueueFull:
+            if self.overflow_policy != "block":
+                return self._drop(stream)
+            try:
+                await asyncio.wait_for(
+                    self._queue.put((stream, record)), timeout=self.block_timeout if timeout is None else timeout
+                )
+            except asyncio.TimeoutError:
+                return self._drop(stream)
+        self.enqueued += 1
+        return True
+
+    def _drop(self, stream: str) -> bool:
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 1000 == 0:
+            logger.warning(f"Telemetry queue full; dropped {stream} record (total dropped: {self.dropped})")
+        return False
+
+    def stats(self) -> dict:
+        """Snapshot of queue depth, batch size and drop counters"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "high_water_mark": self.high_water_mark,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size_seen": self.max_batch_size_seen,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0,
+        }
+
+    async def _next_batch(self) -> List[Tuple[str, dict]]:
+        """Wait for the first record, then collect more until size or time limit"""
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Tuple[str, dict]]):
+        by_stream: Dict[str, List[dict]] = defaultdict(list)
+        for stream, record in batch:
+            by_stream[stream].append(record)
+        for stream, records in by_stream.items():
+            try:
+                with stage("blob_write"):
+                    await self.sinks[stream].append_many(records)
+                self.written += len(records)
+            except Exception as e:
+                self.failed += len(records)
+                logger.error(f"Error writing {len(records)} {stream} records: {e}")
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.max_batch_size_seen = max(self.max_batch_size_seen, len(batch))
+
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            batch = await self._next_batch()
+            if batch:
+                await self._flush(batch)
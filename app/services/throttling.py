@@ -0,0 +1,349 @@
+"""
+Rate-limit-aware wrapper for Azure OpenAI chat completions
+
+Azure OpenAI enforces requests-per-minute (RPM) and tokens-per-minute (TPM)
+quotas per deployment. Without coordination, every in-flight request hits the
+limit on its own, retries on its own, and the user sees an apology. The
+throttling layer keeps the whole process under the quota instead:
+
+- Token buckets estimate the RPM and TPM budget locally (prompt tokens plus
+  the expected completion size) and make requests wait for budget.
+- An AIMD limiter adapts the number of concurrent calls: it grows slowly
+  while calls succeed within the latency target and halves on a 429 or a
+  slow call.
+- A 429 or 503 is retried with jittered exponential backoff. A `Retry-After`
+  (or `retry-after-ms`) header pauses *all* requests until it expires, not
+  only the one that was rejected.
+- Each request has a deadline covering queueing and retries (capped by what
+  is left of the request's own deadline budget); when the next wait would
+  exceed it, `ThrottledError` is raised instead of waiting.
+- A call cancelled by its caller (client disconnect, deadline) frees its
+  concurrency slot without counting as a failure.
+- A streamed completion keeps its concurrency slot until the stream has
+  ended or been closed, not only until the response headers arrive; the
+  time to the headers is still what the limiter compares to its latency
+  target, since answer length says nothing about congestion.
+
+The openai client's own retries are disabled for the wrapped calls so only
+this layer retries. `stats()` reports the queue wait (time spent waiting for
+budget and concurrency) and the limiter state.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import openai
+
+from app.services.deadline import stage_timeout
+from app.services.history_packer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 503}
+
+
+class ThrottledError(Exception):
+    """The request could not be sent within its deadline because of rate limiting"""
+
+
+class TokenBucket:
+    """Budget that refills continuously at `per_minute` units per minute (0 = unlimited)"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (a request larger than the bucket waits for a full bucket)"""
+        if not self.per_minute:
+            return 0.0
+        self._refill()
+        deficit = min(amount, self.capacity) - self.tokens
+        return max(0.0, deficit * 60 / self.per_minute)
+
+    def take(self, amount: float):
+        if self.per_minute:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Correct an earlier estimate once the real usage is known (positive = used more)"""
+        if self.per_minute:
+            self.tokens = max(-self.capacity, min(self.capacity, self.tokens - amount))
+
+
+class AdaptiveConcurrencyLimiter:
+    """Additive-increase / multiplicative-decrease limit on concurrent calls"""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, throttled: bool = False, failed: bool = False):
+        async with self._changed:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled or latency > self.latency_target:
+                # One decrease per round trip: a burst of 429s is one congestion signal
+                if now - self._last_decrease > max(latency, 1.0):
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            elif not failed:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._changed.notify_all()
+
+
+class ReleasingStream:
+    """
+    Streamed completion that runs `on_close(error, completed)` once it has ended
+
+    `create(stream=True)` returns as soon as the response headers arrive, but
+    the request lasts until the last chunk. `on_close` is called exactly once:
+    after the last chunk (`completed=True`), when reading a chunk fails
+    (`error`), or when the stream is closed before the end.
+    """
+
+    def __init__(self, stream, on_close: Callable[[Optional[Exception], bool], Awaitable[None]]):
+        self._stream = stream
+        self._on_close = on_close
+        self._iterator = None
+        self._finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iterator is None:
+            self._iterator = self._stream.__aiter__()
+        try:
+            return await self._iterator.__anext__()
+        except StopAsyncIteration:
+            await self._finish(None, completed=True)
+            raise
+        except Exception as e:
+            await self._finish(e, completed=False)
+            raise
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            await self._finish(None, completed=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    async def _finish(self, error: Optional[Exception], completed: bool):
+        if self._finished:
+            return
+        self._finished = True
+        # Shielded: the stream is usually closed from the finally block of a cancelled task
+        await asyncio.shield(self._on_close(error, completed))
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-requested delay from `retry-after-ms` or `Retry-After` (seconds), if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+
+
+class ThrottledChatCompletions:
+    """Drop-in for `client.chat.completions` with client-side rate limiting and retries"""
+
+    def __init__(
+        self,
+        completions,
+        rpm_limit: float = 0,
+        tpm_limit: float = 0,
+        initial_concurrency: int = 16,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        latency_target: float = 30.0,
+        deadline: float = 60.0,
+        max_retries: int = 4,
+        retry_base_delay: float = 0.5,
+        expected_completion_tokens: int = 800,
+    ):
+        self.completions = completions
+        self.requests = TokenBucket(rpm_limit)
+        self.tokens = TokenBucket(tpm_limit)
+        self.limiter = AdaptiveConcurrencyLimiter(initial_concurrency, min_concurrency, max_concurrency, latency_target)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.expected_completion_tokens = expected_completion_tokens
+        # Set from Retry-After; every request waits until then
+        self._paused_until = 0.0
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+        self.cancelled = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.queue_wait_last = 0.0
+
+    def _estimate_tokens(self, kwargs: dict) -> int:
+        prompt = sum(count_tokens(m.get("content") or "") + 4 for m in kwargs.get("messages", []))
+        return prompt + (kwargs.get("max_tokens") or self.expected_completion_tokens)
+
+    async def _wait_for_budget(self, estimate: int, deadline_at: float):
+        """Wait for a pause to expire and for RPM/TPM budget, then take it"""
+        while True:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(estimate))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(estimate)
+                return
+            if now + wait > deadline_at:
+                self.deadline_exceeded += 1
+                raise ThrottledError(f"Rate limit: no capacity within the {self.deadline:.0f}s request deadline")
+            await asyncio.sleep(wait)
+
+    async def create(self, **kwargs) -> Any:
+        deadline_at = time.monotonic() + self.deadline
+        # Never queue past what the request has left for generation
+        request_budget = stage_timeout("llm")
+        if request_budget is not None:
+            deadline_at = min(deadline_at, time.monotonic() + request_budget)
+        estimate = self._estimate_tokens(kwargs)
+        self.calls += 1
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            await self._wait_for_budget(estimate, deadline_at)
+            try:
+                await asyncio.wait_for(self.limiter.acquire(), timeout=max(0.0, deadline_at - time.monotonic()))
+            except asyncio.TimeoutError:
+                self.deadline_exceeded += 1
+                raise ThrottledError(f"Rate limit: no capacity within the {self.deadline:.0f}s request deadline")
+            self._record_queue_wait(time.monotonic() - queued_at)
+
+            started = time.monotonic()
+            try:
+                # For streams this returns once the response headers arrive (see ReleasingStream)
+                response = await self.completions.create(**kwargs)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                # Released in a task of its own: awaiting here could be cancelled again
+                asyncio.ensure_future(self.limiter.release(time.monotonic() - started, failed=True))
+                raise
+            except Exception as e:
+                retryable = is_retryable(e)
+                await self.limiter.release(time.monotonic() - started, throttled=retryable, failed=True)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                self.throttled += 1
+                delay = self._retry_delay(e, attempt)
+                if time.monotonic() + delay > deadline_at:
+                    self.deadline_exceeded += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"Azure OpenAI returned {getattr(e, 'status_code', type(e).__name__)}; retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            time_to_headers = time.monotonic() - started
+            if kwargs.get("stream"):
+                # The slot stays taken until the whole answer has been read
+                async def release(error: Optional[Exception], completed: bool):
+                    await self.limiter.release(time_to_headers, failed=error is not None)
+
+                return ReleasingStream(response, release)
+            await self.limiter.release(time_to_headers)
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self.tokens.adjust(usage.total_tokens - estimate)
+            return response
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        server_delay = retry_after_seconds(error)
+        backoff = self.retry_base_delay * 2 ** attempt * (0.5 + random.random())
+        if server_delay is not None:
+            # The quota is shared, so everyone pauses, not just this request
+            self._paused_until = max(self._paused_until, time.monotonic() + server_delay)
+            return server_delay + random.uniform(0, self.retry_base_delay)
+        return backoff
+
+    def _record_queue_wait(self, seconds: float):
+        self.queue_wait_last = seconds
+        self.queue_wait_total += seconds
+        self.queue_wait_max = max(self.queue_wait_max, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "deadline_exceeded": self.deadline_exceeded,
+            "cancelled": self.cancelled,
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "queue_wait_avg_ms": round(self.queue_wait_total / self.calls * 1000, 1) if self.calls else 0,
+            "queue_wait_max_ms": round(self.queue_wait_max * 1000, 1),
+            "queue_wait_last_ms": round(self.queue_wait_last * 1000, 1),
+            "paused_for_ms": round(max(0.0, self._paused_until - time.monotonic()) * 1000),
+        }
+
+
+class ThrottledOpenAIClient:
+    """
+    Wraps an `AsyncAzureOpenAI` client so `client.chat.completions.create` is throttled
+
+    Every other attribute (embeddings, close, ...) is the wrapped client's own.
+    """
+
+    class _Chat:
+        def __init__(self, completions: ThrottledChatCompletions):
+            self.completions = completions
+
+    def __init__(self, client, **options):
+        self._client = client
+        # Retries happen in the throttling layer, with the shared pause and deadline
+        self.chat = self._Chat(ThrottledChatCompletions(client.with_options(max_retries=0).chat.completions, **options))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def stats(self) -> dict:
+        return self.chat.completions.stats()
@@ -0,0 +1,178 @@
+"""
+Shared Entra ID token cache with proactive background refresh
+
+Each Azure SDK client refreshes its bearer token on demand: when the cached
+token is about to expire, the next request waits while the credential chain
+fetches a new one, and every client does so separately. `TokenCache` keeps
+one token per scope for the whole process and refreshes it in a background
+task well before it expires, so requests always find a valid token.
+
+- Azure OpenAI clients use `TokenCache.provider(scope)` as their
+  `azure_ad_token_provider`.
+- Storage clients use `TokenCacheCredential(cache)`, an async token
+  credential backed by the cache. The cache refreshes earlier than the
+  SDK's own 5-minute refresh window, so the SDK always gets a fresh token
+  without a round trip.
+
+Only the very first fetch of a scope (normally done during warm-up) waits
+for the credential; concurrent callers share that fetch. A failed background
+refresh is retried while the current token is still valid.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+
+from azure.core.credentials import AccessToken
+
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# A token this close to expiry is not handed out any more
+EXPIRY_SAFETY_SECONDS = 30
+# Never refresh a scope more often than this, whatever the token lifetime
+MIN_REFRESH_INTERVAL_SECONDS = 10
+
+
+class _Entry:
+    def __init__(self, token: AccessToken, fetched_at: float, refresh_margin: float):
+        self.token = token
+        # Refresh `refresh_margin` before expiry, but never in the first half of a
+        # short-lived token's lifetime
+        lifetime = token.expires_on - fetched_at
+        self.refresh_at = max(
+            token.expires_on - refresh_margin, fetched_at + lifetime / 2, fetched_at + MIN_REFRESH_INTERVAL_SECONDS
+        )
+        self.retry_at = 0.0
+
+
+class TokenCache:
+    """One bearer token per scope, shared by every client and refreshed ahead of expiry"""
+
+    def __init__(
+        self,
+        credential,
+        refresh_margin_seconds: float = 600,
+        retry_seconds: float = 30,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            credential: Async token credential that fetches the tokens
+            refresh_margin_seconds: Refresh a token this long before it expires
+            retry_seconds: Wait between attempts when a background refresh fails
+            clock: Returns the current time in epoch seconds, like `AccessToken.expires_on`
+        """
+        self.credential = credential
+        self.refresh_margin = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self._clock = clock
+        self._entries: Dict[Tuple[str, ...], _Entry] = {}
+        self._single_flight = SingleFlight()
+        self._changed = asyncio.Event()
+        self._task = None
+        self.hits = 0
+        self.blocking_fetches = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def start(self):
+        """Start the background refresh task (call from within the event loop)"""
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the refresh task. The credential is owned, and closed, by the caller."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get_token(self, *scopes: str) -> AccessToken:
+        """Return the cached token, fetching it only if there is no valid one yet"""
+        entry = self._entries.get(scopes)
+        if entry is not None and entry.token.expires_on - EXPIRY_SAFETY_SECONDS > self._clock():
+            self.hits += 1
+            return entry.token
+        self.blocking_fetches += 1
+        token, _ = await self._single_flight.do(" ".join(scopes), lambda: self._fetch(scopes))
+        return token
+
+    def provider(self, *scopes: str) -> Callable[[], Awaitable[str]]:
+        """An async `azure_ad_token_provider` for the OpenAI client"""
+        async def token_provider() -> str:
+            return (await self.get_token(*scopes)).token
+        return token_provider
+
+    async def _fetch(self, scopes: Tuple[str, ...]) -> AccessToken:
+        token = await self.credential.get_token(*scopes)
+        self._entries[scopes] = _Entry(token, self._clock(), self.refresh_margin)
+        # Let the refresh loop reschedule for the new expiry
+        self._changed.set()
+        return token
+
+    async def _refresh(self, scopes: Tuple[str, ...]):
+        try:
+            await self._single_flight.do(" ".join(scopes), lambda: self._fetch(scopes))
+            self.refreshes += 1
+        except Exception as e:
+            self.failures += 1
+            entry = self._entries.get(scopes)
+            if entry is not None:
+                entry.retry_at = self._clock() + self.retry_seconds
+            logger.warning(f"Token refresh for {' '.join(scopes)} failed, retrying in {self.retry_seconds}s: {e}")
+
+    async def _run(self):
+        while True:
+            self._changed.clear()
+            now = self._clock()
+            wake_at = None
+            for scopes, entry in list(self._entries.items()):
+                due = max(entry.refresh_at, entry.retry_at)
+                if due <= now:
+                    await self._refresh(scopes)
+                    entry = self._entries[scopes]
+                    due = max(entry.refresh_at, entry.retry_at)
+                wake_at = due if wake_at is None else min(wake_at, due)
+            timeout = None if wake_at is None else max(wake_at - self._clock(), 0)
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        now = self._clock()
+        return {
+            "hits": self.hits,
+            "blocking_fetches": self.blocking_fetches,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "expires_in_seconds": {
+                " ".join(scopes): round(entry.token.expires_on - now) for scopes, entry in self._entries.items()
+            },
+        }
+
+
+class TokenCacheCredential:
+    """Async token credential for Azure SDK clients that reads from a `TokenCache`"""
+
+    def __init__(self, cache: TokenCache):
+        self.cache = cache
+
+    async def get_token(self, *scopes: str, claims=None, tenant_id=None, **kwargs) -> AccessToken:
+        if claims or tenant_id:
+            # Claims challenges and other tenants need a token the cache does not hold
+            return await self.cache.credential.get_token(*scopes, claims=claims, tenant_id=tenant_id, **kwargs)
+        return await self.cache.get_token(*scopes)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
@@ -13,20 +13,14 @@ Key components:
 5. Bootstrap and JavaScript for the frontend UI
 """
 import os
+import asyncio
+import json
+import time
 import logging
-import uvicorn
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
 
-from app.models.chat_models import ChatRequest
-
-# Feedback model and blob storage helper
-from app.models.feedback_models import FeedbackRequest
-from app.services.feedback_blob_storage import FeedbackBlobStorage
-from app.services.evaluation_blob_storage import EvaluationBlobStorage
-from app.config import settings
+# Times the imports below; see GET /api/startup/stats
+from app.services.startup import STARTUP_REPORT
 
 # Configure logging
 logging.basicConfig(
@@ -35,16 +29,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Import the RAG chat service after logging to capture any initialization logs
-from app.services.rag_chat_service import rag_chat_service
+with STARTUP_REPORT.phase("import.framework"):
+    import openai
+    import uvicorn
+    from fastapi import Depends, FastAPI, Request, Response, HTTPException
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.templating import Jinja2Templates
+    from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+
+with STARTUP_REPORT.phase("import.config"):
+    from app.config import settings
+
+# Import the services after logging to capture any initialization logs
+with STARTUP_REPORT.phase("import.services"):
+    from app.models.chat_models import ChatMessage, ChatRequest
+
+    # Feedback model and blob storage helper
+    from app.models.feedback_models import FeedbackRequest
+    from app.services.citation_store import CitationStore, citation_detail, citation_stub
+    from app.services.compression import CompressionMiddleware
+    from app.services.deadline import (
+        ClientDisconnected,
+        DeadlineExceeded,
+        count_deadline_exceeded,
+        count_disconnect,
+        iterate_within,
+        run_for_client,
+        stage_timeout,
+        start_budget,
+    )
+    from app.services.evaluation_blob_storage import new_response_id
+    from app.services.feedback_join import find_evaluation_record, get_evaluation_with_feedback
+    from app.services.metrics import REGISTRY, MetricsMiddleware, count_error, current_timer, stage
+    from app.services.telemetry_writer import TelemetryWriter
+    from app.services.rag_chat_service import RagChatService
+    from app.services.resources import AppResources
+    from app.services.session_store import SessionStore
+    from app.services.throttling import ThrottledError
+    from app.dependencies import (
+        get_citation_store,
+        get_rag_chat_service,
+        get_resources,
+        get_session_store,
+        get_telemetry_writer,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the application-scoped clients once and close them on shutdown
+
+    The registry holds one credential, the async blob and Azure OpenAI clients
+    and the background telemetry writer; endpoints get them through FastAPI
+    dependencies instead of building new clients per request. Tokens and
+    connections are warmed up in the background while /api/health reports
+    the instance as starting.
+    """
+    resources = AppResources(settings, report=STARTUP_REPORT)
+    await resources.startup()
+    app.state.resources = resources
+    REGISTRY.add_collector(resources.collect_metrics)
+    REGISTRY.add_collector(STARTUP_REPORT.collect_metrics)
+    try:
+        yield
+    finally:
+        REGISTRY.remove_collector(STARTUP_REPORT.collect_metrics)
+        REGISTRY.remove_collector(resources.collect_metrics)
+        await resources.shutdown()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="FastAPI RAG with Azure OpenAI and Azure AI Search",
     description="A FastAPI application that demonstrates retrieval augmented generation using Azure OpenAI and Azure AI Search.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Per-stage timings: Server-Timing header and the /metrics histograms
+app.add_middleware(MetricsMiddleware, server_timing=settings.server_timing_enabled)
+if settings.response_compression_enabled:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.response_compression_min_bytes)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -60,115 +127,513 @@ async def get_home(request: Request):
 
 
 
+# Cleanup of abandoned streams, kept referenced until it finishes
+_background_tasks = set()
+
+
+def _in_background(coro):
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _start_budget():
+    """Start the request's deadline budget (see app.services.deadline)"""
+    start_budget(
+        settings.request_deadline_seconds,
+        settings.request_deadline_retrieval_seconds,
+        settings.request_deadline_logging_seconds,
+    )
+
+
 @app.post("/api/chat/completion")
-async def chat_completion(chat_request: ChatRequest):
+async def chat_completion(
+    chat_request: ChatRequest,
+    request: Request,
+    http_response: Response,
+    rag_chat_service: RagChatService = Depends(get_rag_chat_service),
+    telemetry_writer: TelemetryWriter = Depends(get_telemetry_writer),
+    citation_store: CitationStore = Depends(get_citation_store),
+    session_store: SessionStore = Depends(get_session_store),
+):
     """
     Process a chat completion request with RAG capabilities and log evaluation data
+
+    Returns the Azure OpenAI response with full citations, or with
+    `"format": "compact"` only the answer and citation stubs (see `_compact_response`).
+    With a `session_id`, the request only carries the new messages (see `_load_history`).
+
+    The completion is cancelled if the client disconnects, and answered with a
+    504 if it does not finish within `REQUEST_DEADLINE_SECONDS`.
     """
-    import uuid
-    import time
-    from app.services.evaluation_blob_storage import EvaluationBlobStorage
+    _start_budget()
+    history, stored = await _load_history(chat_request, session_store)
+    # Generate a response_id for this LLM response
+    response_id = new_response_id()
+    start_time = time.time()
+    metadata = {}
     try:
         if not chat_request.messages:
             raise HTTPException(status_code=400, detail="Messages cannot be empty")
 
-        # Generate a response_id for this LLM response
-        response_id = str(uuid.uuid4())
-        start_time = time.time()
+        # 1. Get chat completion from RAG service (possibly from the response cache),
+        # unless the client goes away or the deadline passes first
+        response = await run_for_client(request, rag_chat_service.get_chat_completion(history, metadata))
+        http_response.headers["X-Cache"] = metadata.get("cache_status", "BYPASS")
 
-        # 1. Get chat completion from RAG service
-        response = await rag_chat_service.get_chat_completion(chat_request.messages)
+        choice = response["choices"][0] if response.get("choices") else {}
+        message = choice.get("message") or {}
+        context = message.get("context") or {}
 
-        # 2. Extract intent from LLM response (assume intent is provided in a special field or pattern)
-        detected_intent = ""
-        try:
-            # If the LLM response includes a structured intent, extract it
-            # Example: intent is returned as part of the message context or as a prefix in the content
-            choice = response.choices[0] if hasattr(response, 'choices') and response.choices else response['choices'][0]
-            if choice and hasattr(choice.message, 'context') and choice.message.context and "intent" in choice.message.context:
-                detected_intent = choice.message.context["intent"]
-            elif llm_response and llm_response.lower().startswith("intent:"):
-                # e.g., "Intent: book_flight\n..."
-                detected_intent = llm_response.split('\n', 1)[0].replace("Intent:", "").strip()
-            else:
-                detected_intent = ""
-        except Exception:
-            detected_intent = ""
-
-        # 3. Get AI search results (simulate by extracting from response if available)
-        ai_search_results = None
-        try:
-            # If citations are present, use them as search results
-            choice = response.choices[0] if hasattr(response, 'choices') and response.choices else response['choices'][0]
-            ai_search_results = choice.message.context["citations"] if hasattr(choice.message, 'context') and choice.message.context and "citations" in choice.message.context else []
-        except Exception:
-            ai_search_results = []
-
-        # 4. Final LLM response
-        llm_response = None
-        try:
-            llm_response = choice.message.content if choice and hasattr(choice.message, 'content') else choice['message']['content']
-        except Exception:
-            llm_response = ""
+        # 2. Final LLM response
+        llm_response = message.get("content") or ""
+
+        # 3. Extract intent from LLM response (assume intent is provided in a special field or pattern)
+        detected_intent = _detect_intent(context, llm_response)
+
+        # 4. Get AI search results (the citations are the retrieved documents)
+        ai_search_results = context.get("citations", [])
+
+        await _save_session(chat_request, session_store, stored, llm_response)
 
         # 5. Save evaluation data
-        eval_blob = EvaluationBlobStorage(
-            account_url=settings.azure_blob_account_url,
-            container_name=settings.azure_blob_container,
-            blob_name=getattr(settings, 'azure_evaluation_blob', 'evaluation.jsonl')
+        eval_data = _evaluation_record(
+            response_id, chat_request, detected_intent, ai_search_results, llm_response, start_time, metadata,
+            history_offset=len(stored or []),
         )
+        # Queued for the background writer; the response does not wait on blob I/O
+        with stage("telemetry"):
+            await telemetry_writer.submit("evaluation", eval_data, timeout=stage_timeout("telemetry"))
 
-        eval_data = {
-            "response_id": response_id,
-            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
-            "user_chat_history": [m.dict() for m in chat_request.messages],
-            "detected_intent": detected_intent,
-            "ai_search_results": ai_search_results,
-            "llm_response": llm_response,
-            "response_time_ms": int((time.time() - start_time) * 1000),
-            # feedback and grounded_answer can be added later if user provides feedback
-        }
-        eval_blob.append_evaluation(eval_data)
+        if chat_request.format == "compact":
+            await citation_store.put(response_id, ai_search_results)
+            return _compact_response(response_id, llm_response, choice.get("finish_reason"), context)
 
         # Attach response_id to the API response for the frontend to use in feedback
-        if isinstance(response, dict):
-            response["response_id"] = response_id
-        elif hasattr(response, "__dict__"):
-            response.response_id = response_id
+        response["response_id"] = response_id
 
         return response
 
+    except ClientDisconnected:
+        logger.info(f"Client disconnected; cancelled chat completion {response_id}")
+        count_disconnect()
+        await _log_unfinished(telemetry_writer, "cancelled", response_id, chat_request, start_time, metadata, stored)
+        # Nobody reads it; 499 is the usual "client closed request" status in access logs
+        return Response(status_code=499)
+    except DeadlineExceeded as e:
+        logger.warning(f"Chat completion {response_id}: {e}")
+        count_deadline_exceeded(e)
+        await _log_unfinished(telemetry_writer, "timeout", response_id, chat_request, start_time, metadata, stored)
+        return JSONResponse(
+            {
+                "choices": [{"message": {"role": "assistant", "content": _error_message(e)}}],
+                "error": {"code": "deadline_exceeded", "stage": e.stage},
+            },
+            status_code=504,
+        )
     except Exception as e:
-        error_str = str(e).lower()
         logger.error(f"Error in chat completion: {str(e)}")
-        if "rate limit" in error_str or "capacity" in error_str or "quota" in error_str:
-            return {
-                "choices": [{
-                    "message": {
-                        "role": "assistant",
-                        "content": "The AI service is currently experiencing high demand. Please wait a moment and try again."
-                    }
-                }]
-            }
-        else:
-            return {
-                "choices": [{
-                    "message": {
-                        "role": "assistant",
-                        "content": f"An error occurred: {str(e)}"
-                    }
-                }]
-            }
+        count_error(e)
+        return {
+            "choices": [{
+                "message": {
+                    "role": "assistant",
+                    "content": _error_message(e)
+                }
+            }]
+        }
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(
+    chat_request: ChatRequest,
+    request: Request,
+    rag_chat_service: RagChatService = Depends(get_rag_chat_service),
+    telemetry_writer: TelemetryWriter = Depends(get_telemetry_writer),
+    citation_store: CitationStore = Depends(get_citation_store),
+    session_store: SessionStore = Depends(get_session_store),
+):
+    """
+    Stream a chat completion as Server-Sent Events
+
+    Events, in order:
+    - `metadata`: {"response_id": ...} so the client can attach feedback
+    - `citations`: {"citations": [...], "intent": ...} as soon as retrieval is done
+    - `delta`: {"content": ...} for each piece of answer text
+    - `done`: {"response_id": ..., "finish_reason": ...}, or `error`: {"message": ...}
+
+    With `"format": "compact"`, `citations` carries stubs without the text.
+    The session (if any) is updated and the evaluation record is logged after
+    the stream completes.
+
+    If the client disconnects, the upstream completion is cancelled. If the
+    answer does not finish within `REQUEST_DEADLINE_SECONDS`, the stream ends
+    with an `error` event carrying `"code": "deadline_exceeded"`.
+    """
+    if not chat_request.messages:
+        raise HTTPException(status_code=400, detail="Messages cannot be empty")
+    _start_budget()
+    history, stored = await _load_history(chat_request, session_store)
+
+    response_id = new_response_id()
+    start_time = time.time()
+    metadata = {}
+    events = iterate_within("llm", rag_chat_service.stream_chat_completion(history, metadata))
+
+    # Start the completion before the headers are sent, so the cache status
+    # (and any error raised before the first event) is known up front
+    first_events = []
+    first_error = None
+    try:
+        first_events.append(await run_for_client(request, events.__anext__(), stage=None))
+    except StopAsyncIteration:
+        pass
+    except ClientDisconnected:
+        logger.info(f"Client disconnected; cancelled chat stream {response_id}")
+        count_disconnect()
+        await _log_unfinished(telemetry_writer, "cancelled", response_id, chat_request, start_time, metadata, stored)
+        return Response(status_code=499)
+    except Exception as e:
+        logger.error(f"Error in chat stream: {str(e)}")
+        count_error(e)
+        first_error = e
+
+    async def all_events():
+        for event in first_events:
+            yield event
+        async for event in events:
+            yield event
+
+    async def event_stream():
+        context = {}
+        content_parts = []
+        finish_reason = None
+        outcome = "completed"
+        yield _sse("metadata", {"response_id": response_id})
+        if isinstance(first_error, DeadlineExceeded):
+            count_deadline_exceeded(first_error)
+            yield _sse("error", {"message": _error_message(first_error), "code": "deadline_exceeded"})
+            await _log_unfinished(telemetry_writer, "timeout", response_id, chat_request, start_time, metadata, stored)
+            return
+        if first_error is not None:
+            yield _sse("error", {"message": _error_message(first_error)})
+            return
+        try:
+            async for event in all_events():
+                if event["type"] == "context":
+                    context = event["context"]
+                    citations = context.get("citations", [])
+                    if chat_request.format == "compact":
+                        await citation_store.put(response_id, citations)
+                        citations = [citation_stub(c, i + 1) for i, c in enumerate(citations)]
+                    yield _sse("citations", {"citations": citations, "intent": context.get("intent", "")})
+                elif event["type"] == "delta":
+                    content_parts.append(event["content"])
+                    yield _sse("delta", {"content": event["content"]})
+                elif event["type"] == "done":
+                    finish_reason = event["finish_reason"]
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client disconnected and Starlette cancelled the response. Closing the
+            # events stops the upstream completion; nothing here may be awaited any more.
+            logger.info(f"Client disconnected; cancelled chat stream {response_id}")
+            count_disconnect()
+            _in_background(events.aclose())
+            _in_background(_log_unfinished(
+                telemetry_writer, "cancelled", response_id, chat_request, start_time, metadata, stored,
+                "".join(content_parts), context,
+            ))
+            raise
+        except DeadlineExceeded as e:
+            logger.warning(f"Chat stream {response_id}: {e}")
+            count_deadline_exceeded(e)
+            yield _sse("error", {"message": _error_message(e), "code": "deadline_exceeded"})
+            outcome = "timeout"
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            count_error(e)
+            yield _sse("error", {"message": _error_message(e)})
+            return
+
+        llm_response = "".join(content_parts)
+        if outcome != "completed":
+            await _log_unfinished(
+                telemetry_writer, outcome, response_id, chat_request, start_time, metadata, stored, llm_response, context
+            )
+            return
+
+        yield _sse("done", {"response_id": response_id, "finish_reason": finish_reason})
+
+        await _save_session(chat_request, session_store, stored, llm_response)
+        eval_data = _evaluation_record(
+            response_id,
+            chat_request,
+            _detect_intent(context, llm_response),
+            context.get("citations", []),
+            llm_response,
+            start_time,
+            metadata,
+            history_offset=len(stored or []),
+        )
+        await telemetry_writer.submit("evaluation", eval_data, timeout=stage_timeout("telemetry"))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so each event reaches the browser immediately
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Cache": metadata.get("cache_status", "BYPASS"),
+        },
+    )
+
+
+async def _load_history(chat_request: ChatRequest, session_store: SessionStore):
+    """
+    The conversation to answer and the session's stored messages (None without a session)
+
+    With a `session_id`, the stored messages come first, followed by the new
+    ones in the request. A missing or expired session is a 404; the client
+    then starts a new session and sends its full history.
+    """
+    if not chat_request.session_id:
+        return chat_request.messages, None
+    with stage("session"):
+        stored = await session_store.get(chat_request.session_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    # Stored messages were validated when they were first sent
+    return [ChatMessage.model_construct(**m) for m in stored] + chat_request.messages, stored
+
+
+async def _save_session(chat_request: ChatRequest, session_store: SessionStore, stored, answer: str):
+    """Append the new messages and the answer to the session"""
+    if stored is None or not answer:
+        return
+    new_messages = [{"role": m.role, "content": m.content} for m in chat_request.messages]
+    with stage("session"):
+        await session_store.save(
+            chat_request.session_id, stored + new_messages + [{"role": "assistant", "content": answer}]
+        )
+
+
+async def _log_unfinished(
+    telemetry_writer: TelemetryWriter, outcome: str, response_id, chat_request, start_time, metadata, stored,
+    llm_response: str = "", context: dict = None,
+):
+    """Log an answer that did not complete ("cancelled" or "timeout") with what was generated so far"""
+    context = context or {}
+    eval_data = _evaluation_record(
+        response_id,
+        chat_request,
+        _detect_intent(context, llm_response),
+        context.get("citations", []),
+        llm_response,
+        start_time,
+        metadata,
+        history_offset=len(stored or []),
+        outcome=outcome,
+    )
+    await telemetry_writer.submit("evaluation", eval_data, timeout=stage_timeout("telemetry"))
+
+
+def _compact_response(response_id: str, content: str, finish_reason, context: dict) -> dict:
+    """The answer with citation stubs; the citation text stays on the server"""
+    return {
+        "response_id": response_id,
+        "message": {"role": "assistant", "content": content},
+        "finish_reason": finish_reason,
+        "citations": [citation_stub(c, i + 1) for i, c in enumerate(context.get("citations", []))],
+        "intent": context.get("intent", ""),
+    }
+
+
+@app.post("/api/sessions")
+async def create_session(session_store: SessionStore = Depends(get_session_store)):
+    """
+    Start a server-side conversation
+
+    Chat requests with the returned `session_id` only send the messages that
+    are new since the last answer. Sessions expire after `SESSION_TTL_SECONDS`
+    without a turn.
+    """
+    return {"session_id": await session_store.create(), "ttl_seconds": settings.session_ttl_seconds}
+
+
+@app.get("/api/citations/{response_id}/{n}")
+async def get_citation(
+    response_id: str,
+    n: int,
+    http_response: Response,
+    resources: AppResources = Depends(get_resources),
+    citation_store: CitationStore = Depends(get_citation_store),
+):
+    """
+    Full text of citation [docN] of an answer, for answers returned in the compact format
+    """
+    citations = await citation_store.get(response_id)
+    if citations is None:
+        # Evicted, or answered by another worker: use the evaluation record, which is
+        # only looked up in the hour encoded in the response_id (never a log scan)
+        with stage("blob_read"):
+            record = await find_evaluation_record(
+                resources.container_client,
+                response_id,
+                resources.eval_storage.prefix,
+                settings.azure_evaluation_columnar_prefix,
+            )
+        citations = record.get("ai_search_results") if record else None
+    if not citations or not 1 <= n <= len(citations):
+        raise HTTPException(status_code=404, detail="Citation not found")
+    # An answer's citations never change
+    http_response.headers["Cache-Control"] = "private, max-age=86400, immutable"
+    return citation_detail(citations[n - 1], n)
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _error_message(e: Exception) -> str:
+    """User-facing message for an error raised while generating an answer"""
+    if isinstance(e, (ThrottledError, openai.RateLimitError)):
+        return "The AI service is currently experiencing high demand. Please wait a moment and try again."
+    if isinstance(e, DeadlineExceeded):
+        return "The answer took too long to generate. Please try again."
+    error_str = str(e).lower()
+    if "rate limit" in error_str or "capacity" in error_str or "quota" in error_str:
+        return "The AI service is currently experiencing high demand. Please wait a moment and try again."
+    return f"An error occurred: {str(e)}"
+
+
+def _detect_intent(context: dict, llm_response: str) -> str:
+    """
+    Intent of the question, from the "On Your Data" context or an "Intent:" prefix in the answer
+    """
+    # Example: intent is returned as part of the message context or as a prefix in the content
+    if "intent" in context:
+        return context["intent"]
+    if llm_response.lower().startswith("intent:"):
+        # e.g., "Intent: book_flight\n..."
+        return llm_response.split('\n', 1)[0].replace("Intent:", "").strip()
+    return ""
+
+
+def _evaluation_record(
+    response_id, chat_request, detected_intent, ai_search_results, llm_response, start_time, metadata=None,
+    history_offset=0, outcome="completed",
+) -> dict:
+    """
+    Build the evaluation log record for one answer
+
+    In a session, `user_chat_history` only holds the messages sent with this
+    turn; the earlier ones are in the session's previous records, and
+    `history_offset` is how many messages came before. `outcome` is
+    "completed", or "cancelled" (client disconnected) or "timeout" (deadline
+    exceeded) for answers that did not finish.
+    """
+    metadata = metadata or {}
+    timer = current_timer()
+    return {
+        "response_id": response_id,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "user_chat_history": [m.dict() for m in chat_request.messages],
+        "session_id": chat_request.session_id,
+        "history_offset": history_offset,
+        "detected_intent": detected_intent,
+        "ai_search_results": ai_search_results,
+        "llm_response": llm_response,
+        "outcome": outcome,
+        "response_time_ms": int((time.time() - start_time) * 1000),
+        "cache_status": metadata.get("cache_status", "BYPASS"),
+        "coalesced": metadata.get("coalesced", False),
+        # "faq" for curated answers served without Azure OpenAI (detected_intent is "faq_fast_path")
+        "fast_path": metadata.get("fast_path", ""),
+        "faq_confidence": metadata.get("faq_confidence"),
+        # Azure OpenAI backend that generated the answer (empty for cache hits)
+        "backend": metadata.get("backend", ""),
+        "input_tokens": metadata.get("input_tokens"),
+        "output_tokens": metadata.get("output_tokens"),
+        "history_messages_dropped": metadata.get("history_messages_dropped", 0),
+        # Where the time went: history, cache, retrieval, llm, serialize, ... in ms
+        "stage_timings_ms": timer.timings_ms() if timer else {},
+        # feedback and grounded_answer can be added later if user provides feedback
+    }
 
 
 @app.get("/api/health")
-async def health_check():
+async def health_check(resources: AppResources = Depends(get_resources)):
     """
-    Health check endpoint
+    Readiness probe: 503 until the startup warm-up has finished
+
+    Use this as the App Service health check path so that new instances only
+    get traffic once their tokens and connections are warm.
     """
+    if not resources.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
     return {"status": "ok"}
 
 
+@app.get("/api/health/live")
+async def liveness_check():
+    """
+    Liveness probe: the process is up and serving requests, warm or not
+    """
+    return {"status": "ok"}
+
+
+@app.get("/api/startup/stats")
+async def startup_stats():
+    """
+    Duration of each import, init and warm-up phase, and the time to ready
+    """
+    return STARTUP_REPORT.stats()
+
+
+@app.get("/api/telemetry/stats")
+async def telemetry_stats(telemetry_writer: TelemetryWriter = Depends(get_telemetry_writer)):
+    """
+    Queue depth, batch size and dropped-record counters for the telemetry writer
+    """
+    return telemetry_writer.stats()
+
+
+@app.get("/api/openai/stats")
+async def openai_stats(resources: AppResources = Depends(get_resources)):
+    """
+    Per-backend routing and throttling state for chat completions: health, latency,
+    queue wait, concurrency limit, 429s and retries
+    """
+    return resources.router.stats()
+
+
+@app.get("/api/cache/stats")
+async def cache_stats(resources: AppResources = Depends(get_resources)):
+    """
+    Hit rates of the FAQ fast path, the response, embedding and citation caches,
+    server-side sessions and in-flight request coalescing
+    """
+    rag_chat_service = resources.rag_chat_service
+    return {
+        "faq": resources.faq_index.stats() if resources.faq_index else None,
+        "response_cache": resources.response_cache.stats() if resources.response_cache else None,
+        "embedding_cache": resources.embedding_cache.stats() if resources.embedding_cache else None,
+        "single_flight": rag_chat_service.single_flight.stats() if rag_chat_service.single_flight else None,
+        "citation_store": resources.citation_store.stats(),
+        "sessions": resources.session_store.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics: stage and request latency histograms, error, throttling,
+    cache and telemetry counters
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     # This lets you test the application locally with Uvicorn
     # For production deployment, use a proper ASGI server like Gunicorn
@@ -179,66 +644,45 @@ if __name__ == "__main__":
 # Feedback endpoint
 
 @app.post("/api/feedback")
-async def submit_feedback(feedback: FeedbackRequest):
+async def submit_feedback(
+    feedback: FeedbackRequest,
+    telemetry_writer: TelemetryWriter = Depends(get_telemetry_writer),
+):
     """
-    Receive user feedback and append to Azure Blob Storage as JSONL.
-    Also append feedback and grounded_answer to the last evaluation record in evaluation.jsonl.
+    Receive user feedback and append it to the feedback log in Azure Blob Storage as JSONL.
+
+    Feedback is stored only as an append-only event keyed by response_id; it is
+    merged into the evaluation records on read (/api/evaluations/{response_id})
+    or offline by scripts/compact_feedback.py, so a click never rewrites evaluation.jsonl.
     """
     try:
-        # Prepare feedback blob storage helper (MSI)
-        blob = FeedbackBlobStorage(
-            account_url=settings.azure_blob_account_url,
-            container_name=settings.azure_blob_container,
-            blob_name=settings.azure_blob_feedback_blob
-        )
         # Convert feedback to dict (ensure timestamp is ISO string)
         feedback_dict = feedback.dict()
         feedback_dict["timestamp"] = feedback.timestamp.isoformat()
-        blob.append_feedback(feedback_dict)
-
-        # Also update the correct evaluation record in evaluation.jsonl by matching response_id
-        from app.services.evaluation_blob_storage import EvaluationBlobStorage
-        eval_blob = EvaluationBlobStorage(
-            account_url=settings.azure_blob_account_url,
-            container_name=settings.azure_blob_container,
-            blob_name=getattr(settings, 'azure_evaluation_blob', 'evaluation.jsonl')
-        )
-        # Download, update matching record, and re-upload
-        try:
-            eval_blob_client = eval_blob.container_client.get_blob_client(eval_blob.blob_name)
-            existing = eval_blob_client.download_blob().readall().decode('utf-8')
-            lines = existing.strip().split('\n') if existing else []
-            if lines:
-                import json
-                updated_any = False
-                for i, line in enumerate(lines):
-                    try:
-                        rec = json.loads(line)
-                        if 'response_id' in rec and hasattr(feedback, 'response_id') and feedback.response_id == rec['response_id']:
-                            rec["feedback"] = feedback.feedback
-                            rec["feedback_timestamp"] = feedback.timestamp.isoformat()
-                            # Edge case 1: Thumb up clears grounded_answer and failed_reason
-                            if feedback.feedback == 'thumb_up':
-                                rec["grounded_answer"] = ""
-                                rec["failed_reason"] = ""
-                            # Edge case 2: Thumb down overwrites grounded_answer and failed_reason
-                            elif feedback.feedback == 'thumb_down':
-                                rec["grounded_answer"] = feedback.grounded_answer if hasattr(feedback, 'grounded_answer') else ""
-                                rec["failed_reason"] = feedback.failed_reason if hasattr(feedback, 'failed_reason') else ""
-                            lines[i] = json.dumps(rec, default=str)
-                            updated_any = True
-                            break
-                    except Exception as e:
-                        logger.error(f"Error parsing evaluation record: {e}")
-                if updated_any:
-                    updated = '\n'.join(lines) + '\n'
-                    eval_blob_client.upload_blob(updated, overwrite=True)
-                else:
-                    logger.warning("No matching evaluation record found for feedback.")
-        except Exception as e:
-            logger.error(f"Error updating evaluation.jsonl with feedback: {e}")
-
+        await telemetry_writer.submit("feedback", feedback_dict)
         return {"status": "success"}
     except Exception as e:
         logger.error(f"Error saving feedback: {e}")
         raise HTTPException(status_code=500, detail="Failed to save feedback")
+
+
+@app.get("/api/evaluations/{response_id}")
+async def get_evaluation(response_id: str, resources: AppResources = Depends(get_resources)):
+    """
+    Return an evaluation record with its latest feedback merged in
+
+    Only the hour encoded in the response_id is read, so answers logged with
+    `EVALUATION_LOG_LAYOUT=single` or before response ids carried an hour are
+    not found here; use scripts/query_evaluations.py for those.
+    """
+    with stage("blob_read"):
+        record = await get_evaluation_with_feedback(
+            resources.container_client,
+            settings.azure_blob_feedback_blob,
+            response_id,
+            resources.eval_storage.prefix,
+            settings.azure_evaluation_columnar_prefix,
+        )
+    if record is None:
+        raise HTTPException(status_code=404, detail="Evaluation record not found")
+    return record
@@ -0,0 +1,419 @@
+"""
+Load benchmark for the chat, feedback and evaluation endpoints, without Azure
+
+    python -m scripts.bench_load --concurrency 1,8,32 --requests 500 --output bench.json
+    python -m scripts.bench_load --scenarios stream --openai-latency-ms 300 --stream-delay-ms 20
+    python -m scripts.bench_load --log-records 0,100000 --scenarios feedback,evaluation
+    python -m scripts.bench_load --baseline bench.json          # compare with an earlier run
+
+Everything runs in this process: the FastAPI app under uvicorn, the Azure
+OpenAI stand-in (`scripts.standin_server`, with configurable latency,
+streaming, citations and 429 injection) and an in-memory blob container
+(`scripts.standin_blob`) prefilled with `--log-records` evaluation and
+feedback records. The app itself is the production code path: the real
+`AppResources`, router, throttling, caches and telemetry writer.
+
+For every log size, scenario and concurrency level the driver reports
+requests per second, p50/p95/p99 latency (and time to first token for
+streams), event-loop lag sampled every 10 ms, and resident memory. The
+driver shares the event loop with the app, so absolute numbers are lower than
+on a dedicated server; compare runs made on the same machine with `--baseline`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("completion", "stream", "feedback", "evaluation")
+
+# Settings the app requires; the OpenAI endpoint is replaced by the stand-in's address
+PLACEHOLDER_ENV = {
+    "AZURE_OPENAI_ENDPOINT": "http://127.0.0.1",
+    "AZURE_OPENAI_GPT_DEPLOYMENT": "bench",
+    "AZURE_SEARCH_SERVICE_URL": "http://127.0.0.1",
+    "AZURE_SEARCH_INDEX_NAME": "bench",
+    "AZURE_BLOB_ACCOUNT_URL": "http://127.0.0.1",
+    "AZURE_BLOB_CONTAINER": "bench",
+}
+
+
+class StaticTokenCredential:
+    """Async credential that hands out a fixed token (the stand-in does not check it)"""
+
+    async def get_token(self, *scopes, **kwargs):
+        from azure.core.credentials import AccessToken
+
+        return AccessToken("bench", int(time.time()) + 3600)
+
+    async def close(self):
+        pass
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 2)
+
+
+def summarize(values) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 2) if values else None,
+        "mean": round(sum(values) / len(values), 2) if values else None,
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), falling back to the peak"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (2**20 if platform.system() == "Darwin" else 2**10), 1)
+
+
+async def sample_loop_lag(samples: list, interval: float = 0.01):
+    """Record how late the event loop wakes a task that sleeps `interval` seconds"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+
+# The prefilled records are logged in the hour the benchmark started
+PREFILL_TIME = time.gmtime()
+
+
+def response_id(i: int) -> str:
+    """Response id of prefilled record `i`, carrying the hour of the prefilled partition"""
+    return f"{time.strftime('%Y%m%d%H', PREFILL_TIME)}-{uuid.UUID(int=i)}"
+
+
+def evaluation_record(i: int) -> dict:
+    return {
+        "response_id": response_id(i),
+        "timestamp": "2024-01-01T00:00:00Z",
+        "user_chat_history": [{"role": "user", "content": f"What does the warranty cover? ({i})"}],
+        "detected_intent": "[\"warranty\"]",
+        "ai_search_results": [{"title": "Contoso Warranty", "content": "All Contoso products come with a warranty. " * 10}],
+        "llm_response": "Contoso offers a one-year limited warranty [doc1]. " * 4,
+        "response_time_ms": 900,
+        "cache_status": "MISS",
+    }
+
+
+def feedback_record(i: int) -> dict:
+    return {
+        "response_id": response_id(i),
+        "question": f"What does the warranty cover? ({i})",
+        "answer": "Contoso offers a one-year limited warranty [doc1].",
+        "feedback": "thumb_up" if i % 3 else "thumb_down",
+        "grounded_answer": "",
+        "failed_reason": "",
+        "timestamp": "2024-01-01T00:00:00Z",
+    }
+
+
+class Scenarios:
+    """One request of each scenario; returns (ok, time to first token or None)"""
+
+    def __init__(self, client: httpx.AsyncClient, args, log_records: int):
+        self.client = client
+        self.args = args
+        self.log_records = log_records
+
+    def question(self, i: int) -> str:
+        # Distinct questions miss the response cache; a small pool hits it
+        pool = self.args.distinct_questions
+        return f"What does the warranty cover? ({i % pool if pool else i})"
+
+    async def completion(self, i: int):
+        response = await self.client.post(
+            "/api/chat/completion", json={"messages": [{"role": "user", "content": self.question(i)}]}
+        )
+        # Errors are answered with 200 and an apology, without a response_id
+        return response.status_code == 200 and "response_id" in response.json(), None
+
+    async def stream(self, i: int):
+        started = time.perf_counter()
+        first_token = None
+        ok = False
+        async with self.client.stream(
+            "POST", "/api/chat/stream", json={"messages": [{"role": "user", "content": self.question(i)}]}
+        ) as response:
+            async for line in response.aiter_lines():
+                if line == "event: delta" and first_token is None:
+                    first_token = (time.perf_counter() - started) * 1000
+                elif line == "event: done":
+                    ok = True
+                elif line == "event: error":
+                    ok = False
+        return ok and response.status_code == 200, first_token
+
+    async def feedback(self, i: int):
+        body = feedback_record(random.randrange(self.log_records or 1))
+        body["timestamp"] = datetime.now(timezone.utc).isoformat()
+        response = await self.client.post("/api/feedback", json=body)
+        return response.status_code == 200, None
+
+    async def evaluation(self, i: int):
+        # Reads scan the hour of the record, so their cost grows with --log-records
+        if not self.log_records:
+            return False, None
+        response = await self.client.get(f"/api/evaluations/{response_id(random.randrange(self.log_records))}")
+        return response.status_code == 200, None
+
+
+async def measure(scenarios: Scenarios, name: str, concurrency: int, total: int) -> dict:
+    request = getattr(scenarios, name)
+    counter = itertools.count()
+    latencies, first_tokens, lag = [], [], []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < total:
+            started = time.perf_counter()
+            try:
+                ok, first_token = await request(i)
+            except Exception as e:
+                logger.debug(f"{name} request failed: {e}")
+                ok, first_token = False, None
+            latencies.append((time.perf_counter() - started) * 1000)
+            if first_token is not None:
+                first_tokens.append(first_token)
+            if not ok:
+                errors += 1
+
+    rss_start = rss_mb()
+    lag_task = asyncio.create_task(sample_loop_lag(lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    lag_task.cancel()
+
+    result = {
+        "requests": total,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "rps": round(total / duration, 1) if duration else None,
+        "latency_ms": summarize(latencies),
+        "loop_lag_ms": summarize(lag),
+        "rss_mb": {"start": rss_start, "end": rss_mb(), "peak": peak_rss_mb()},
+    }
+    if first_tokens:
+        result["first_token_ms"] = summarize(first_tokens)
+    return result
+
+
+def standin_arguments(args) -> argparse.Namespace:
+    from scripts.standin_server import build_parser
+
+    return build_parser().parse_args([
+        "--latency-ms", str(args.openai_latency_ms),
+        "--throttle-rate", str(args.throttle_rate),
+        "--retry-after", str(args.retry_after),
+        "--stream-delay-ms", str(args.stream_delay_ms),
+        "--answer-words", str(args.answer_words),
+        "--citations", str(args.citations),
+    ])
+
+
+async def start_servers(args):
+    """Start the OpenAI stand-in and the app (uvicorn) on free local ports"""
+    import uvicorn
+    from aiohttp import web
+
+    import main
+    from app.config import settings
+    from scripts.standin_server import create_app
+
+    standin = create_app(standin_arguments(args))
+    runner = web.AppRunner(standin, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    settings.azure_openai_endpoint = f"http://127.0.0.1:{port}"
+    settings.azure_openai_backends = []
+    settings.retriever_backend = "azure_search"
+    settings.response_cache_enabled = args.distinct_questions > 0
+
+    # The lifespan builds resources with real Azure clients; the driver builds them itself
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    app_port = server.servers[0].sockets[0].getsockname()[1]
+    return runner, standin["state"], server, server_task, f"http://127.0.0.1:{app_port}"
+
+
+async def run_log_size(args, log_records: int, base_url: str, standin_state) -> list:
+    import main
+    from app.config import settings
+    from app.services.log_writer import partition_blob_name
+    from app.services.resources import AppResources
+    from scripts.standin_blob import MemoryContainerClient
+
+    container = MemoryContainerClient(latency_ms=args.blob_latency_ms)
+    if settings.evaluation_log_layout == "hourly":
+        evaluation_blob = partition_blob_name(settings.azure_evaluation_prefix, PREFILL_TIME, "prefill")
+    else:
+        evaluation_blob = settings.azure_evaluation_blob
+    container.prefill(evaluation_blob, (evaluation_record(i) for i in range(log_records)))
+    container.prefill(settings.azure_blob_feedback_blob, (feedback_record(i) for i in range(0, log_records, 10)))
+
+    resources = AppResources(settings)
+    await resources.startup(credential=StaticTokenCredential(), container_client=container)
+    main.app.state.resources = resources
+
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        scenarios = Scenarios(client, args, log_records)
+        for name in args.scenarios:
+            if name == "evaluation" and not log_records:
+                continue
+            for concurrency in args.concurrency:
+                upstream_before = dict(standin_state.counts)
+                appends_before = container.appends
+                result = await measure(scenarios, name, concurrency, args.requests)
+                result.update({
+                    "scenario": name,
+                    "concurrency": concurrency,
+                    "log_records": log_records,
+                    "upstream_chat_requests": standin_state.counts["chat_requests"] - upstream_before["chat_requests"],
+                    "upstream_throttled": standin_state.counts["throttled"] - upstream_before["throttled"],
+                    "blob_appends": container.appends - appends_before,
+                    "telemetry": resources.telemetry_writer.stats(),
+                })
+                results.append(result)
+                print(format_result(result))
+    await resources.shutdown()
+    return results
+
+
+def format_result(result: dict) -> str:
+    latency = result["latency_ms"]
+    line = (
+        f"{result['scenario']:<10} log={result['log_records']:<7} c={result['concurrency']:<4} "
+        f"rps={result['rps']:<8} p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms "
+        f"errors={result['errors']} lag_p99={result['loop_lag_ms']['p99']}ms rss={result['rss_mb']['end']}MB"
+    )
+    if "first_token_ms" in result:
+        line += f" ttft_p50={result['first_token_ms']['p50']}ms"
+    return line
+
+
+def compare(results: list, baseline_path: str):
+    """Print throughput and p99 changes against a previous run with the same parameters"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["concurrency"], r["log_records"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} ({baseline['run'].get('commit') or 'unknown commit'}):")
+    for result in results:
+        before = previous.get((result["scenario"], result["concurrency"], result["log_records"]))
+        if before is None:
+            continue
+        rps_change = (result["rps"] / before["rps"] - 1) * 100 if before["rps"] else 0
+        p99_change = (result["latency_ms"]["p99"] / before["latency_ms"]["p99"] - 1) * 100 if before["latency_ms"]["p99"] else 0
+        print(
+            f"{result['scenario']:<10} log={result['log_records']:<7} c={result['concurrency']:<4} "
+            f"rps {before['rps']} -> {result['rps']} ({rps_change:+.1f}%)  "
+            f"p99 {before['latency_ms']['p99']} -> {result['latency_ms']['p99']}ms ({p99_change:+.1f}%)"
+        )
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+async def run(args):
+    for name, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(name, value)
+
+    runner, standin_state, server, server_task, base_url = await start_servers(args)
+    results = []
+    try:
+        for log_records in args.log_records:
+            results.extend(await run_log_size(args, log_records, base_url, standin_state))
+    finally:
+        server.should_exit = True
+        await server_task
+        await runner.cleanup()
+
+    report = {
+        "run": {
+            "started": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "options": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=lambda v: v.split(","), default=["completion", "stream", "feedback"],
+                        help=f"Comma-separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32], help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    parser.add_argument("--log-records", type=int_list, default=[0], help="Comma-separated sizes of the prefilled logs")
+    parser.add_argument("--distinct-questions", type=int, default=0,
+                        help="Ask from a pool of this many questions, with the response cache on (0 = every question is new, cache off)")
+    parser.add_argument("--openai-latency-ms", type=float, default=50)
+    parser.add_argument("--stream-delay-ms", type=float, default=5)
+    parser.add_argument("--answer-words", type=int, default=60)
+    parser.add_argument("--citations", type=int, default=3)
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Share of OpenAI requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--blob-latency-ms", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
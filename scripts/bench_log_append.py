@@ -0,0 +1,85 @@
+"""
+Append latency check for the JSONL log writer against a local blob emulator
+
+Start Azurite first (for example `docker run -p 10000:10000
+mcr.microsoft.com/azure-storage/azurite azurite-blob --blobHost 0.0.0.0`),
+then run:
+
+    python -m scripts.bench_log_append --records 100000
+
+The script appends evaluation-sized records one at a time and prints the
+latency percentiles for each window of records. With the append-blob writer
+the per-window latency stays flat as the log grows (including across the
+50,000-block rollover); the old download-and-reupload path grows linearly.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from azure.storage.blob.aio import BlobServiceClient
+
+from app.services.log_writer import AppendBlobLogWriter
+
+# Well-known Azurite development account
+AZURITE_CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;"
+)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    service = BlobServiceClient.from_connection_string(args.connection_string)
+    async with service:
+        container = service.get_container_client(args.container)
+        try:
+            await container.create_container()
+        except Exception:
+            pass
+
+        writer = AppendBlobLogWriter(container, f"bench-{uuid.uuid4().hex[:8]}.jsonl")
+        record = {
+            "response_id": "",
+            "user_chat_history": [{"role": "user", "content": "How do I file a warranty claim?"}],
+            "llm_response": "x" * 800,
+        }
+
+        window = []
+        medians = []
+        for i in range(1, args.records + 1):
+            record["response_id"] = str(i)
+            start = time.perf_counter()
+            await writer.append(record)
+            window.append((time.perf_counter() - start) * 1000)
+            if i % args.window == 0:
+                median = statistics.median(window)
+                medians.append(median)
+                print(
+                    f"records={i:>7} segment={writer.current_blob_name} "
+                    f"p50={median:.2f}ms p99={percentile(window, 99):.2f}ms"
+                )
+                window = []
+
+    if len(medians) > 1:
+        print(f"p50 growth first->last window: {medians[-1] / medians[0]:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connection-string", default=AZURITE_CONNECTION_STRING)
+    parser.add_argument("--container", default="bench-logs")
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--window", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
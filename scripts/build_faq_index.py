@@ -0,0 +1,92 @@
+"""
+Build the FAQ answer index used by the chat fast path
+
+    python -m scripts.build_faq_index                       # sample-docs/*faq*.md -> FAQ_INDEX_PATH, offline
+    python -m scripts.build_faq_index --embedder azure_openai
+
+Every heading that ends with a question mark becomes an entry, with the text
+below it as the curated answer. The default `hashing` embedder needs no
+network access; `azure_openai` uses AZURE_OPENAI_EMBEDDING_DEPLOYMENT with
+DefaultAzureCredential, and the app then embeds each question once to match
+it. Rebuild the index whenever the FAQ documents change, and restart the app
+to load it.
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import time
+
+from app.services.embeddings import AzureOpenAIEmbedder, HashingEmbedder
+from app.services.faq_index import parse_faq
+from app.services.local_index import LocalVectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+def read_entries(pattern: str):
+    entries = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            entries.extend(parse_faq(f, os.path.basename(path)))
+    return entries
+
+
+async def embed_questions(embedder, entries, batch_size: int):
+    import numpy as np
+
+    batches = []
+    for start in range(0, len(entries), batch_size):
+        batches.append(await embedder.embed([entry.title for entry in entries[start:start + batch_size]]))
+    return np.concatenate(batches) if batches else np.zeros((0, embedder.dimensions or 0), dtype=np.float32)
+
+
+async def run(args):
+    from app.config import settings
+
+    output = args.output or settings.faq_index_path
+    start = time.perf_counter()
+    entries = read_entries(args.docs)
+    if not entries:
+        raise SystemExit(f"No FAQ entries (headings ending with '?') found in {args.docs}")
+
+    if args.embedder == HashingEmbedder.name:
+        embeddings = await embed_questions(HashingEmbedder(args.dimensions), entries, args.batch_size)
+    else:
+        from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+        from openai import AsyncAzureOpenAI
+
+        from app.services.resources import COGNITIVE_SERVICES_SCOPE
+
+        async with DefaultAzureCredential() as credential:
+            async with AsyncAzureOpenAI(
+                azure_endpoint=settings.azure_openai_endpoint,
+                azure_ad_token_provider=get_bearer_token_provider(credential, COGNITIVE_SERVICES_SCOPE),
+                api_version="2024-10-21",
+            ) as client:
+                embedder = AzureOpenAIEmbedder(client, settings.azure_openai_embedding_deployment)
+                embeddings = await embed_questions(embedder, entries, args.batch_size)
+
+    index = LocalVectorIndex.write(output, entries, embeddings, args.embedder)
+    print(
+        f"Indexed {len(index)} FAQ entries from {args.docs} into {output} "
+        f"({index.meta['dimensions']} dimensions, version {index.version}) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", default="sample-docs/*faq*.md", help="Glob pattern of the FAQ markdown documents")
+    parser.add_argument("--output", help="Index directory. Defaults to FAQ_INDEX_PATH.")
+    parser.add_argument("--embedder", choices=[HashingEmbedder.name, AzureOpenAIEmbedder.name], default=HashingEmbedder.name)
+    parser.add_argument("--dimensions", type=int, default=512, help="Dimensions of the hashing embedder")
+    parser.add_argument("--batch-size", type=int, default=16, help="Questions per embedding request")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Build the in-process retrieval index from markdown documents
+
+    python -m scripts.build_local_index                      # sample-docs/ -> LOCAL_INDEX_PATH, offline
+    python -m scripts.build_local_index --embedder azure_openai
+
+The default `hashing` embedder needs no network access. `azure_openai` uses
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT with DefaultAzureCredential. Run the app with
+RETRIEVER_BACKEND=local to answer from the index.
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import time
+
+from app.services.chunking import chunk_markdown
+from app.services.embedding_cache import CachedEmbedder, EmbeddingCache
+from app.services.embeddings import AzureOpenAIEmbedder, HashingEmbedder
+from app.services.history_packer import load_encoding
+from app.services.local_index import LocalVectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+def read_chunks(docs_dir: str, max_tokens: int):
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(docs_dir, "*.md"))):
+        # The README describes the sample documents; it is not one of them
+        if os.path.basename(path).lower() == "readme.md":
+            continue
+        with open(path, encoding="utf-8") as f:
+            chunks.extend(chunk_markdown(f, os.path.basename(path), max_tokens))
+    return chunks
+
+
+async def embed_chunks(embedder, chunks, batch_size: int):
+    import numpy as np
+
+    batches = []
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        batches.append(await embedder.embed([f"{c.title}\n{c.content}" for c in batch]))
+    return np.concatenate(batches) if batches else np.zeros((0, embedder.dimensions or 0), dtype=np.float32)
+
+
+async def run(args):
+    from app.config import settings
+
+    output = args.output or settings.local_index_path
+    start = time.perf_counter()
+    chunks = read_chunks(args.docs, args.max_chunk_tokens)
+
+    if args.embedder == HashingEmbedder.name:
+        embeddings = await embed_chunks(HashingEmbedder(args.dimensions), chunks, args.batch_size)
+    else:
+        from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+        from openai import AsyncAzureOpenAI
+
+        from app.services.resources import COGNITIVE_SERVICES_SCOPE
+
+        async with DefaultAzureCredential() as credential:
+            async with AsyncAzureOpenAI(
+                azure_endpoint=settings.azure_openai_endpoint,
+                azure_ad_token_provider=get_bearer_token_provider(credential, COGNITIVE_SERVICES_SCOPE),
+                api_version="2024-10-21",
+            ) as client:
+                embedder = AzureOpenAIEmbedder(client, settings.azure_openai_embedding_deployment)
+                if settings.embedding_cache_enabled and not args.no_embedding_cache:
+                    cache = EmbeddingCache(settings.embedding_cache_path, settings.embedding_cache_max_entries)
+                    embedder = CachedEmbedder(embedder, cache)
+                embeddings = await embed_chunks(embedder, chunks, args.batch_size)
+
+    index = LocalVectorIndex.write(output, chunks, embeddings, args.embedder)
+    print(
+        f"Indexed {len(index)} chunks from {args.docs} into {output} "
+        f"({index.meta['dimensions']} dimensions, version {index.version}) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", default="sample-docs", help="Directory of markdown documents")
+    parser.add_argument("--output", help="Index directory. Defaults to LOCAL_INDEX_PATH.")
+    parser.add_argument("--embedder", choices=[HashingEmbedder.name, AzureOpenAIEmbedder.name], default=HashingEmbedder.name)
+    parser.add_argument("--dimensions", type=int, default=512, help="Dimensions of the hashing embedder")
+    parser.add_argument("--max-chunk-tokens", type=int, default=400)
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Do not use the shared embedding cache")
+    parser.add_argument("--batch-size", type=int, default=16, help="Chunks per embedding request")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # Chunk boundaries depend on exact token counts
+    load_encoding()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Shared helpers for the command-line tools
+"""
+import argparse
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from azure.identity.aio import DefaultAzureCredential
+from azure.storage.blob.aio import BlobServiceClient, ContainerClient
+
+
+def add_storage_arguments(parser: argparse.ArgumentParser):
+    """Add the options that select the storage account and container"""
+    parser.add_argument(
+        "--connection-string",
+        help="Storage connection string (e.g. for Azurite). Defaults to AZURE_BLOB_ACCOUNT_URL with DefaultAzureCredential.",
+    )
+    parser.add_argument("--container", help="Container name. Defaults to AZURE_BLOB_CONTAINER.")
+
+
+@asynccontextmanager
+async def open_container(args: argparse.Namespace) -> AsyncIterator[ContainerClient]:
+    """Open the container selected on the command line and close it afterwards"""
+    from app.config import settings
+
+    container_name = args.container or settings.azure_blob_container
+    if args.connection_string:
+        async with BlobServiceClient.from_connection_string(args.connection_string) as service:
+            yield service.get_container_client(container_name)
+        return
+    async with DefaultAzureCredential() as credential:
+        async with BlobServiceClient(settings.azure_blob_account_url, credential=credential) as service:
+            yield service.get_container_client(container_name)
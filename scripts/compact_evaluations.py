@@ -0,0 +1,112 @@
+"""
+Compact closed hourly evaluation partitions into columnar files
+
+The app writes evaluation records to one JSONL blob per hour and worker
+(`evaluation/yyyy/mm/dd/hh-<worker>.jsonl`). Once an hour has ended (plus a
+grace period for the telemetry writer's last flush), this command merges
+all of that hour's blobs, joins in the latest feedback, and writes one
+compressed columnar file with chat messages and citations deduplicated by
+hash (`evaluation-columnar/yyyy/mm/dd/hh.zip`):
+
+    python -m scripts.compact_evaluations
+    python -m scripts.compact_evaluations --force          # recompact, e.g. to pick up late feedback
+    python -m scripts.compact_evaluations --delete-source  # drop the JSONL once compacted
+
+Hours that already have a columnar file are skipped unless `--force` is
+given. Query the result with `python -m scripts.query_evaluations`.
+"""
+import argparse
+import asyncio
+import calendar
+import logging
+import time
+
+from app.services.evaluation_columnar import columnar_blob_name, columnar_hour, encode_columnar
+from app.services.feedback_join import apply_feedback, build_feedback_index
+from app.services.log_writer import encode_jsonl, iter_blob_records, iter_log_records, list_partitions
+from scripts.common import add_storage_arguments, open_container
+
+logger = logging.getLogger(__name__)
+
+
+def hour_end(hour: str) -> float:
+    """Epoch seconds at which the "yyyy/mm/dd/hh" partition closes"""
+    return calendar.timegm(time.strptime(hour, "%Y/%m/%d/%H")) + 3600
+
+
+async def run(args):
+    from app.config import settings
+
+    prefix = args.evaluation_prefix or settings.azure_evaluation_prefix
+    columnar_prefix = args.columnar_prefix or settings.azure_evaluation_columnar_prefix
+    feedback_blob = args.feedback_blob or settings.azure_blob_feedback_blob
+    closed_before = time.time() - args.grace_minutes * 60
+    start = time.perf_counter()
+    totals = {"hours": 0, "records": 0, "jsonl_bytes": 0, "columnar_bytes": 0}
+
+    async with open_container(args) as container:
+        compacted = set()
+        async for blob in container.list_blobs(name_starts_with=columnar_prefix + "/"):
+            hour = columnar_hour(columnar_prefix, blob.name)
+            if hour:
+                compacted.add(hour)
+
+        feedback_index = await build_feedback_index(iter_log_records(container, feedback_blob))
+        for hour, blob_names in await list_partitions(container, prefix):
+            if hour_end(hour) > closed_before:
+                logger.info(f"Skipping {hour}: still open")
+                continue
+            if hour in compacted and not args.force:
+                continue
+
+            records = []
+            for blob_name in blob_names:
+                async for record in iter_blob_records(container, blob_name):
+                    feedback = feedback_index.get(record.get("response_id"))
+                    records.append(apply_feedback(record, feedback) if feedback else record)
+            records.sort(key=lambda r: str(r.get("timestamp") or ""))
+
+            data = encode_columnar(records, hour)
+            await container.get_blob_client(columnar_blob_name(columnar_prefix, hour)).upload_blob(data, overwrite=True)
+            jsonl_bytes = sum(len(line) for line in encode_jsonl(records))
+            print(
+                f"{hour}: {len(records)} records from {len(blob_names)} blobs, "
+                f"{jsonl_bytes / 1024:.0f} KiB JSONL -> {len(data) / 1024:.0f} KiB columnar "
+                f"({jsonl_bytes / max(len(data), 1):.1f}x)"
+            )
+            if args.delete_source:
+                for blob_name in blob_names:
+                    await container.get_blob_client(blob_name).delete_blob()
+
+            totals["hours"] += 1
+            totals["records"] += len(records)
+            totals["jsonl_bytes"] += jsonl_bytes
+            totals["columnar_bytes"] += len(data)
+
+    print(
+        f"Compacted {totals['hours']} hours, {totals['records']} records, "
+        f"{totals['jsonl_bytes'] / 2**20:.1f} MiB -> {totals['columnar_bytes'] / 2**20:.1f} MiB "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_storage_arguments(parser)
+    parser.add_argument("--evaluation-prefix", help="Defaults to AZURE_EVALUATION_PREFIX")
+    parser.add_argument("--columnar-prefix", help="Defaults to AZURE_EVALUATION_COLUMNAR_PREFIX")
+    parser.add_argument("--feedback-blob", help="Defaults to AZURE_BLOB_FEEDBACK_BLOB")
+    parser.add_argument("--grace-minutes", type=float, default=10, help="Wait this long after an hour ends")
+    parser.add_argument("--force", action="store_true", help="Recompact hours that already have a columnar file")
+    parser.add_argument(
+        "--delete-source",
+        action="store_true",
+        help="Delete the JSONL blobs of compacted hours (readers use the columnar file instead)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
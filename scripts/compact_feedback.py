@@ -0,0 +1,75 @@
+"""
+Merge feedback events into evaluation records offline
+
+Feedback is logged as append-only events keyed by response_id. This command
+hash-joins the feedback log into the evaluation log and writes the merged
+records, so analysts get one record per answer with its latest feedback:
+
+    python -m scripts.compact_feedback                   # upload to AZURE_EVALUATION_MERGED_BLOB
+    python -m scripts.compact_feedback --output merged.jsonl
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from app.services.feedback_join import build_feedback_index, iter_evaluation_records, merge_feedback
+from app.services.log_writer import encode_jsonl, iter_log_records
+from scripts.common import add_storage_arguments, open_container
+
+logger = logging.getLogger(__name__)
+
+
+async def run(args):
+    from app.config import settings
+
+    evaluation_blob = args.evaluation_blob or settings.azure_evaluation_blob
+    evaluation_prefix = args.evaluation_prefix or settings.azure_evaluation_prefix
+    columnar_prefix = args.columnar_prefix or settings.azure_evaluation_columnar_prefix
+    feedback_blob = args.feedback_blob or settings.azure_blob_feedback_blob
+    output_blob = args.output_blob or settings.azure_evaluation_merged_blob
+    start = time.perf_counter()
+    counts = {"records": 0, "with_feedback": 0}
+
+    async with open_container(args) as container:
+        feedback_index = await build_feedback_index(iter_log_records(container, feedback_blob))
+
+        async def merged_lines():
+            async for record in merge_feedback(
+                iter_evaluation_records(container, evaluation_blob, evaluation_prefix, columnar_prefix=columnar_prefix),
+                feedback_index,
+            ):
+                counts["records"] += 1
+                if "feedback" in record:
+                    counts["with_feedback"] += 1
+                yield encode_jsonl([record])[0]
+
+        if args.output:
+            with open(args.output, "wb") as f:
+                async for line in merged_lines():
+                    f.write(line)
+        else:
+            await container.get_blob_client(output_blob).upload_blob(merged_lines(), overwrite=True)
+
+    print(
+        f"Merged {len(feedback_index)} feedback events into {counts['records']} evaluation records "
+        f"({counts['with_feedback']} with feedback) in {time.perf_counter() - start:.1f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_storage_arguments(parser)
+    parser.add_argument("--evaluation-blob", help="Defaults to AZURE_EVALUATION_BLOB")
+    parser.add_argument("--evaluation-prefix", help="Hourly partitions to include. Defaults to AZURE_EVALUATION_PREFIX")
+    parser.add_argument("--columnar-prefix", help="Compacted hours to include. Defaults to AZURE_EVALUATION_COLUMNAR_PREFIX")
+    parser.add_argument("--feedback-blob", help="Defaults to AZURE_BLOB_FEEDBACK_BLOB")
+    parser.add_argument("--output-blob", help="Defaults to AZURE_EVALUATION_MERGED_BLOB")
+    parser.add_argument("--output", help="Write merged JSONL to a local file instead of blob storage")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
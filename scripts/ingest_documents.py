@@ -0,0 +1,124 @@
+"""
+Ingest markdown documents into the Azure AI Search index
+
+Chunks the documents, embeds changed chunks with the Azure OpenAI embedding
+deployment and uploads them in bulk. Unchanged chunks are skipped using the
+content hashes in the manifest, so re-running after editing a few files only
+re-embeds those chunks:
+
+    python -m scripts.ingest_documents sample-docs
+    python -m scripts.ingest_documents docs/ --embed-concurrency 8 --upload-batch-size 1000
+
+Authenticates with DefaultAzureCredential unless API keys are given (for
+example to run against `python -m scripts.standin_server`). Prints docs/sec,
+chunks/sec and tokens/sec as JSON at the end.
+"""
+import argparse
+import asyncio
+import json
+import logging
+from contextlib import AsyncExitStack
+
+from app.services.embedding_cache import CachedEmbedder, EmbeddingCache
+from app.services.embeddings import AzureOpenAIEmbedder, HashingEmbedder
+from app.services.history_packer import load_encoding
+from app.services.ingestion import DocumentIngestor, IngestionManifest
+
+logger = logging.getLogger(__name__)
+
+
+async def run(args):
+    from azure.core.credentials import AzureKeyCredential
+    from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+    from azure.search.documents.aio import SearchClient
+    from openai import AsyncAzureOpenAI
+
+    from app.config import settings
+    from app.services.resources import COGNITIVE_SERVICES_SCOPE
+
+    index_name = args.index or settings.azure_search_index_name
+    deployment = args.embedding_deployment or settings.azure_openai_embedding_deployment
+
+    async with AsyncExitStack() as stack:
+        credential = None
+        if not (args.openai_api_key and args.search_api_key):
+            credential = await stack.enter_async_context(DefaultAzureCredential())
+
+        if args.embedder == HashingEmbedder.name:
+            embedder = HashingEmbedder(args.dimensions)
+        else:
+            if args.openai_api_key:
+                auth = {"api_key": args.openai_api_key}
+            else:
+                auth = {"azure_ad_token_provider": get_bearer_token_provider(credential, COGNITIVE_SERVICES_SCOPE)}
+            openai_client = await stack.enter_async_context(AsyncAzureOpenAI(
+                azure_endpoint=args.openai_endpoint or settings.azure_openai_endpoint,
+                api_version="2024-10-21",
+                max_retries=args.max_retries,
+                **auth,
+            ))
+            embedder = AzureOpenAIEmbedder(openai_client, deployment)
+            if settings.embedding_cache_enabled and not args.no_embedding_cache:
+                cache = EmbeddingCache(settings.embedding_cache_path, settings.embedding_cache_max_entries)
+                embedder = CachedEmbedder(embedder, cache)
+
+        search_client = await stack.enter_async_context(SearchClient(
+            endpoint=args.search_endpoint or settings.azure_search_service_url,
+            index_name=index_name,
+            credential=AzureKeyCredential(args.search_api_key) if args.search_api_key else credential,
+        ))
+
+        ingestor = DocumentIngestor(
+            embedder,
+            search_client,
+            IngestionManifest(args.manifest or f"data/ingest-manifest.{index_name}.json"),
+            embedding_model=embedder.model,
+            max_chunk_tokens=args.max_chunk_tokens,
+            embed_batch_size=args.embed_batch_size,
+            embed_batch_tokens=args.embed_batch_tokens,
+            embed_concurrency=args.embed_concurrency,
+            upload_batch_size=args.upload_batch_size,
+            max_retries=args.max_retries,
+        )
+        summary = await ingestor.ingest(args.paths)
+        if isinstance(embedder, CachedEmbedder):
+            summary["embedding_cache"] = embedder.cache.stats()
+    print(json.dumps(summary, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Markdown files or directories")
+    parser.add_argument("--index", help="Search index. Defaults to AZURE_SEARCH_INDEX_NAME.")
+    parser.add_argument("--manifest", help="Manifest file. Defaults to data/ingest-manifest.<index>.json.")
+    parser.add_argument("--embedding-deployment", help="Defaults to AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+    parser.add_argument(
+        "--embedder",
+        choices=[AzureOpenAIEmbedder.name, HashingEmbedder.name],
+        default=AzureOpenAIEmbedder.name,
+        help="hashing embeds offline (for testing the pipeline only)",
+    )
+    parser.add_argument("--dimensions", type=int, default=1536, help="Dimensions of the hashing embedder")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Do not use the shared embedding cache")
+    parser.add_argument("--max-chunk-tokens", type=int, default=400)
+    parser.add_argument("--embed-batch-size", type=int, default=64, help="Max chunks per embedding request")
+    parser.add_argument("--embed-batch-tokens", type=int, default=32000, help="Max tokens per embedding request")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--upload-batch-size", type=int, default=500, help="Documents per index upload")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--openai-endpoint", help="Defaults to AZURE_OPENAI_ENDPOINT")
+    parser.add_argument("--openai-api-key", help="Use a key instead of DefaultAzureCredential")
+    parser.add_argument("--search-endpoint", help="Defaults to AZURE_SEARCH_SERVICE_URL")
+    parser.add_argument("--search-api-key", help="Use a key instead of DefaultAzureCredential")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # Per-request HTTP logging from the Azure SDK and openai drowns out the progress
+    logging.getLogger("azure").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Chunk boundaries depend on exact token counts
+    load_encoding()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
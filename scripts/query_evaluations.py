@@ -0,0 +1,187 @@
+"""
+Query compacted evaluation records with filters pushed down to storage
+
+    python -m scripts.query_evaluations --from 2024-05-01 --to 2024-05-07 --feedback thumb_down
+    python -m scripts.query_evaluations --intent warranty --fields response_id,llm_response --limit 20
+    python -m scripts.query_evaluations --from 2024-05-01T09:00 --count --include-open
+
+Filters are applied as early as possible:
+
+1. date range: only the hourly files in the range are listed and downloaded
+2. intent and feedback: files whose `meta.json` has no matching value are skipped
+3. within a file, only the filter columns are decompressed to find matching
+   rows; the other columns, chat histories and citations are loaded only for
+   those rows (and only the `--fields` asked for)
+
+Matching records are printed as JSONL. With `--include-open`, hours that
+have not been compacted yet are read from their JSONL blobs too.
+"""
+import argparse
+import asyncio
+import calendar
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.services.evaluation_columnar import ColumnarFile, columnar_blob_name, columnar_hour
+from app.services.log_writer import iter_blob_records, list_partitions
+from scripts.common import add_storage_arguments, open_container
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def parse_time(value: Optional[str]) -> Optional[str]:
+    """Normalize a date or datetime (UTC) to the evaluation record timestamp format"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime(TIMESTAMP_FORMAT)
+
+
+class Query:
+    def __init__(self, args):
+        self.start = parse_time(args.start)
+        # A bare date as the end of the range means the whole day
+        self.end = parse_time(args.end + "T23:59:59" if args.end and "T" not in args.end else args.end)
+        self.intent = args.intent.lower() if args.intent else None
+        self.feedback = args.feedback
+        self.fields = args.fields.split(",") if args.fields else None
+
+    def wants_hour(self, hour: str) -> bool:
+        # Records are partitioned by write time, up to one telemetry flush after their
+        # timestamp, so keep the hour after the range as well
+        hour_start = calendar.timegm(time.strptime(hour, "%Y/%m/%d/%H"))
+        if self.start and time.strftime(TIMESTAMP_FORMAT, time.gmtime(hour_start + 3599)) < self.start:
+            return False
+        if self.end and time.strftime(TIMESTAMP_FORMAT, time.gmtime(hour_start - 3600)) > self.end:
+            return False
+        return True
+
+    def wants_file(self, meta: dict) -> bool:
+        if self.intent and not any(self.intent in intent.lower() for intent in meta["intents"]):
+            return False
+        if self.feedback == "none":
+            return True
+        if self.feedback and self.feedback not in meta["feedback"]:
+            return False
+        return True
+
+    def matches(self, timestamp, intent, feedback) -> bool:
+        if self.start and (timestamp or "") < self.start:
+            return False
+        if self.end and (timestamp or "") > self.end:
+            return False
+        if self.intent and self.intent not in str(intent or "").lower():
+            return False
+        if self.feedback == "none":
+            return not feedback
+        return not self.feedback or feedback == self.feedback
+
+    def matching_rows(self, columnar: ColumnarFile):
+        # Only the filter columns are decompressed here
+        timestamps = columnar.column("timestamp")
+        intents = columnar.column("detected_intent") if self.intent else [None] * len(columnar)
+        feedback = columnar.column("feedback") if self.feedback else [None] * len(columnar)
+        return [row for row in range(len(columnar)) if self.matches(timestamps[row], intents[row], feedback[row])]
+
+    def project(self, record: dict) -> dict:
+        return {name: record.get(name) for name in self.fields} if self.fields else record
+
+
+def list_prefix(prefix: str, start: Optional[str], end: Optional[str]) -> str:
+    """Narrow the blob listing to the year, month or day shared by the whole range"""
+    if not start or not end:
+        return prefix + "/"
+    common = ""
+    for length in (4, 7, 10):
+        if start[:length] != end[:length]:
+            break
+        common = start[:length].replace("-", "/") + "/"
+    return f"{prefix}/{common}"
+
+
+async def run(args):
+    from app.config import settings
+
+    query = Query(args)
+    columnar_prefix = args.columnar_prefix or settings.azure_evaluation_columnar_prefix
+    stats = {"files_listed": 0, "files_skipped": 0, "files_read": 0, "rows_scanned": 0, "matched": 0}
+    out = sys.stdout
+
+    def emit(record) -> bool:
+        stats["matched"] += 1
+        if not args.count:
+            out.write(json.dumps(query.project(record), default=str) + "\n")
+        return args.limit is not None and stats["matched"] >= args.limit
+
+    async with open_container(args) as container:
+        compacted = []
+        async for blob in container.list_blobs(name_starts_with=list_prefix(columnar_prefix, query.start, query.end)):
+            hour = columnar_hour(columnar_prefix, blob.name)
+            if hour and query.wants_hour(hour):
+                compacted.append(hour)
+        compacted.sort()
+        stats["files_listed"] = len(compacted)
+
+        done = False
+        for hour in compacted:
+            downloader = await container.get_blob_client(columnar_blob_name(columnar_prefix, hour)).download_blob()
+            columnar = ColumnarFile(await downloader.readall())
+            if not query.wants_file(columnar.meta):
+                stats["files_skipped"] += 1
+                continue
+            stats["files_read"] += 1
+            stats["rows_scanned"] += len(columnar)
+            rows = query.matching_rows(columnar)
+            for record in columnar.records(rows, query.fields):
+                if emit(record):
+                    done = True
+                    break
+            if done:
+                break
+
+        if args.include_open and not done:
+            prefix = args.evaluation_prefix or settings.azure_evaluation_prefix
+            for hour, blob_names in await list_partitions(container, prefix):
+                if hour in compacted or not query.wants_hour(hour):
+                    continue
+                for blob_name in blob_names:
+                    async for record in iter_blob_records(container, blob_name):
+                        stats["rows_scanned"] += 1
+                        if query.matches(record.get("timestamp"), record.get("detected_intent"), record.get("feedback")):
+                            if emit(record):
+                                done = True
+                                break
+                    if done:
+                        break
+                if done:
+                    break
+
+    if args.count:
+        print(stats["matched"])
+    print(json.dumps(stats), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_storage_arguments(parser)
+    parser.add_argument("--columnar-prefix", help="Defaults to AZURE_EVALUATION_COLUMNAR_PREFIX")
+    parser.add_argument("--evaluation-prefix", help="JSONL partitions for --include-open. Defaults to AZURE_EVALUATION_PREFIX")
+    parser.add_argument("--from", dest="start", help="UTC date or datetime, e.g. 2024-05-01 or 2024-05-01T09:00")
+    parser.add_argument("--to", dest="end", help="UTC date (inclusive) or datetime")
+    parser.add_argument("--intent", help="Case-insensitive substring of the detected intent")
+    parser.add_argument("--feedback", choices=["thumb_up", "thumb_down", "none"])
+    parser.add_argument("--fields", help="Comma-separated fields to output (default: all)")
+    parser.add_argument("--limit", type=int, help="Stop after this many matches")
+    parser.add_argument("--count", action="store_true", help="Print only the number of matches")
+    parser.add_argument("--include-open", action="store_true", help="Also scan hours that are not compacted yet")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
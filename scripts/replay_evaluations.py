@@ -0,0 +1,385 @@
+"""
+Replay logged conversations against the current prompt and deployment
+
+    python -m scripts.replay_evaluations --output replay.jsonl
+    python -m scripts.query_evaluations --feedback thumb_down > disliked.jsonl
+    python -m scripts.replay_evaluations --input disliked.jsonl --system-prompt "..." --output replay.jsonl
+    python -m scripts.replay_evaluations --input disliked.jsonl --standin --output replay.jsonl
+
+Every evaluation record is answered again through
+`RagChatService.get_chat_completion`, the same code path as the chat
+endpoint, with the settings of this run (`--deployment`, `--endpoint` and
+`--system-prompt` override them). Records are read from a JSONL file (e.g. the
+output of `scripts.query_evaluations`, `-` for stdin) or streamed from the
+evaluation log with the latest feedback merged, so `grounded_answer` is
+available for disliked answers. Earlier turns of a session are rebuilt from
+the session's previous records in the log.
+
+Replays run `--concurrency` at a time. Azure OpenAI rate limits are handled
+by the app's own throttling: 429s are retried after their Retry-After, and
+`--rpm`/`--tpm` pace requests below the deployment's quota. The response cache
+and the FAQ fast path are off (unless `--faq-fast-path` is given), so every
+record reaches the model.
+
+One result line per record is appended to `--output` as soon as it is done.
+The output file is also the checkpoint: run the same command again to resume,
+and records that already have a successful result are skipped. At the end the
+runner prints (and with `--report` writes) throughput, the replay and logged
+latency distributions, and how answers and citations differ from the logged
+run.
+
+With `--standin` everything runs locally: the Azure OpenAI stand-in
+(`scripts.standin_server`) is started in this process and no Azure resources
+or credentials are needed.
+"""
+import argparse
+import asyncio
+import difflib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CITATION_MARKER = re.compile(r"\s*\[doc\d+\]")
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """response_ids that already have a successful result in the output file"""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short when the previous run was interrupted
+                continue
+            if not result.get("error"):
+                done.add(result["response_id"])
+    return done
+
+
+async def iter_file_records(path: str) -> AsyncIterator[dict]:
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+async def iter_log_records_with_feedback(args) -> AsyncIterator[dict]:
+    """The evaluation log, oldest first, with the latest feedback of each answer merged"""
+    from app.config import settings
+    from app.services.feedback_join import build_feedback_index, iter_evaluation_records, merge_feedback
+    from app.services.log_writer import iter_log_records
+    from scripts.common import open_container
+
+    async with open_container(args) as container:
+        feedback_index = await build_feedback_index(iter_log_records(container, settings.azure_blob_feedback_blob))
+        prefix = settings.azure_evaluation_prefix if settings.evaluation_log_layout == "hourly" else None
+        records = iter_evaluation_records(
+            container, settings.azure_evaluation_blob, prefix, columnar_prefix=settings.azure_evaluation_columnar_prefix
+        )
+        async for record in merge_feedback(records, feedback_index):
+            yield record
+
+
+class Conversations:
+    """Rebuilds the full history of session turns, which only log their new messages"""
+
+    def __init__(self):
+        self.sessions: Dict[str, List[dict]] = {}
+
+    def history(self, record: dict) -> Optional[List[dict]]:
+        """The messages to answer, or None if earlier turns of the session are missing"""
+        new_messages = [{"role": m["role"], "content": m["content"]} for m in record.get("user_chat_history") or []]
+        session_id = record.get("session_id")
+        if not session_id:
+            return new_messages
+        earlier = self.sessions.get(session_id, []) if record.get("history_offset") else []
+        complete = len(earlier) == (record.get("history_offset") or 0)
+        messages = earlier + new_messages
+        if record.get("llm_response"):
+            self.sessions[session_id] = messages + [{"role": "assistant", "content": record["llm_response"]}]
+        return messages if complete else None
+
+
+def citation_keys(citations) -> List[str]:
+    # Chunk ids change when the index is rebuilt; the source document does not
+    return [c.get("filepath") or c.get("title") or "" for c in citations or []]
+
+
+def answer_similarity(a: str, b: str) -> float:
+    """Word-level similarity (0-1) of two answers, ignoring [docN] markers"""
+    words_a = CITATION_MARKER.sub("", a or "").split()
+    words_b = CITATION_MARKER.sub("", b or "").split()
+    if not words_a and not words_b:
+        return 1.0
+    return round(difflib.SequenceMatcher(None, words_a, words_b, autojunk=False).ratio(), 3)
+
+
+def compare(record: dict, answer: str, citations: list) -> dict:
+    """How the replayed answer differs from the logged one (and from the user's grounded answer)"""
+    logged = set(citation_keys(record.get("ai_search_results")))
+    replayed = set(citation_keys(citations))
+    diff = {
+        "answer_similarity": answer_similarity(record.get("llm_response", ""), answer),
+        "citations_added": sorted(replayed - logged),
+        "citations_removed": sorted(logged - replayed),
+        "citation_overlap": round(len(logged & replayed) / len(logged | replayed), 3) if logged or replayed else 1.0,
+    }
+    if record.get("grounded_answer"):
+        diff["grounded_similarity_logged"] = answer_similarity(record["grounded_answer"], record.get("llm_response", ""))
+        diff["grounded_similarity_replay"] = answer_similarity(record["grounded_answer"], answer)
+    return diff
+
+
+async def replay_one(rag_chat_service, record: dict, history: List[dict], timeout: float) -> dict:
+    from app.models.chat_models import ChatMessage
+
+    result = {
+        "response_id": record.get("response_id"),
+        "session_id": record.get("session_id"),
+        "question": next((m["content"] for m in reversed(history) if m["role"] == "user"), ""),
+        "feedback": record.get("feedback"),
+        "logged_outcome": record.get("outcome", "completed"),
+        "logged_latency_ms": record.get("response_time_ms"),
+        "logged_answer": record.get("llm_response", ""),
+    }
+    metadata = {}
+    start = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(
+            rag_chat_service.get_chat_completion([ChatMessage(**m) for m in history], metadata), timeout
+        )
+    except Exception as e:
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    choice = response["choices"][0] if response.get("choices") else {}
+    message = choice.get("message") or {}
+    citations = (message.get("context") or {}).get("citations", [])
+    result.update({
+        "answer": message.get("content") or "",
+        "finish_reason": choice.get("finish_reason"),
+        "citations": citation_keys(citations),
+        "backend": metadata.get("backend", ""),
+        "fast_path": metadata.get("fast_path", ""),
+        "input_tokens": metadata.get("input_tokens"),
+        "output_tokens": metadata.get("output_tokens"),
+    })
+    result.update(compare(record, result["answer"], citations))
+    return result
+
+
+def summarize_diffs(path: str) -> dict:
+    """Answer and citation differences over every successful result in the output file"""
+    latest: Dict[str, dict] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not result.get("error"):
+                latest[result["response_id"]] = result
+    results = list(latest.values())
+    if not results:
+        return {"results": 0}
+
+    def mean(values):
+        values = [v for v in values if v is not None]
+        return round(sum(values) / len(values), 3) if values else None
+
+    grounded = [r for r in results if "grounded_similarity_replay" in r]
+    return {
+        "results": len(results),
+        "answer_similarity_mean": mean(r["answer_similarity"] for r in results),
+        "answers_unchanged": sum(1 for r in results if r["answer_similarity"] == 1.0),
+        "citation_overlap_mean": mean(r["citation_overlap"] for r in results),
+        "citations_changed": sum(1 for r in results if r["citations_added"] or r["citations_removed"]),
+        "with_grounded_answer": len(grounded),
+        "grounded_similarity_logged_mean": mean(r["grounded_similarity_logged"] for r in grounded),
+        "grounded_similarity_replay_mean": mean(r["grounded_similarity_replay"] for r in grounded),
+    }
+
+
+async def start_standin(args):
+    from aiohttp import web
+
+    from scripts.standin_server import build_parser, create_app
+
+    standin = create_app(build_parser().parse_args([
+        "--latency-ms", str(args.standin_latency_ms),
+        "--throttle-rate", str(args.standin_throttle_rate),
+        "--retry-after", "0.1",
+    ]))
+    runner = web.AppRunner(standin, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+
+async def run(args):
+    from scripts.bench_load import PLACEHOLDER_ENV, StaticTokenCredential, summarize
+
+    if args.standin:
+        for name, value in PLACEHOLDER_ENV.items():
+            os.environ.setdefault(name, value)
+    from app.config import settings
+    from app.services.resources import AppResources
+    from scripts.standin_blob import MemoryContainerClient
+
+    standin_runner = None
+    credential = None
+    if args.standin:
+        standin_runner, args.endpoint = await start_standin(args)
+        settings.retriever_backend = "azure_search"
+        credential = StaticTokenCredential()
+    if args.endpoint:
+        settings.azure_openai_endpoint = args.endpoint
+        settings.azure_openai_backends = []
+    if args.deployment:
+        settings.azure_openai_gpt_deployment = args.deployment
+    if args.system_prompt:
+        settings.system_prompt = args.system_prompt
+    if args.rpm is not None:
+        settings.openai_rpm_limit = args.rpm
+    if args.tpm is not None:
+        settings.openai_tpm_limit = args.tpm
+    # Replays must reach the model, and must not be mistaken for answers to users
+    settings.response_cache_enabled = False
+    settings.faq_fast_path_enabled = args.faq_fast_path
+
+    done = load_checkpoint(args.output)
+    if done:
+        print(f"Resuming: {len(done)} records in {args.output} are already replayed", file=sys.stderr)
+
+    # Nothing is logged: the replayed answers only go to the output file
+    resources = AppResources(settings)
+    await resources.startup(credential=credential, container_client=MemoryContainerClient())
+    if resources.warmup_task:
+        await resources.warmup_task
+
+    stats = {"read": 0, "skipped": 0, "incomplete_session": 0, "replayed": 0, "failed": 0}
+    latencies: List[float] = []
+    logged_latencies: List[float] = []
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    started = time.perf_counter()
+
+    async def read():
+        conversations = Conversations()
+        records = iter_file_records(args.input) if args.input else iter_log_records_with_feedback(args)
+        async for record in records:
+            stats["read"] += 1
+            # Sessions are rebuilt from every record, including the ones already replayed
+            history = conversations.history(record)
+            if record.get("response_id") in done:
+                stats["skipped"] += 1
+            elif history is None:
+                stats["incomplete_session"] += 1
+            elif any(m["role"] == "user" for m in history):
+                await queue.put((record, history))
+            if args.limit and stats["read"] >= args.limit:
+                break
+
+    async def work(out):
+        while True:
+            record, history = await queue.get()
+            try:
+                result = await replay_one(resources.rag_chat_service, record, history, args.timeout)
+                out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+                if result.get("error"):
+                    stats["failed"] += 1
+                    logger.warning(f"Replay of {result['response_id']} failed: {result['error']}")
+                else:
+                    stats["replayed"] += 1
+                    latencies.append(result["latency_ms"])
+                    if result["logged_latency_ms"] is not None:
+                        logged_latencies.append(result["logged_latency_ms"])
+                finished = stats["replayed"] + stats["failed"]
+                if finished % args.progress_every == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"{finished} replayed ({finished / elapsed:.1f}/s), {stats['failed']} failed", file=sys.stderr)
+            finally:
+                queue.task_done()
+
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            workers = [asyncio.create_task(work(out)) for _ in range(args.concurrency)]
+            try:
+                await read()
+                await queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+    finally:
+        throttling = resources.router.stats()
+        await resources.shutdown()
+        if standin_runner:
+            await standin_runner.cleanup()
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "records": stats,
+        "seconds": round(elapsed, 2),
+        "throughput_per_second": round((stats["replayed"] + stats["failed"]) / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize(latencies),
+        "logged_latency_ms": summarize(logged_latencies),
+        "diffs": summarize_diffs(args.output),
+        "openai": throttling,
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    from scripts.common import add_storage_arguments
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_storage_arguments(parser)
+    parser.add_argument("--input", help="JSONL evaluation records ('-' for stdin) instead of the evaluation log")
+    parser.add_argument("--output", required=True, help="JSONL results, appended to; also the resume checkpoint")
+    parser.add_argument("--report", help="Also write the summary as JSON")
+    parser.add_argument("--concurrency", type=int, default=8, help="Replays in flight at a time")
+    parser.add_argument("--limit", type=int, help="Stop after reading this many records")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds per replay, including rate-limit waits")
+    parser.add_argument("--endpoint", help="Azure OpenAI endpoint. Defaults to AZURE_OPENAI_ENDPOINT.")
+    parser.add_argument("--deployment", help="Chat deployment. Defaults to AZURE_OPENAI_GPT_DEPLOYMENT.")
+    parser.add_argument("--system-prompt", help="Defaults to SYSTEM_PROMPT")
+    parser.add_argument("--rpm", type=int, help="Requests per minute to stay under. Defaults to OPENAI_RPM_LIMIT.")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute to stay under. Defaults to OPENAI_TPM_LIMIT.")
+    parser.add_argument(
+        "--faq-fast-path",
+        action="store_true",
+        help="Answer FAQ questions from the FAQ index as the app does, instead of sending every record to the model",
+    )
+    parser.add_argument("--progress-every", type=int, default=100, help="Print progress every N replays")
+    parser.add_argument("--standin", action="store_true", help="Replay against an in-process Azure OpenAI stand-in")
+    parser.add_argument("--standin-latency-ms", type=float, default=50)
+    parser.add_argument("--standin-throttle-rate", type=float, default=0, help="Share of stand-in requests answered with 429")
+    args = parser.parse_args()
+    if args.standin and not (args.input or args.connection_string):
+        parser.error("--standin needs --input or --connection-string (e.g. Azurite) to read the records from")
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
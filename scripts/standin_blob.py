@@ -0,0 +1,178 @@
+"""
+In-memory stand-in for an Azure Blob Storage container
+
+Implements the subset of the async `ContainerClient` / `BlobClient` API that
+the log writers and readers use (append blobs, chunked downloads, uploads,
+listing), with a configurable latency per call, so the telemetry and
+feedback paths can be benchmarked without a storage account or Azurite:
+
+    container = MemoryContainerClient(latency_ms=5)
+    writer = AppendBlobLogWriter(container, "evaluation.jsonl")
+
+Append blobs enforce the block limit the same way the service does, so
+segment rollover is exercised too.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import StorageErrorCode
+
+from app.services.log_writer import APPEND_BLOB_MAX_BLOCKS, encode_jsonl, segment_blob_name
+
+
+class _Blob:
+    def __init__(self, append: bool):
+        self.data = bytearray()
+        self.append = append
+        self.blocks = 0
+
+
+class _Properties:
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+
+class MemoryDownloader:
+    """Result of `download_blob`: the blob content, read whole or in chunks"""
+
+    def __init__(self, data: bytes, chunk_size: int):
+        self._data = data
+        self._chunk_size = chunk_size
+
+    async def readall(self) -> bytes:
+        return self._data
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        for start in range(0, len(self._data), self._chunk_size):
+            yield self._data[start:start + self._chunk_size]
+
+
+class MemoryBlobClient:
+    def __init__(self, container: "MemoryContainerClient", blob_name: str):
+        self.container = container
+        self.blob_name = blob_name
+
+    async def create_append_blob(self, if_none_match: Optional[str] = None):
+        await self.container.delay()
+        self.container.check_exists()
+        if if_none_match == "*" and self.blob_name in self.container.blobs:
+            raise ResourceExistsError(f"The blob {self.blob_name} already exists")
+        self.container.blobs[self.blob_name] = _Blob(append=True)
+
+    async def append_block(self, data: bytes, length: Optional[int] = None) -> dict:
+        await self.container.delay()
+        blob = self.container.blobs.get(self.blob_name)
+        if blob is None:
+            raise ResourceNotFoundError(f"The blob {self.blob_name} does not exist")
+        if not blob.append:
+            raise _storage_error(StorageErrorCode.INVALID_BLOB_TYPE, "The blob is not an append blob")
+        if blob.blocks >= self.container.max_blocks:
+            raise _storage_error(StorageErrorCode.BLOCK_COUNT_EXCEEDS_LIMIT, "The committed block count limit was reached")
+        blob.data += data
+        blob.blocks += 1
+        self.container.appends += 1
+        return {"blob_committed_block_count": blob.blocks}
+
+    async def download_blob(self) -> MemoryDownloader:
+        await self.container.delay()
+        blob = self.container.blobs.get(self.blob_name)
+        if blob is None:
+            raise ResourceNotFoundError(f"The blob {self.blob_name} does not exist")
+        self.container.downloads += 1
+        return MemoryDownloader(bytes(blob.data), self.container.chunk_size)
+
+    async def upload_blob(self, data, overwrite: bool = False, **kwargs):
+        await self.container.delay()
+        self.container.check_exists()
+        if not overwrite and self.blob_name in self.container.blobs:
+            raise ResourceExistsError(f"The blob {self.blob_name} already exists")
+        blob = _Blob(append=False)
+        if isinstance(data, (bytes, bytearray)):
+            blob.data += data
+        elif hasattr(data, "__aiter__"):
+            async for part in data:
+                blob.data += part
+        else:
+            for part in data:
+                blob.data += part
+        self.container.blobs[self.blob_name] = blob
+
+    async def delete_blob(self):
+        await self.container.delay()
+        if self.container.blobs.pop(self.blob_name, None) is None:
+            raise ResourceNotFoundError(f"The blob {self.blob_name} does not exist")
+
+
+class MemoryContainerClient:
+    """Container whose blobs live in a dict; every call waits `latency_ms`"""
+
+    def __init__(
+        self,
+        latency_ms: float = 0,
+        max_blocks: int = APPEND_BLOB_MAX_BLOCKS,
+        chunk_size: int = 4 * 1024 * 1024,
+        exists: bool = True,
+    ):
+        self.latency_ms = latency_ms
+        # False simulates a storage account where the container was never created
+        self.exists = exists
+        self.max_blocks = max_blocks
+        self.chunk_size = chunk_size
+        self.blobs: Dict[str, _Blob] = {}
+        self.appends = 0
+        self.downloads = 0
+
+    async def delay(self):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    def get_blob_client(self, blob: str) -> MemoryBlobClient:
+        return MemoryBlobClient(self, blob)
+
+    def check_exists(self):
+        if not self.exists:
+            error = ResourceNotFoundError("The specified container does not exist")
+            error.error_code = StorageErrorCode.CONTAINER_NOT_FOUND
+            raise error
+
+    async def create_container(self):
+        await self.delay()
+        self.exists = True
+
+    async def list_blobs(self, name_starts_with: Optional[str] = None) -> AsyncIterator[_Properties]:
+        await self.delay()
+        for name in sorted(self.blobs):
+            if name_starts_with is None or name.startswith(name_starts_with):
+                yield _Properties(name, len(self.blobs[name].data))
+
+    def prefill(self, blob_name: str, records: Iterable[dict], records_per_block: int = 100):
+        """Write records straight into a log's segments (no latency) to simulate an existing log"""
+        segment, blob, batch = 0, None, []
+
+        def flush():
+            nonlocal segment, blob
+            if blob is None or blob.blocks >= self.max_blocks:
+                if blob is not None:
+                    segment += 1
+                blob = self.blobs.setdefault(segment_blob_name(blob_name, segment), _Blob(append=True))
+            blob.data += b"".join(encode_jsonl(batch))
+            blob.blocks += 1
+            batch.clear()
+
+        for record in records:
+            batch.append(record)
+            if len(batch) >= records_per_block:
+                flush()
+        if batch:
+            flush()
+
+    def size(self, prefix: str = "") -> int:
+        return sum(len(blob.data) for name, blob in self.blobs.items() if name.startswith(prefix))
+
+
+def _storage_error(code: StorageErrorCode, message: str) -> HttpResponseError:
+    error = HttpResponseError(message=message)
+    error.error_code = code
+    return error
@@ -0,0 +1,186 @@
+"""
+Local stand-in for the Azure OpenAI chat and embeddings APIs and the Azure AI Search indexing API
+
+Lets the ingestion command and the chat client's throttling run end to end
+without Azure:
+
+    python -m scripts.standin_server --port 8765 --throttle-rate 0.05
+    python -m scripts.ingest_documents sample-docs \\
+        --openai-endpoint http://127.0.0.1:8765 --openai-api-key local \\
+        --search-endpoint http://127.0.0.1:8765 --search-api-key local --index standin
+
+Chat completions return a grounded answer with `--citations` citations and
+`--answer-words` words (streamed as SSE when requested, `--stream-delay-ms`
+apart). Embeddings come from the offline hashing embedder. Indexed documents
+are kept in memory; `GET /stats` reports request and document counts. With
+`--throttle-rate`, that share of requests is rejected with 429 and a
+Retry-After header, to exercise the client retry paths.
+
+The load benchmark (`scripts.bench_load`) runs the same server in-process
+through `create_app`.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+from app.services.embeddings import HashingEmbedder
+
+
+class StandinState:
+    def __init__(self, args):
+        self.args = args
+        self.embedder = HashingEmbedder(args.dimensions)
+        self.answer = build_answer(args.answer_words, args.citations)
+        self.context = build_context(args.citations)
+        self.documents = {}
+        self.counts = {"chat_requests": 0, "embedding_requests": 0, "embedded_inputs": 0, "index_requests": 0, "throttled": 0}
+
+    async def delay_or_throttle(self):
+        """Apply the simulated latency; return a 429 response if this request is throttled"""
+        if self.args.latency_ms:
+            await asyncio.sleep(self.args.latency_ms / 1000)
+        if random.random() < self.args.throttle_rate:
+            self.counts["throttled"] += 1
+            return web.json_response(
+                {"error": {"code": "429", "message": "Rate limit exceeded (stand-in)"}},
+                status=429,
+                headers={"Retry-After": str(self.args.retry_after)},
+            )
+        return None
+
+
+async def handle(request: web.Request) -> web.Response:
+    state: StandinState = request.app["state"]
+    path = request.path
+
+    if request.method == "GET" and path == "/stats":
+        return web.json_response({**state.counts, "documents": len(state.documents)})
+
+    if request.method == "POST" and path.endswith("/chat/completions"):
+        throttled = await state.delay_or_throttle()
+        if throttled is not None:
+            return throttled
+        body = await request.json()
+        state.counts["chat_requests"] += 1
+        return await chat_completion(request, body, state)
+
+    if request.method == "POST" and path.endswith("/embeddings"):
+        throttled = await state.delay_or_throttle()
+        if throttled is not None:
+            return throttled
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        vectors = await state.embedder.embed(inputs)
+        state.counts["embedding_requests"] += 1
+        state.counts["embedded_inputs"] += len(inputs)
+        return web.json_response({
+            "object": "list",
+            "model": body.get("model", "standin"),
+            "data": [{"object": "embedding", "index": i, "embedding": vector.tolist()} for i, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    if request.method == "POST" and path.endswith("/docs/search.index"):
+        throttled = await state.delay_or_throttle()
+        if throttled is not None:
+            return throttled
+        body = await request.json()
+        state.counts["index_requests"] += 1
+        results = []
+        for action in body["value"]:
+            key = action[state.args.key_field]
+            if action.get("@search.action") == "delete":
+                state.documents.pop(key, None)
+            else:
+                state.documents[key] = action
+            results.append({"key": key, "status": True, "errorMessage": None, "statusCode": 200})
+        return web.json_response({"value": results})
+
+    return web.json_response({"error": {"code": "NotFound", "message": path}}, status=404)
+
+
+ANSWER = "Contoso offers a one-year limited warranty on all products"
+CITATION_CONTENT = "All Contoso products come with a one-year limited warranty against defects in materials and workmanship. "
+
+
+def build_answer(words: int, citations: int) -> str:
+    base = ANSWER.split()
+    text = " ".join(base[i % len(base)] for i in range(max(words, 1)))
+    return text + "".join(f" [doc{i + 1}]" for i in range(citations)) + "."
+
+
+def build_context(citations: int) -> dict:
+    return {
+        "citations": [{
+            "title": f"Contoso, Ltd. Limited Warranty Terms (part {i + 1})",
+            "content": CITATION_CONTENT * 8,
+            "filepath": "contoso-warranty.md",
+            "url": "",
+            "chunk_id": str(i),
+        } for i in range(citations)],
+        "intent": "[\"warranty\"]",
+    }
+
+
+async def chat_completion(request: web.Request, body: dict, state: StandinState) -> web.StreamResponse:
+    base = {"id": "chatcmpl-standin", "created": int(time.time()), "model": body.get("model", "standin")}
+    answer, context = state.answer, state.context
+    if not body.get("stream"):
+        return web.json_response({
+            **base,
+            "object": "chat.completion",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": answer, "context": context},
+            }],
+            "usage": {"prompt_tokens": 100, "completion_tokens": len(answer.split()), "total_tokens": 100 + len(answer.split())},
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    chunks = [{"role": "assistant", "context": context}] + [{"content": word + " "} for word in answer.split()]
+    for i, delta in enumerate(chunks):
+        if i and state.args.stream_delay_ms:
+            await asyncio.sleep(state.args.stream_delay_ms / 1000)
+        finish_reason = "stop" if i == len(chunks) - 1 else None
+        chunk = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--key-field", default="chunk_id")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every request")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--stream-delay-ms", type=float, default=0, help="Delay between streamed chunks")
+    parser.add_argument("--answer-words", type=int, default=12, help="Length of the chat answer")
+    parser.add_argument("--citations", type=int, default=1, help="Citations returned with each answer")
+    return parser
+
+
+def create_app(args: argparse.Namespace) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["state"] = StandinState(args)
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
+
+
+def main():
+    args = build_parser().parse_args()
+    web.run_app(create_app(args), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
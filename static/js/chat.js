@@ -3,8 +3,11 @@
  * 
  * This JavaScript handles the client-side functionality of the RAG application:
  * - Manages the chat UI (sending messages, displaying responses)
- * - Communicates with the FastAPI backend via fetch API
- * - Handles citations and displays them in a modal
+ * - Communicates with the FastAPI backend via fetch API, in a server-side
+ *   session so only the new message is sent on each turn
+ * - Streams answers (Server-Sent Events) and renders them as tokens arrive
+ * - Handles citations and displays them in a modal, fetching the citation
+ *   text from the server when a citation is first opened
  * - Manages error states and loading indicators
  * 
  * The chat interface supports:
@@ -36,6 +39,11 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Chat history array
     let messages = [];
+    // Server-side session, and how many of the messages it already holds
+    let sessionId = null;
+    let sessionLength = 0;
+    // True while an answer is still streaming in
+    let streaming = false;
     
     // Initialize empty chat
     if (emptyChatTemplate) {
@@ -90,7 +98,7 @@ document.addEventListener('DOMContentLoaded', function() {
      * Checks if a request is currently loading
      */
     function isLoading() {
-        return !loadingIndicator.classList.contains('d-none');
+        return streaming || !loadingIndicator.classList.contains('d-none');
     }
     
     /**
@@ -110,106 +118,140 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     /**
-     * Displays an assistant message with citations in the chat interface
+     * Creates an assistant message in the chat interface
      * 
-     * This function:
-     * 1. Creates the HTML for the assistant's message
-     * 2. Processes any citations returned from Azure AI Search
-     * 3. Converts citation references [doc1], [doc2], etc. into clickable badges
-     * 4. Sets up event handlers for citation badge clicks
-     * 5. Adds the message to the chat history
+     * The message starts empty so a streamed answer can be rendered as it arrives.
+     * Answers are requested in the compact format, so citations only carry
+     * their title, file path and URL until they are opened.
+     * Returns a handle with:
+     * - render(content, citations, streaming): re-renders the text and citation badges
+     * - finalize(content, responseId): stores the response_id and enables feedback
      */
-    function addAssistantMessage(content, citations, responseId) {
+    function createAssistantMessage(responseId) {
         const messageNode = assistantMessageTemplate.content.cloneNode(true);
         const messageContent = messageNode.querySelector('.message-content');
         const messageDiv = messageNode.querySelector('.card');
         // Create a unique ID for this message
         const messageId = 'msg-' + Date.now();
         messageDiv.setAttribute('id', messageId);
-        // Store response_id as a data attribute for this assistant message
+        // Known from the first stream event, so citations can be opened while the answer streams
         if (responseId) {
             messageDiv.setAttribute('data-response-id', responseId);
         }
-        // Create a message-specific citation data store
-        const messageCitations = {};
-        if (content && content.length > 0) {
-            // Format content with citations if available
-            let formattedContent = content;
-            // Render **bold** markdown (but not inside citation links)
-            formattedContent = formattedContent.replace(/\*\*(.+?)\*\*/g, '<b>$1</b>');
-            // Render [docN] citations as clickable
-            if (citations && citations.length > 0) {
-                // Replace [doc1], [doc2], etc. with interactive citation links
-                const pattern = /\[doc(\d+)\]/g;
-                formattedContent = formattedContent.replace(pattern, (match, index) => {
-                    const idx = parseInt(index);
-                    if (idx > 0 && idx <= citations.length) {
-                        const citation = citations[idx - 1];
-                        const citationData = JSON.stringify({
-                            title: citation.title || '',
-                            content: citation.content || '',
-                            filePath: citation.filePath || '',
-                            url: citation.url || ''
-                        });
-                        // Store citation data in this message's citations
-                        messageCitations[idx] = citationData;
-                        // Create badge-style citation link
-                        return `<a class=\"badge bg-primary rounded-pill\" style=\"cursor: pointer;\" data-message-id=\"${messageId}\" data-index=\"${idx}\">${idx}</a>`;
+        // Citation text fetched from the server, by citation number
+        const citationText = {};
+        // Feedback is only possible once the answer is complete
+        messageNode.querySelectorAll('.feedback-btn').forEach(b => b.disabled = true);
+        // Handle citation and filename badge clicks with one delegated listener,
+        // so the content can be re-rendered while streaming without re-binding
+        messageContent.addEventListener('click', function(e) {
+            const badge = e.target.closest('.badge');
+            if (!badge) return;
+            e.preventDefault();
+            e.stopPropagation();
+            if (badge.hasAttribute('data-filename')) {
+                // Show a modal with just the filename
+                const filename = badge.getAttribute('data-filename');
+                showCitationModal({ title: filename, content: '', filePath: filename, url: '' });
+            } else if (badge.hasAttribute('data-index')) {
+                // Get this message's citations
+                const idx = badge.getAttribute('data-index');
+                const messageCitations = JSON.parse(messageDiv.getAttribute('data-citations') || '{}');
+                if (messageCitations[idx]) {
+                    const citation = JSON.parse(messageCitations[idx]);
+                    if (citation.content || citationText[idx] !== undefined) {
+                        showCitationModal({ ...citation, content: citation.content || citationText[idx] });
+                    } else {
+                        fetchCitation(messageDiv.getAttribute('data-response-id'), idx)
+                            .then(full => {
+                                citationText[idx] = full.content || '';
+                                showCitationModal({ ...citation, content: citationText[idx] });
+                            })
+                            .catch(() => showCitationModal(citation));
                     }
-                    return match;
-                });
+                }
             }
-            // Render [filename.pdf] or [filename.docx] as clickable badge if not already a citation
-            formattedContent = formattedContent.replace(/\[([^\[\]]+\.(pdf|docx|pptx|xlsx|txt|md|csv))\]/gi, (match, filename) => {
-                // Avoid double rendering if already a docN citation
-                if (/^doc\d+$/.test(filename)) return match;
-                // Show as a badge, and on click show a modal with just the filename
-                return `<a class=\"badge bg-secondary rounded-pill\" style=\"cursor: pointer;\" data-filename=\"${filename}\">${filename}</a>`;
-            });
-            messageContent.innerHTML = formattedContent.replace(/\n/g, '<br>');
-            // Add click listeners for filename badges (non-citation)
-            setTimeout(() => {
-                const fileBadges = messageContent.querySelectorAll('.badge[data-filename]');
-                fileBadges.forEach(badge => {
-                    badge.addEventListener('click', function(e) {
-                        e.preventDefault();
-                        e.stopPropagation();
-                        const filename = this.getAttribute('data-filename');
-                        showCitationModal({ title: filename, content: '', filePath: filename, url: '' });
-                    });
-                });
-            }, 100);
-            // Store the message citations as a data attribute
-            messageDiv.setAttribute('data-citations', JSON.stringify(messageCitations));
-            // Add click listeners for citation badges
-            setTimeout(() => {
-                const badges = messageContent.querySelectorAll('.badge[data-index]');
-                badges.forEach(badge => {
-                    badge.addEventListener('click', function(e) {
-                        e.preventDefault();
-                        e.stopPropagation();
-                        const messageId = this.getAttribute('data-message-id');
-                        const idx = this.getAttribute('data-index');
-                        // Get the message element
-                        const messageElement = document.getElementById(messageId);
-                        // Get this message's citations
-                        const messageCitations = JSON.parse(messageElement.getAttribute('data-citations') || '{}');
-                        const citationData = JSON.parse(messageCitations[idx]);
-                        // Show citation modal
-                        showCitationModal(citationData);
-                    });
-                });
-            }, 100);
-        }
+        });
         chatHistory.appendChild(messageNode);
         scrollToBottom();
 
-        // Store response_id for this assistant message
-        responseIds.push(responseId || null);
+        return {
+            render: (content, citations, streaming) => {
+                renderAssistantContent(messageDiv, messageContent, messageId, content, citations, streaming);
+            },
+            finalize: (content, responseId) => {
+                // Store response_id as a data attribute for this assistant message
+                if (responseId) {
+                    messageDiv.setAttribute('data-response-id', responseId);
+                }
+                // Store response_id for this assistant message
+                responseIds.push(responseId || null);
+                messageDiv.querySelectorAll('.feedback-btn').forEach(b => b.disabled = false);
+                setupFeedback(messageDiv, content);
+            }
+        };
+    }
 
-        // Store response_id for this assistant message
-        responseIds.push(responseId || null);
+    /**
+     * Renders the content of an assistant message
+     * 
+     * This function:
+     * 1. Processes any citations returned from Azure AI Search
+     * 2. Converts citation references [doc1], [doc2], etc. into clickable badges
+     * 3. Stores the citation data on the message for the badge click handler
+     * 
+     * While streaming, a partially received marker such as "[doc" is held back
+     * until the rest arrives, so each badge appears as soon as its marker is complete.
+     */
+    function renderAssistantContent(messageDiv, messageContent, messageId, content, citations, streaming) {
+        // Create a message-specific citation data store
+        const messageCitations = {};
+        // Format content with citations if available
+        let formattedContent = content || '';
+        if (streaming) {
+            formattedContent = formattedContent.replace(/\[(d(o(c\d*)?)?)?$/, '');
+        }
+        // Render **bold** markdown (but not inside citation links)
+        formattedContent = formattedContent.replace(/\*\*(.+?)\*\*/g, '<b>$1</b>');
+        // Render [docN] citations as clickable
+        if (citations && citations.length > 0) {
+            // Replace [doc1], [doc2], etc. with interactive citation links
+            const pattern = /\[doc(\d+)\]/g;
+            formattedContent = formattedContent.replace(pattern, (match, index) => {
+                const idx = parseInt(index);
+                if (idx > 0 && idx <= citations.length) {
+                    const citation = citations[idx - 1];
+                    const citationData = JSON.stringify({
+                        title: citation.title || '',
+                        content: citation.content || '',
+                        filePath: citation.filePath || citation.filepath || '',
+                        url: citation.url || ''
+                    });
+                    // Store citation data in this message's citations
+                    messageCitations[idx] = citationData;
+                    // Create badge-style citation link
+                    return `<a class=\"badge bg-primary rounded-pill\" style=\"cursor: pointer;\" data-message-id=\"${messageId}\" data-index=\"${idx}\">${idx}</a>`;
+                }
+                return match;
+            });
+        }
+        // Render [filename.pdf] or [filename.docx] as clickable badge if not already a citation
+        formattedContent = formattedContent.replace(/\[([^\[\]]+\.(pdf|docx|pptx|xlsx|txt|md|csv))\]/gi, (match, filename) => {
+            // Avoid double rendering if already a docN citation
+            if (/^doc\d+$/.test(filename)) return match;
+            // Show as a badge, and on click show a modal with just the filename
+            return `<a class=\"badge bg-secondary rounded-pill\" style=\"cursor: pointer;\" data-filename=\"${filename}\">${filename}</a>`;
+        });
+        messageContent.innerHTML = formattedContent.replace(/\n/g, '<br>');
+        // Store the message citations as a data attribute
+        messageDiv.setAttribute('data-citations', JSON.stringify(messageCitations));
+        scrollToBottom();
+    }
 
+    /**
+     * Sets up the thumb up/down feedback buttons of a completed assistant message
+     */
+    function setupFeedback(messageDiv, content) {
         // Feedback button logic
         setTimeout(() => {
             const feedbackBtns = messageDiv.parentElement.querySelectorAll('.feedback-btn');
@@ -377,6 +419,17 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 200);
     }
     
+    /**
+     * Fetches the full text of citation [docN] of an answer
+     */
+    function fetchCitation(responseId, index) {
+        return fetch(`/api/citations/${encodeURIComponent(responseId)}/${index}`)
+            .then(res => {
+                if (!res.ok) throw new Error(`HTTP error! Status: ${res.status}`);
+                return res.json();
+            });
+    }
+    
     /**
      * Shows a modal with citation details
      */
@@ -501,15 +554,89 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 50);
     }
     
+    /**
+     * Reads a Server-Sent Events response body and calls onEvent(name, data)
+     * for each event as it arrives
+     */
+    function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (done) return;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    const frame = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let eventName = 'message';
+                    let data = '';
+                    frame.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    if (data) onEvent(eventName, JSON.parse(data));
+                }
+                return pump();
+            });
+        }
+        return pump();
+    }
+    
+    /**
+     * Returns the server-side session, creating it on the first turn
+     * 
+     * Resolves to null if sessions are unavailable; the full history is sent then.
+     */
+    function ensureSession() {
+        if (sessionId) return Promise.resolve(sessionId);
+        return fetch('/api/sessions', { method: 'POST' })
+            .then(res => res.ok ? res.json() : null)
+            .then(data => {
+                sessionId = data ? data.session_id : null;
+                sessionLength = 0;
+                return sessionId;
+            })
+            .catch(() => null);
+    }
+    
+    /**
+     * Posts the messages the session does not have yet to the streaming endpoint
+     * 
+     * If the session has expired, a new one is started with the whole conversation.
+     */
+    function postChatStream(retried) {
+        return ensureSession().then(id => fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                session_id: id || undefined,
+                messages: id ? messages.slice(sessionLength) : messages,
+                // Citation stubs only; the text is fetched when a citation is opened
+                format: 'compact'
+            })
+        })).then(response => {
+            if (response.status === 404 && sessionId && !retried) {
+                sessionId = null;
+                return postChatStream(true);
+            }
+            return response;
+        });
+    }
+    
     /**
      * Sends a user message to the server for RAG processing
      * 
      * This function:
      * 1. Adds the user message to the UI
-     * 2. Sends the entire conversation history to the FastAPI backend
-     * 3. Processes the response from Azure OpenAI enhanced with Azure AI Search results
-     * 4. Extracts any citations from the context
-     * 5. Handles errors gracefully with user-friendly messages
+     * 2. Sends the new message (or, without a session, the entire conversation
+     *    history) to the FastAPI backend
+     * 3. Streams the answer from Azure OpenAI enhanced with Azure AI Search results,
+     *    rendering tokens and citation badges as they arrive
+     * 4. Handles errors gracefully with user-friendly messages
      */
     function sendMessage(text) {
         hideError();
@@ -529,17 +656,29 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Show loading indicator
         showLoading();
+        streaming = true;
+        
+        // Streamed answer state
+        let streamedMessage = null;
+        let content = '';
+        let citations = [];
+        let responseId = null;
+        let renderPending = false;
+        
+        // Re-render at most once per animation frame, however fast tokens arrive
+        function scheduleRender() {
+            if (renderPending) return;
+            renderPending = true;
+            requestAnimationFrame(() => {
+                renderPending = false;
+                if (streaming) {
+                    streamedMessage.render(content, citations, true);
+                }
+            });
+        }
         
         // Send request to server
-        fetch('/api/chat/completion', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                messages: messages
-            })
-        })
+        postChatStream()
         .then(response => {
             if (!response.ok) {
                 // Try to parse the error response
@@ -550,33 +689,37 @@ document.addEventListener('DOMContentLoaded', function() {
                     throw new Error(`HTTP error! Status: ${response.status}`);
                 });
             }
-            // Log raw response for debugging
-            return response.json();
+            return readEventStream(response, (eventName, data) => {
+                if (eventName === 'metadata' || eventName === 'done') {
+                    responseId = data.response_id || responseId;
+                } else if (eventName === 'citations') {
+                    // Citations arrive before the answer text
+                    citations = data.citations || [];
+                } else if (eventName === 'delta') {
+                    if (!streamedMessage) {
+                        // First token: replace the loading placeholder with the real message
+                        loadingIndicator.classList.add('d-none');
+                        streamedMessage = createAssistantMessage(responseId);
+                    }
+                    content += data.content;
+                    scheduleRender();
+                } else if (eventName === 'error') {
+                    throw new Error(data.message || 'An error occurred');
+                }
+            });
         })
-        .then(data => {
+        .then(() => {
+            streaming = false;
             hideLoading();
             
-            if (data.error) {
-                // Handle API error
-                showError(data.message || 'An error occurred');
-                return;
-            }
-            
-            const choice = data.choices && data.choices.length > 0 ? data.choices[0] : null;
-            if (!choice || !choice.message || !choice.message.content) {
+            if (!content) {
                 showError('No answer received from the AI service.');
                 return;
             }
             
-            // Get message data
-            const message = choice.message;
-            const content = message.content;
-            
-            // Extract citations from context
-            const citations = message.context?.citations || [];
-            
-            // Add assistant message to UI and store response_id
-            addAssistantMessage(content, citations, data.response_id);
+            // Final render without holding back partial citation markers
+            streamedMessage.render(content, citations, false);
+            streamedMessage.finalize(content, responseId);
             
             // Add assistant message to chat history
             const assistantMessage = {
@@ -584,8 +727,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 content: content
             };
             messages.push(assistantMessage);
+            // The server appended the new messages and the answer to the session
+            if (sessionId) {
+                sessionLength = messages.length;
+            }
         })
         .catch(error => {
+            streaming = false;
             hideLoading();
             showError(`Error: ${error.message}`);
             console.error('Error:', error);
@@ -0,0 +1,11 @@
+"""
+Placeholder settings, so modules that read `app.config.settings` can be imported
+
+Nothing here talks to Azure: tests pass in-memory stand-ins for the clients.
+"""
+import os
+
+from scripts.bench_load import PLACEHOLDER_ENV
+
+for name, value in PLACEHOLDER_ENV.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,141 @@
+"""
+Circuit breaker transitions and latency tracking of `BackendRouter`
+"""
+import time
+
+import httpx
+import openai
+
+from app.services.backend_router import CLOSED, HALF_OPEN, OPEN, Backend, BackendRouter
+
+REQUEST = httpx.Request("POST", "https://example.openai.azure.com/openai/deployments/gpt/chat/completions")
+
+
+def status_error(cls, status: int) -> openai.APIStatusError:
+    return cls(f"HTTP {status}", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+def server_error() -> openai.APIStatusError:
+    return status_error(openai.InternalServerError, 500)
+
+
+def bad_request() -> openai.APIStatusError:
+    # What a content filter hit looks like
+    return status_error(openai.BadRequestError, 400)
+
+
+def make_router(*names: str, failure_threshold: int = 3, cooldown_seconds: float = 30.0) -> BackendRouter:
+    backends = [Backend(name, f"https://{name}.openai.azure.com", "gpt", 1.0, client=None) for name in names]
+    return BackendRouter(backends, failure_threshold=failure_threshold, cooldown_seconds=cooldown_seconds)
+
+
+def fail(router: BackendRouter, backend: Backend, error: Exception):
+    assert router.pick(exclude=[b for b in router.backends if b is not backend]) is backend
+    router.release(backend, error=error)
+
+
+def open_backend(router: BackendRouter, backend: Backend):
+    for _ in range(router.failure_threshold):
+        fail(router, backend, server_error())
+    assert backend.state == OPEN
+    # Skip the cooldown
+    backend.open_until = time.monotonic()
+
+
+def test_consecutive_faults_open_the_breaker():
+    router = make_router("a", "b", failure_threshold=3)
+    a, b = router.backends
+    fail(router, a, server_error())
+    fail(router, a, openai.APIConnectionError(request=REQUEST))
+    assert a.state == CLOSED
+    fail(router, a, server_error())
+
+    assert a.state == OPEN
+    assert a.open_until > time.monotonic() + 29
+    # Out of rotation while cooling down
+    assert all(router.pick() is b for _ in range(20))
+
+
+def test_probe_success_closes_and_probe_fault_reopens():
+    router = make_router("a")
+    a = router.backends[0]
+    open_backend(router, a)
+
+    assert router.pick() is a
+    assert a.state == HALF_OPEN
+    router.release(a, error=server_error())
+    assert a.state == OPEN
+    assert a.open_until > time.monotonic() + 29
+
+    a.open_until = time.monotonic()
+    assert router.pick() is a
+    router.release(a, latency=0.2)
+    assert a.state == CLOSED
+    assert a.consecutive_failures == 0
+    assert a.ewma_latency == 0.2
+
+
+def test_only_one_probe_at_a_time():
+    router = make_router("a", "b")
+    a, b = router.backends
+    open_backend(router, a)
+
+    probe = router.pick(exclude=[b])
+    assert probe is a and a.state == HALF_OPEN
+    assert all(router.pick() is b for _ in range(20))
+
+
+def test_cancelled_probe_lets_the_next_request_probe():
+    router = make_router("a", "b")
+    a, b = router.backends
+    open_backend(router, a)
+
+    assert router.pick(exclude=[b]) is a
+    router.abandon(a)
+    assert a.state == OPEN
+    assert a.in_flight == 0
+    assert router.pick(exclude=[b]) is a
+    assert a.state == HALF_OPEN
+
+
+def test_client_errors_do_not_reset_the_failure_streak():
+    # Regression: a 400 used to count as a success and clear the streak
+    router = make_router("a", failure_threshold=3)
+    a = router.backends[0]
+    fail(router, a, server_error())
+    fail(router, a, server_error())
+    fail(router, a, bad_request())
+    assert a.consecutive_failures == 2
+    fail(router, a, server_error())
+    assert a.state == OPEN
+
+
+def test_client_errors_do_not_feed_the_latency_average():
+    router = make_router("a")
+    a = router.backends[0]
+    router.pick()
+    router.release(a, latency=1.0)
+    router.pick()
+    router.release(a, latency=0.01, error=bad_request())
+
+    assert a.ewma_latency == 1.0
+    assert a.in_flight == 0
+    assert a.failures == 0
+
+
+def test_half_open_probe_answered_with_a_client_error():
+    # Regression: any non-fault error used to close a half-open breaker; only an
+    # HTTP answer (the backend is reachable) does now
+    router = make_router("a", "b")
+    a, b = router.backends
+    open_backend(router, a)
+
+    assert router.pick(exclude=[b]) is a
+    router.release(a, error=ValueError("malformed request built locally"))
+    assert a.state == OPEN
+    assert a.open_until <= time.monotonic()
+
+    assert router.pick(exclude=[b]) is a
+    router.release(a, error=bad_request())
+    assert a.state == CLOSED
+    assert a.ewma_latency is None
@@ -0,0 +1,70 @@
+"""
+`CompressionMiddleware` driven directly through ASGI messages
+"""
+import asyncio
+import gzip
+
+from app.services.compression import CompressionMiddleware, merge_vary
+
+BODY = b'{"answer": "' + b"Contoso offers a one-year limited warranty. " * 100 + b'"}'
+
+
+def respond(status: int = 200, headers: list = (), body: bytes = BODY):
+    """ASGI app that sends one fixed response"""
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json"), *headers]})
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def request(app, accept_encoding: bytes = b"gzip") -> tuple:
+    """Run one request through the middleware; returns (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding)]}
+    asyncio.run(CompressionMiddleware(app)(scope, receive, send))
+    start, *bodies = messages
+    return start["status"], start["headers"], b"".join(message.get("body", b"") for message in bodies)
+
+
+def header_values(headers: list, name: bytes) -> list:
+    return [value for key, value in headers if key == name]
+
+
+def test_compresses_and_varies_on_accept_encoding():
+    status, headers, body = request(respond())
+    assert header_values(headers, b"content-encoding") == [b"gzip"]
+    assert header_values(headers, b"vary") == [b"Accept-Encoding"]
+    assert gzip.decompress(body) == BODY
+
+
+def test_merges_into_an_existing_vary_header():
+    status, headers, body = request(respond(headers=[(b"vary", b"Origin")]))
+    assert header_values(headers, b"vary") == [b"Origin, Accept-Encoding"]
+
+    assert merge_vary([(b"vary", b"origin, accept-encoding")]) == [(b"vary", b"origin, accept-encoding")]
+    assert merge_vary([(b"vary", b"*")]) == [(b"vary", b"*")]
+
+
+def test_passes_through_partial_content():
+    headers = [(b"content-range", b"bytes 0-%d/99999" % (len(BODY) - 1))]
+    status, headers, body = request(respond(status=206, headers=headers))
+    assert status == 206
+    assert header_values(headers, b"content-encoding") == []
+    assert body == BODY
+
+
+def test_passes_through_already_encoded_bodies():
+    encoded = gzip.compress(BODY)
+    status, headers, body = request(respond(headers=[(b"content-encoding", b"gzip")], body=encoded), b"br, gzip")
+    assert header_values(headers, b"content-encoding") == [b"gzip"]
+    assert header_values(headers, b"vary") == []
+    assert body == encoded
@@ -0,0 +1,192 @@
+"""
+Deadline budgets, their propagation to the stages, and the 504/499 answers
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+from aiohttp import web
+
+from app.services.deadline import (
+    ClientDisconnected,
+    DeadlineExceeded,
+    run_for_client,
+    stage_timeout,
+    start_budget,
+    within,
+)
+from app.services.throttling import ThrottledError
+from scripts.standin_server import build_parser, create_app
+
+QUESTION = {"messages": [{"role": "user", "content": "What does the warranty cover?"}]}
+
+
+def test_stages_share_the_budget():
+    async def scenario():
+        budget = start_budget(10, retrieval_seconds=3, logging_seconds=1)
+        assert stage_timeout("retrieval") == pytest.approx(3, abs=0.05)
+        assert stage_timeout("llm") == pytest.approx(9, abs=0.05)
+        assert stage_timeout("telemetry") == 1
+        budget.started -= 8
+        # Retrieval never eats into what generation and logging need
+        assert stage_timeout("retrieval") == pytest.approx(1, abs=0.05)
+        assert stage_timeout("llm") == pytest.approx(1, abs=0.05)
+        budget.started -= 5
+        assert stage_timeout("llm") == 0
+
+        start_budget(0, 3, 1)
+        assert stage_timeout("llm") is None
+
+    asyncio.run(scenario())
+
+
+def test_stage_over_its_share_raises_deadline_exceeded():
+    async def scenario():
+        start_budget(10, retrieval_seconds=0.05, logging_seconds=1)
+        with pytest.raises(DeadlineExceeded) as raised:
+            await within("retrieval", asyncio.sleep(1))
+        assert raised.value.stage == "retrieval"
+
+    asyncio.run(scenario())
+
+
+def test_budget_reaches_tasks_and_the_rate_limit_queue():
+    from app.services.throttling import ThrottledChatCompletions
+
+    class Completions:
+        async def create(self, **kwargs):
+            await asyncio.sleep(10)
+
+    async def scenario():
+        start_budget(0.3, retrieval_seconds=0.1, logging_seconds=0.1)
+        completions = ThrottledChatCompletions(Completions(), initial_concurrency=1, deadline=60)
+        busy = asyncio.create_task(completions.create(messages=[]))
+        await asyncio.sleep(0.01)
+        # Tasks inherit the request's budget, so the queue gives up with the request
+        # instead of after its own 60s deadline
+        with pytest.raises(ThrottledError):
+            await asyncio.wait_for(asyncio.create_task(completions.create(messages=[])), timeout=2)
+        busy.cancel()
+
+    asyncio.run(scenario())
+
+
+class FakeRequest:
+    """Just enough of a Starlette request for run_for_client"""
+
+    def __init__(self, disconnect_after: float):
+        self.disconnect_after = disconnect_after
+
+    async def receive(self):
+        await asyncio.sleep(self.disconnect_after)
+        return {"type": "http.disconnect"}
+
+
+def test_disconnect_cancels_the_work():
+    async def scenario():
+        start_budget(10, 1, 1)
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(ClientDisconnected):
+            await run_for_client(FakeRequest(disconnect_after=0.05), work())
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    asyncio.run(scenario())
+
+
+@asynccontextmanager
+async def chat_app(monkeypatch, *options: str, deadline: float):
+    """`main.app` with the Azure OpenAI stand-in and an in-memory blob container"""
+    import main
+    from app.config import settings
+    from app.services.resources import AppResources
+    from scripts.bench_load import StaticTokenCredential
+    from scripts.standin_blob import MemoryContainerClient
+
+    standin = create_app(build_parser().parse_args(list(options)))
+    runner = web.AppRunner(standin, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    overrides = {
+        "azure_openai_endpoint": f"http://127.0.0.1:{port}",
+        "azure_openai_backends": [],
+        "retriever_backend": "azure_search",
+        "response_cache_enabled": False,
+        "faq_fast_path_enabled": False,
+        "startup_warmup_enabled": False,
+        "request_deadline_seconds": deadline,
+        "request_deadline_retrieval_seconds": 0.1,
+        "request_deadline_logging_seconds": 0.1,
+        "telemetry_flush_interval_seconds": 0.05,
+    }
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+    container = MemoryContainerClient()
+    resources = AppResources(settings)
+    await resources.startup(credential=StaticTokenCredential(), container_client=container)
+    main.app.state.resources = resources
+    try:
+        yield main.app, container
+    finally:
+        await resources.shutdown()
+        await runner.cleanup()
+
+
+def logged_records(container) -> list:
+    return [json.loads(line) for blob in container.blobs.values() for line in bytes(blob.data).splitlines() if line]
+
+
+def test_deadline_exceeded_is_a_504_and_logged_as_a_timeout(monkeypatch):
+    async def scenario():
+        async with chat_app(monkeypatch, "--latency-ms", "1000", deadline=0.3) as (app, container):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                response = await client.post("/api/chat/completion", json=QUESTION)
+        assert response.status_code == 504
+        assert response.json()["error"] == {"code": "deadline_exceeded", "stage": "llm"}
+        assert [record["outcome"] for record in logged_records(container)] == ["timeout"]
+
+    asyncio.run(scenario())
+
+
+def test_client_disconnect_is_a_499_and_logged_as_cancelled(monkeypatch):
+    async def scenario():
+        async with chat_app(monkeypatch, "--latency-ms", "1000", deadline=30) as (app, container):
+            body = json.dumps(QUESTION).encode("utf-8")
+            received = []
+            sent = []
+
+            async def receive():
+                if not received:
+                    received.append(True)
+                    return {"type": "http.request", "body": body, "more_body": False}
+                # The client goes away while the answer is being generated
+                await asyncio.sleep(0.2)
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+                "scheme": "http", "path": "/api/chat/completion", "raw_path": b"/api/chat/completion",
+                "query_string": b"", "root_path": "", "headers": [(b"content-type", b"application/json")],
+                "client": ("127.0.0.1", 1), "server": ("test", 80),
+            }
+            started = asyncio.get_running_loop().time()
+            await app(scope, receive, send)
+            assert asyncio.get_running_loop().time() - started < 0.9
+        assert sent[0]["status"] == 499
+        assert [record["outcome"] for record in logged_records(container)] == ["cancelled"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+"""
+Embedding cache shared through one directory
+
+Two `EmbeddingCache` instances on the same directory stand in for two worker
+processes: neither sees the other's writes except through the files.
+"""
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache, embedding_cache_key
+
+DIMENSIONS = 8
+
+
+def keys(*texts: str):
+    return [embedding_cache_key("test", text) for text in texts]
+
+
+def vectors(count: int) -> np.ndarray:
+    return np.random.default_rng(count).random((count, DIMENSIONS), dtype=np.float32)
+
+
+def test_entries_count_writes_from_every_instance(tmp_path):
+    first = EmbeddingCache(str(tmp_path), max_entries=100)
+    second = EmbeddingCache(str(tmp_path), max_entries=100)
+    first.put_many(keys("a", "b", "c"), vectors(3))
+    assert first.stats()["entries"] == 3
+    assert second.stats()["entries"] == 3
+
+    second.put_many(keys("d"), vectors(1))
+    assert first.stats()["entries"] == 4
+
+
+def test_rotation_keeps_entries_that_are_still_used(tmp_path):
+    first = EmbeddingCache(str(tmp_path), max_entries=4)
+    second = EmbeddingCache(str(tmp_path), max_entries=4)
+    stored = vectors(3)
+    first.put_many(keys("a", "b", "c"), stored)
+
+    # Does not fit in generation 0: generation 1 starts
+    second.put_many(keys("d", "e"), vectors(2))
+    assert second.rotations == 1
+    assert first.stats()["entries"] == 5
+
+    # A hit in the previous generation is copied into the current one
+    [a] = first.get_many(keys("a"))
+    np.testing.assert_array_equal(a, stored[0])
+    assert first.promotions == 1
+
+    # Generation 2 starts and generation 0 is deleted: "a" survives, "b" does not
+    second.put_many(keys("f", "g"), vectors(2))
+    assert second.rotations == 2
+    a, b = first.get_many(keys("a", "b"))
+    np.testing.assert_array_equal(a, stored[0])
+    assert b is None
+    assert all(vector is not None for vector in second.get_many(keys("d", "f")))
+    assert first.stats()["entries"] == second.stats()["entries"]
@@ -0,0 +1,97 @@
+"""
+Evaluation lookups by response_id against the in-memory container (`scripts.standin_blob`)
+"""
+import asyncio
+import time
+
+from app.services.evaluation_blob_storage import EvaluationBlobStorage, new_response_id
+from app.services.evaluation_columnar import columnar_blob_name, encode_columnar
+from app.services.feedback_blob_storage import FeedbackBlobStorage
+from app.services.feedback_join import find_evaluation_record, get_evaluation_with_feedback, iter_evaluation_records
+from app.services.log_writer import partition_blob_name
+from scripts.standin_blob import MemoryContainerClient
+
+PREFIX = "evaluation"
+COLUMNAR_PREFIX = "evaluation-columnar"
+FEEDBACK = "feedback.jsonl"
+
+
+def test_lookup_reads_only_the_hour_of_the_response_id():
+    async def scenario():
+        container = MemoryContainerClient()
+        storage = EvaluationBlobStorage(container, "evaluation.jsonl", prefix=PREFIX, worker_id="w1")
+        response_ids = [new_response_id() for _ in range(3)]
+        await storage.append_evaluations({"response_id": r, "llm_response": "answer"} for r in response_ids)
+        # Other hours are never downloaded
+        container.prefill(partition_blob_name(PREFIX, time.gmtime(0), "w1"), [{"response_id": "old"}])
+
+        container.downloads = 0
+        record = await find_evaluation_record(container, response_ids[1], PREFIX, COLUMNAR_PREFIX)
+        assert record["response_id"] == response_ids[1]
+        assert container.downloads == 1
+
+        assert await find_evaluation_record(container, "old", PREFIX, COLUMNAR_PREFIX) is None
+        assert await find_evaluation_record(container, response_ids[1], None) is None
+
+    asyncio.run(scenario())
+
+
+def test_lookup_reads_a_compacted_hour():
+    async def scenario():
+        container = MemoryContainerClient()
+        response_id = new_response_id(now=0)
+        data = encode_columnar([{"response_id": response_id, "llm_response": "answer"}], "1970/01/01/00")
+        await container.get_blob_client(columnar_blob_name(COLUMNAR_PREFIX, "1970/01/01/00")).upload_blob(data)
+
+        record = await find_evaluation_record(container, response_id, PREFIX, COLUMNAR_PREFIX)
+        assert record["llm_response"] == "answer"
+
+    asyncio.run(scenario())
+
+
+def test_latest_feedback_is_merged_without_reading_the_feedback_log():
+    async def scenario():
+        container = MemoryContainerClient()
+        storage = EvaluationBlobStorage(container, "evaluation.jsonl", prefix=PREFIX, worker_id="w1")
+        feedback = FeedbackBlobStorage(container, FEEDBACK)
+        response_id = new_response_id()
+        await storage.append_evaluation({"response_id": response_id, "llm_response": "answer"})
+        await feedback.append_feedbacks([
+            {"response_id": response_id, "feedback": "thumb_up", "timestamp": "2024-05-01T10:00:00"},
+            {"response_id": response_id, "feedback": "thumb_down", "grounded_answer": "fixed", "timestamp": "2024-05-01T10:01:00"},
+        ])
+        # Ids that are not response ids never become blob names
+        await feedback.append_feedback({"response_id": "../evaluation", "feedback": "thumb_up"})
+        assert sorted(container.blobs) == [
+            partition_blob_name(PREFIX, time.gmtime(), "w1"), FEEDBACK, f"feedback/{response_id}.json"
+        ]
+
+        container.blobs.pop(FEEDBACK)
+        record = await get_evaluation_with_feedback(container, FEEDBACK, response_id, PREFIX, COLUMNAR_PREFIX)
+        assert record["feedback"] == "thumb_down"
+        assert record["grounded_answer"] == "fixed"
+
+    asyncio.run(scenario())
+
+
+def test_compacted_hours_are_read_after_their_jsonl_is_deleted():
+    async def scenario():
+        container = MemoryContainerClient()
+        compacted_hour = time.gmtime(0)
+        open_hour = time.gmtime(3600)
+        container.prefill(partition_blob_name(PREFIX, open_hour, "w1"), [{"response_id": "c"}])
+        data = encode_columnar([{"response_id": "a"}, {"response_id": "b"}], "1970/01/01/00")
+        await container.get_blob_client(columnar_blob_name(COLUMNAR_PREFIX, "1970/01/01/00")).upload_blob(data)
+        # Not read: the columnar file replaces the hour's JSONL
+        container.prefill(partition_blob_name(PREFIX, compacted_hour, "w1"), [{"response_id": "a"}])
+
+        records = iter_evaluation_records(container, "evaluation.jsonl", PREFIX, columnar_prefix=COLUMNAR_PREFIX)
+        assert [record["response_id"] async for record in records] == ["a", "b", "c"]
+
+        container.blobs.pop(partition_blob_name(PREFIX, compacted_hour, "w1"))
+        records = iter_evaluation_records(
+            container, "evaluation.jsonl", PREFIX, newest_first=True, columnar_prefix=COLUMNAR_PREFIX
+        )
+        assert [record["response_id"] async for record in records] == ["c", "a", "b"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+"""
+History packing at the edges of the token budget
+
+Budgets are computed with `count_message_tokens`, so the tests hold whether
+token counts come from tiktoken or from the length estimate.
+"""
+from app.services.history_packer import HistoryPacker, count_message_tokens
+
+SYSTEM = "You answer questions about Contoso products."
+HISTORY = [
+    {"role": "user", "content": "What does the warranty cover?"},
+    {"role": "assistant", "content": "Defects in materials and workmanship for one year."},
+    {"role": "user", "content": "And accidental damage?"},
+    {"role": "assistant", "content": "No, accidental damage needs the protection plan."},
+    {"role": "user", "content": "How much is the protection plan?"},
+]
+
+
+def tokens(*messages: dict) -> int:
+    return sum(count_message_tokens(m["role"], m["content"]) for m in messages)
+
+
+def base() -> int:
+    """System prompt plus the latest turn, which are always sent"""
+    return count_message_tokens("system", SYSTEM) + tokens(HISTORY[-1])
+
+
+def test_turn_that_exactly_fills_the_budget_is_kept():
+    budget = base() + tokens(*HISTORY[-3:-1])
+    packed = HistoryPacker(budget).pack(SYSTEM, HISTORY)
+    assert packed.messages[1:] == HISTORY[-3:]
+    assert packed.dropped == HISTORY[:-3]
+    assert packed.prompt_tokens == budget
+
+
+def test_turn_one_token_over_the_budget_is_dropped():
+    budget = base() + tokens(*HISTORY[-3:-1]) - 1
+    packed = HistoryPacker(budget).pack(SYSTEM, HISTORY)
+    assert packed.messages[1:] == HISTORY[-2:]
+    assert packed.dropped == HISTORY[:-2]
+
+
+def test_older_turns_are_not_kept_past_a_gap():
+    # A long turn in the middle ends the packing even if older turns would fit
+    history = HISTORY[:2] + [{"role": "user", "content": "x " * 2000}] + HISTORY[-2:]
+    budget = base() + tokens(*HISTORY[-2:-1]) + tokens(*HISTORY[:2])
+    packed = HistoryPacker(budget).pack(SYSTEM, history)
+    assert packed.messages[1:] == HISTORY[-2:]
+    assert packed.dropped == history[:3]
+
+
+def test_latest_turn_is_sent_even_over_the_budget():
+    packed = HistoryPacker(1).pack(SYSTEM, HISTORY)
+    assert packed.messages == [{"role": "system", "content": SYSTEM}, HISTORY[-1]]
+    assert packed.dropped == HISTORY[:-1]
+    assert packed.prompt_tokens == base()
+
+
+def test_whole_history_within_the_budget():
+    packed = HistoryPacker(base() + tokens(*HISTORY[:-1])).pack(SYSTEM, HISTORY)
+    assert packed.messages[1:] == HISTORY
+    assert packed.dropped == []
+    assert HistoryPacker(10000).pack(SYSTEM, []).messages == [{"role": "system", "content": SYSTEM}]
+
+
+def test_summary_is_added_only_when_it_fits():
+    summary = "The user asked about the warranty."
+    summary_tokens = count_message_tokens("system", f"Summary of the earlier conversation:\n{summary}")
+    # Turns come first: make the next older turn too long for the room left for the summary
+    history = HISTORY[:1] + [{"role": "assistant", "content": "Defects in materials. " * 20}] + HISTORY[2:]
+    assert tokens(history[1]) > summary_tokens
+    budget = base() + tokens(*history[-3:-1])
+
+    packed = HistoryPacker(budget + summary_tokens).pack(SYSTEM, history, summary)
+    assert packed.messages[1]["content"].endswith(summary)
+    assert packed.messages[2:] == history[-3:]
+    assert packed.prompt_tokens == budget + summary_tokens
+
+    packed = HistoryPacker(budget + summary_tokens - 1).pack(SYSTEM, history, summary)
+    assert packed.messages[1:] == history[-3:]
+
+    # Nothing was dropped: no summary even with room for it
+    packed = HistoryPacker(10000).pack(SYSTEM, history, summary)
+    assert packed.messages[1:] == history
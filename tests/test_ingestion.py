@@ -0,0 +1,94 @@
+"""
+Incremental ingestion: only chunks whose content changed are embedded again
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+from typing import List
+
+from app.services.chunking import chunk_markdown
+from app.services.embeddings import HashingEmbedder
+from app.services.ingestion import DocumentIngestor, IngestionManifest, document_key, embedding_text
+
+GUIDE = """# Contoso guide
+
+Welcome to the Contoso product guide.
+
+## Shipping
+
+Orders ship within two business days.
+
+Express delivery is available in most regions.
+
+## Returns
+
+Products can be returned within 30 days.
+
+## Warranty
+
+Every product has a one-year limited warranty.
+"""
+
+
+class RecordingEmbedder(HashingEmbedder):
+    """Hashing embedder that remembers what it was asked to embed"""
+
+    def __init__(self):
+        super().__init__(dimensions=32)
+        self.texts: List[str] = []
+
+    async def embed(self, texts: List[str]):
+        self.texts.extend(texts)
+        return await super().embed(texts)
+
+
+class MemorySearchClient:
+    """The two index operations the ingestor uses, on a dict"""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def upload_documents(self, documents):
+        self.documents.update((document["chunk_id"], document) for document in documents)
+        return [SimpleNamespace(key=document["chunk_id"], succeeded=True) for document in documents]
+
+    async def delete_documents(self, documents):
+        for document in documents:
+            self.documents.pop(document["chunk_id"], None)
+        return [SimpleNamespace(key=document["chunk_id"], succeeded=True) for document in documents]
+
+
+def ingest(tmp_path, text: str, search_client: MemorySearchClient) -> RecordingEmbedder:
+    docs = tmp_path / "docs"
+    docs.mkdir(exist_ok=True)
+    (docs / "guide.md").write_text(text, encoding="utf-8")
+    embedder = RecordingEmbedder()
+    manifest = IngestionManifest(str(tmp_path / "manifest.json"))
+    ingestor = DocumentIngestor(embedder, search_client, manifest, embedder.model, max_chunk_tokens=20)
+    asyncio.run(ingestor.ingest([str(docs)]))
+    return embedder
+
+
+def test_inserted_paragraph_only_reembeds_its_section(tmp_path):
+    search_client = MemorySearchClient()
+    first = ingest(tmp_path, GUIDE, search_client)
+    assert len(first.texts) == 5
+
+    # The new paragraph becomes a chunk of its own, so every later chunk moves
+    # one position down the file; only the Shipping section has changed though
+    edited = GUIDE.replace("Orders ship", "Free shipping on orders over $50.\n\nOrders ship")
+    second = ingest(tmp_path, edited, search_client)
+
+    filepath = os.path.relpath(tmp_path / "docs" / "guide.md")
+    chunks = list(chunk_markdown(edited.splitlines(True), filepath, 20))
+    shipping = [chunk for chunk in chunks if "#contoso-guide-shipping-" in chunk.chunk_id]
+    assert len(shipping) == 3
+    assert sorted(second.texts) == sorted(embedding_text(chunk) for chunk in shipping)
+    # Nothing left behind in the index
+    assert set(search_client.documents) == {document_key(chunk.chunk_id) for chunk in chunks}
+
+
+def test_unchanged_document_is_not_reembedded(tmp_path):
+    search_client = MemorySearchClient()
+    ingest(tmp_path, GUIDE, search_client)
+    assert ingest(tmp_path, GUIDE, search_client).texts == []
@@ -0,0 +1,81 @@
+"""
+Append-blob log writer against the in-memory container (`scripts.standin_blob`)
+
+The stand-in enforces the committed block limit the way the service does, so
+a small `max_blocks` makes segments roll over after a few appends.
+"""
+import asyncio
+
+from app.services.log_writer import AppendBlobLogWriter, iter_log_records, segment_blob_name
+from scripts.standin_blob import MemoryContainerClient
+
+LOG = "evaluation.jsonl"
+
+
+async def read_log(container: MemoryContainerClient) -> list:
+    return [record async for record in iter_log_records(container, LOG)]
+
+
+def test_full_segment_rolls_over_to_the_next():
+    async def scenario():
+        container = MemoryContainerClient(max_blocks=3)
+        # The writer does not know the limit, so every fourth append is rejected first
+        writer = AppendBlobLogWriter(container, LOG)
+        for i in range(10):
+            await writer.append({"seq": i})
+
+        assert [record["seq"] for record in await read_log(container)] == list(range(10))
+        assert [container.blobs[segment_blob_name(LOG, n)].blocks for n in range(4)] == [3, 3, 3, 1]
+        assert writer.current_blob_name == "evaluation.0003.jsonl"
+
+    asyncio.run(scenario())
+
+
+def test_writer_rolls_over_at_its_own_block_limit():
+    async def scenario():
+        container = MemoryContainerClient(max_blocks=3)
+        writer = AppendBlobLogWriter(container, LOG, max_blocks=2)
+        for i in range(7):
+            await writer.append({"seq": i})
+
+        assert [record["seq"] for record in await read_log(container)] == list(range(7))
+        # Segments are closed after two blocks, before the service would reject a third
+        assert [container.blobs[segment_blob_name(LOG, n)].blocks for n in range(4)] == [2, 2, 2, 1]
+
+    asyncio.run(scenario())
+
+
+def test_block_blob_left_by_an_older_version_is_skipped():
+    async def scenario():
+        container = MemoryContainerClient()
+        await container.get_blob_client(LOG).upload_blob(b'{"seq": 0}\n')
+        writer = AppendBlobLogWriter(container, LOG)
+        await writer.append_many([{"seq": 1}, {"seq": 2}])
+
+        assert [record["seq"] for record in await read_log(container)] == [0, 1, 2]
+        assert writer.current_blob_name == "evaluation.0001.jsonl"
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_appends_keep_every_record_once_and_in_order():
+    async def scenario():
+        container = MemoryContainerClient(latency_ms=1, max_blocks=5)
+        writer = AppendBlobLogWriter(container, LOG)
+
+        async def producer(name: str):
+            for i in range(20):
+                await writer.append({"producer": name, "seq": i})
+
+        names = [f"p{n}" for n in range(8)]
+        await asyncio.gather(*(producer(name) for name in names))
+
+        records = await read_log(container)
+        assert len(records) == 8 * 20
+        # Segments are contiguous (readers stop at the first missing one) and
+        # each producer's records appear in the order it appended them
+        for name in names:
+            assert [r["seq"] for r in records if r["producer"] == name] == list(range(20))
+        assert all(blob.blocks <= 5 for blob in container.blobs.values())
+
+    asyncio.run(scenario())
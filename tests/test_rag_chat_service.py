@@ -0,0 +1,147 @@
+"""
+`RagChatService` against the in-process Azure OpenAI stand-in (`scripts.standin_server`)
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from openai import AsyncAzureOpenAI
+
+from app.models.chat_models import ChatMessage
+from app.services.embeddings import HashingEmbedder
+from app.services.faq_index import FaqIndex
+from app.services.local_index import LocalVectorIndex
+from app.services.rag_chat_service import RagChatService
+from scripts.build_faq_index import embed_questions, read_entries
+from scripts.standin_server import build_parser, create_app
+
+QUESTION = [ChatMessage(role="user", content="Do you ship internationally?")]
+FAQ_DOCS = os.path.join(os.path.dirname(__file__), os.pardir, "sample-docs", "*faq*.md")
+FAQ_QUESTION = "How can I check the status of my order?"
+
+
+@asynccontextmanager
+async def standin(*options: str, **service_options):
+    """A stand-in server and a chat service pointed at it"""
+    app = create_app(build_parser().parse_args(list(options)))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = AsyncAzureOpenAI(azure_endpoint=f"http://127.0.0.1:{port}", api_key="standin", api_version="2024-10-21")
+    try:
+        yield RagChatService(client, **service_options), app["state"]
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+async def until(condition):
+    while not condition():
+        await asyncio.sleep(0.01)
+
+
+def test_streamed_answer_keeps_the_backend_in_flight_until_it_ends():
+    async def scenario():
+        async with standin("--stream-delay-ms", "30", "--answer-words", "10") as (service, state):
+            backend = service.router.primary
+            events = service.stream_chat_completion(QUESTION)
+            async for event in events:
+                if event["type"] == "delta":
+                    # The headers arrived long ago; the answer is still being generated
+                    assert backend.in_flight == 1
+                    assert backend.ewma_latency is None
+            assert backend.in_flight == 0
+            # The whole answer is timed, not only the time to the headers
+            assert backend.ewma_latency >= 0.25
+
+    asyncio.run(scenario())
+
+
+def test_stream_closed_early_frees_the_backend_without_a_latency_sample():
+    async def scenario():
+        async with standin("--stream-delay-ms", "30", "--answer-words", "20") as (service, state):
+            backend = service.router.primary
+            events = service.stream_chat_completion(QUESTION)
+            async for event in events:
+                if event["type"] == "delta":
+                    break
+            await events.aclose()
+            # The shared upstream stream (single-flight) is cancelled in its own task
+            await asyncio.wait_for(until(lambda: backend.in_flight == 0), timeout=5)
+            assert backend.ewma_latency is None
+            assert backend.failures == 0
+
+    asyncio.run(scenario())
+
+
+def build_faq_index(directory, min_confidence: float = 0.65) -> FaqIndex:
+    """The sample FAQ, indexed like `scripts.build_faq_index` does"""
+    embedder = HashingEmbedder(64)
+    entries = read_entries(FAQ_DOCS)
+    embeddings = asyncio.run(embed_questions(embedder, entries, batch_size=64))
+    index = LocalVectorIndex.write(str(directory), entries, embeddings, embedder.name)
+    return FaqIndex(index, embedder, min_confidence=min_confidence)
+
+
+def ask(faq_index: FaqIndex, messages, stream: bool = False):
+    """Ask through a service with `faq_index`; returns (answer, metadata, LLM calls)"""
+    async def scenario():
+        async with standin(faq_index=faq_index) as (service, state):
+            metadata = {}
+            if stream:
+                events = [event async for event in service.stream_chat_completion(messages, metadata)]
+                answer = "".join(event["content"] for event in events if event["type"] == "delta")
+            else:
+                response = await service.get_chat_completion(messages, metadata)
+                answer = response["choices"][0]["message"]["content"]
+            return answer, metadata, state.counts["chat_requests"]
+
+    return asyncio.run(scenario())
+
+
+def test_faq_question_is_answered_without_the_llm(tmp_path):
+    faq_index = build_faq_index(tmp_path)
+    for stream in (False, True):
+        answer, metadata, llm_calls = ask(faq_index, [ChatMessage(role="user", content=FAQ_QUESTION)], stream)
+        assert llm_calls == 0
+        assert answer.endswith("[doc1]")
+        assert metadata["fast_path"] == "faq"
+        assert metadata["faq_confidence"] > 0.9
+
+
+def test_only_matches_at_or_above_the_confidence_threshold(tmp_path):
+    question = [ChatMessage(role="user", content="How do I check my order status?")]
+    confidence = asyncio.run(build_faq_index(tmp_path / "probe").match(question[0].content)).confidence
+
+    answer, metadata, llm_calls = ask(build_faq_index(tmp_path / "at", min_confidence=confidence), question)
+    assert llm_calls == 0
+    assert metadata["fast_path"] == "faq"
+
+    answer, metadata, llm_calls = ask(build_faq_index(tmp_path / "above", min_confidence=confidence + 0.001), question)
+    assert llm_calls == 1
+    assert "fast_path" not in metadata
+
+
+def test_follow_up_questions_go_to_the_llm(tmp_path):
+    # Regression: the fast path used to match the latest question of any conversation
+    faq_index = build_faq_index(tmp_path)
+    follow_up = [
+        ChatMessage(role="user", content="I ordered a laptop last week."),
+        ChatMessage(role="assistant", content="Thanks, how can I help with it?"),
+        ChatMessage(role="user", content=FAQ_QUESTION),
+    ]
+    for stream in (False, True):
+        answer, metadata, llm_calls = ask(faq_index, follow_up, stream)
+        assert llm_calls == 1
+        assert "fast_path" not in metadata
+    assert faq_index.hits == 0
+
+
+def test_system_messages_do_not_make_a_follow_up(tmp_path):
+    messages = [ChatMessage(role="system", content="Answer briefly."), ChatMessage(role="user", content=FAQ_QUESTION)]
+    answer, metadata, llm_calls = ask(build_faq_index(tmp_path), messages)
+    assert llm_calls == 0
+    assert metadata["fast_path"] == "faq"
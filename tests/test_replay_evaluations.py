@@ -0,0 +1,77 @@
+"""
+Replays reach the model under test, not the FAQ fast path
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from app.config import settings
+from app.services.embeddings import HashingEmbedder
+from app.services.local_index import LocalVectorIndex
+from scripts.build_faq_index import embed_questions, read_entries
+from scripts.replay_evaluations import run
+
+FAQ_DOCS = os.path.join(os.path.dirname(__file__), os.pardir, "sample-docs", "*faq*.md")
+FAQ_QUESTION = "How can I check the status of my order?"
+
+
+def replay(monkeypatch, tmp_path, faq_fast_path: bool) -> list:
+    """Replay one logged FAQ question against the stand-in; returns the result lines"""
+    embedder = HashingEmbedder(64)
+    entries = read_entries(FAQ_DOCS)
+    embeddings = asyncio.run(embed_questions(embedder, entries, batch_size=64))
+    LocalVectorIndex.write(str(tmp_path / "faq-index"), entries, embeddings, embedder.name)
+
+    # `run` sets these on the global settings; monkeypatch puts them back afterwards
+    for name in (
+        "azure_openai_endpoint",
+        "azure_openai_backends",
+        "retriever_backend",
+        "response_cache_enabled",
+        "faq_fast_path_enabled",
+    ):
+        monkeypatch.setattr(settings, name, getattr(settings, name))
+    monkeypatch.setattr(settings, "faq_index_path", str(tmp_path / "faq-index"))
+    monkeypatch.setattr(settings, "startup_warmup_enabled", False)
+
+    records = tmp_path / "records.jsonl"
+    records.write_text(json.dumps({
+        "response_id": "2024050113-faq",
+        "user_chat_history": [{"role": "user", "content": FAQ_QUESTION}],
+        "llm_response": "You can check it on the order page.",
+    }) + "\n")
+    output = tmp_path / f"replay-{faq_fast_path}.jsonl"
+    args = argparse.Namespace(
+        input=str(records),
+        output=str(output),
+        report=None,
+        concurrency=1,
+        limit=None,
+        timeout=10,
+        endpoint=None,
+        deployment=None,
+        system_prompt=None,
+        rpm=None,
+        tpm=None,
+        faq_fast_path=faq_fast_path,
+        progress_every=100,
+        standin=True,
+        standin_latency_ms=0,
+        standin_throttle_rate=0,
+    )
+    asyncio.run(run(args))
+    return [json.loads(line) for line in output.read_text().splitlines()]
+
+
+def test_replayed_faq_questions_reach_the_model(monkeypatch, tmp_path):
+    [result] = replay(monkeypatch, tmp_path, faq_fast_path=False)
+    assert "error" not in result
+    assert result["fast_path"] == ""
+    assert result["backend"]
+
+
+def test_faq_fast_path_flag_answers_like_the_app(monkeypatch, tmp_path):
+    [result] = replay(monkeypatch, tmp_path, faq_fast_path=True)
+    assert "error" not in result
+    assert result["fast_path"] == "faq"
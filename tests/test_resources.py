@@ -0,0 +1,74 @@
+"""
+Container bootstrap and readiness of `AppResources`, with in-memory stand-ins
+"""
+import asyncio
+
+from app.config import AppSettings
+from app.services.log_writer import AppendBlobLogWriter, iter_log_records
+from app.services.resources import AppResources
+from scripts.bench_load import StaticTokenCredential
+from scripts.standin_blob import MemoryContainerClient
+
+
+class FlakyContainerClient(MemoryContainerClient):
+    """Container whose first `failures` create_container() calls fail"""
+
+    def __init__(self, failures: int):
+        super().__init__(exists=False)
+        self.failures = failures
+
+    async def create_container(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("storage unreachable")
+        await super().create_container()
+
+
+def test_readiness_waits_for_the_container_bootstrap_without_warm_up():
+    async def scenario():
+        settings = AppSettings(startup_warmup_enabled=False)
+        container = FlakyContainerClient(failures=1)
+        resources = AppResources(settings)
+        await resources.startup(credential=StaticTokenCredential(), container_client=container)
+        try:
+            await asyncio.sleep(0)
+            assert not resources.ready
+            # Retried after a second instead of being left to the first request
+            await asyncio.wait_for(resources.warmup_task, 5)
+            assert container.exists
+            assert resources.ready
+        finally:
+            await resources.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_log_writer_creates_a_missing_container():
+    async def scenario():
+        container = MemoryContainerClient(exists=False)
+        writer = AppendBlobLogWriter(container, "evaluation.jsonl")
+        await writer.append({"seq": 0})
+
+        assert container.exists
+        assert [record async for record in iter_log_records(container, "evaluation.jsonl")] == [{"seq": 0}]
+
+    asyncio.run(scenario())
+
+
+class TrackedCredential(StaticTokenCredential):
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_shutdown_leaves_an_injected_credential_open():
+    async def scenario():
+        credential = TrackedCredential()
+        resources = AppResources(AppSettings(startup_warmup_enabled=False))
+        await resources.startup(credential=credential, container_client=MemoryContainerClient())
+        await resources.shutdown()
+        assert not credential.closed
+
+    asyncio.run(scenario())
@@ -0,0 +1,133 @@
+"""
+Response cache tiers: memory LRU with TTL, the shared tier and promotion between them
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+
+from app.services import response_cache
+from app.services.response_cache import CacheTier, MemoryCacheTier, RedisCacheTier, ResponseCache, make_cache_key
+
+ANSWER = {"choices": [{"message": {"role": "assistant", "content": "One year."}}]}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+class DictTier(CacheTier):
+    """Stand-in for a shared tier; `fail` makes every call raise like an unreachable server"""
+
+    name = "shared"
+
+    def __init__(self):
+        self.entries = {}
+        self.fail = False
+
+    async def get(self, key: str) -> Optional[dict]:
+        if self.fail:
+            raise ConnectionError("unreachable")
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: dict) -> None:
+        if self.fail:
+            raise ConnectionError("unreachable")
+        self.entries[key] = value
+
+
+def test_memory_entries_expire_after_the_ttl(clock):
+    async def scenario():
+        tier = MemoryCacheTier(max_entries=10, ttl_seconds=60)
+        await tier.set("q", ANSWER)
+        clock.now += 59
+        assert await tier.get("q") == ANSWER
+        clock.now += 2
+        assert await tier.get("q") is None
+        assert len(tier) == 0
+
+    asyncio.run(scenario())
+
+
+def test_memory_evicts_the_least_recently_used(clock):
+    async def scenario():
+        tier = MemoryCacheTier(max_entries=2, ttl_seconds=60)
+        await tier.set("a", {"n": 1})
+        await tier.set("b", {"n": 2})
+        # Reading "a" makes "b" the least recently used
+        assert await tier.get("a") == {"n": 1}
+        await tier.set("c", {"n": 3})
+        assert await tier.get("b") is None
+        assert await tier.get("a") == {"n": 1}
+        assert await tier.get("c") == {"n": 3}
+
+    asyncio.run(scenario())
+
+
+def test_shared_tier_hit_is_copied_to_memory(clock):
+    async def scenario():
+        memory, shared = MemoryCacheTier(), DictTier()
+        cache = ResponseCache([memory, shared])
+        shared.entries["q"] = ANSWER
+
+        assert await cache.get("q") == ANSWER
+        assert len(memory) == 1
+        assert await cache.get("q") == ANSWER
+        assert cache.stats()["hits"] == {"memory": 1, "shared": 1}
+
+        await cache.set("other", ANSWER)
+        assert "other" in shared.entries
+
+    asyncio.run(scenario())
+
+
+def test_failing_tier_counts_as_a_miss(clock):
+    async def scenario():
+        shared = DictTier()
+        shared.fail = True
+        cache = ResponseCache([MemoryCacheTier(), shared])
+        await cache.set("q", ANSWER)
+        assert await cache.get("q") == ANSWER
+        assert await cache.get("missing") is None
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["errors"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_key_ignores_spacing_and_case_but_not_the_index_version():
+    messages = [{"role": "user", "content": "What does the  warranty cover?"}]
+    same = [{"role": "user", "content": "what does the warranty cover? "}]
+    key = make_cache_key(messages, "docs", "1", "gpt-4o")
+    assert make_cache_key(same, "docs", "1", "gpt-4o") == key
+    assert make_cache_key(messages, "docs", "2", "gpt-4o") != key
+
+
+@pytest.mark.skipif(not os.environ.get("REDIS_URL"), reason="REDIS_URL points at a Redis server to test against")
+def test_redis_tier_round_trip_and_ttl():
+    pytest.importorskip("redis")
+
+    async def scenario():
+        tier = RedisCacheTier(os.environ["REDIS_URL"], ttl_seconds=1, prefix="rag:test:")
+        try:
+            await tier.set("q", ANSWER)
+            assert await tier.get("q") == ANSWER
+            await asyncio.sleep(2.1)
+            assert await tier.get("q") is None
+        finally:
+            await tier.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+"""
+Session expiry and eviction, in the store and through the chat endpoint
+"""
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import response_cache
+from app.services.response_cache import MemoryCacheTier
+from app.services.session_store import SessionStore
+
+TURN = [{"role": "user", "content": "What does the warranty cover?"}, {"role": "assistant", "content": "One year."}]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_session_expires_after_the_idle_ttl(clock):
+    async def scenario():
+        store = SessionStore(MemoryCacheTier(max_entries=10, ttl_seconds=600))
+        session_id = await store.create()
+        clock.now += 599
+        assert await store.get(session_id) == []
+        clock.now += 2
+        assert await store.get(session_id) is None
+        assert store.stats()["misses"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_each_turn_restarts_the_ttl(clock):
+    async def scenario():
+        store = SessionStore(MemoryCacheTier(max_entries=10, ttl_seconds=600))
+        session_id = await store.create()
+        for _ in range(3):
+            clock.now += 500
+            await store.save(session_id, TURN)
+        clock.now += 500
+        assert await store.get(session_id) == TURN
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    async def scenario():
+        store = SessionStore(MemoryCacheTier(max_entries=2, ttl_seconds=600))
+        first, second = await store.create(), await store.create()
+        await store.get(first)
+        await store.create()
+        assert await store.get(second) is None
+        assert await store.get(first) == []
+
+    asyncio.run(scenario())
+
+
+def test_only_the_latest_messages_are_kept(clock):
+    async def scenario():
+        store = SessionStore(MemoryCacheTier(), max_messages=3)
+        session_id = await store.create()
+        await store.save(session_id, TURN * 3)
+        assert await store.get(session_id) == (TURN * 3)[-3:]
+
+    asyncio.run(scenario())
+
+
+def test_expired_session_is_a_404(clock):
+    import main
+    from app.config import AppSettings
+    from app.services.resources import AppResources
+    from scripts.bench_load import StaticTokenCredential
+    from scripts.standin_blob import MemoryContainerClient
+
+    async def scenario():
+        resources = AppResources(AppSettings(startup_warmup_enabled=False, session_ttl_seconds=600))
+        await resources.startup(credential=StaticTokenCredential(), container_client=MemoryContainerClient())
+        main.app.state.resources = resources
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+                session_id = (await client.post("/api/sessions")).json()["session_id"]
+                clock.now += 601
+                response = await client.post(
+                    "/api/chat/completion",
+                    json={"session_id": session_id, "messages": [{"role": "user", "content": "And accidental damage?"}]},
+                )
+                assert response.status_code == 404
+        finally:
+            await resources.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,147 @@
+"""
+Single-flight coalescing of concurrent calls and streams
+"""
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+class Upstream:
+    """Counts calls; each one waits until `release` is set"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def call(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"answer": "One year."}
+
+    async def events(self, count: int = 3):
+        self.calls += 1
+        try:
+            for i in range(count):
+                await self.release.wait()
+                yield i
+                await asyncio.sleep(0)
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled += 1
+            raise
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.create_task(flight.do("q", upstream.call)) for _ in range(3)]
+        await settle()
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+
+        assert upstream.calls == 1
+        assert [shared for _, shared in results] == [False, True, True]
+        assert all(result is results[0][0] for result, _ in results)
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 2}
+
+        # Finished calls are not reused
+        await flight.do("q", upstream.call)
+        assert upstream.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("content filter")
+
+        callers = [asyncio.create_task(flight.do("q", fail)) for _ in range(2)]
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_one_caller_keeps_the_shared_call():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        first = asyncio.create_task(flight.do("q", upstream.call))
+        second = asyncio.create_task(flight.do("q", upstream.call))
+        await settle()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        upstream.release.set()
+        result, shared = await second
+        assert result == {"answer": "One year."}
+        assert upstream.cancelled == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_the_last_caller_cancels_the_shared_call():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.create_task(flight.do("q", upstream.call)) for _ in range(2)]
+        await settle()
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await settle()
+        assert upstream.cancelled == 1
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_late_subscriber_replays_the_stream():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        upstream.release.set()
+        first, shared = flight.stream("q", upstream.events)
+        assert not shared
+        assert await first.__anext__() == 0
+
+        second, shared = flight.stream("q", upstream.events)
+        assert shared
+        assert [event async for event in second] == [0, 1, 2]
+        assert [event async for event in first] == [1, 2]
+        assert upstream.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_stops_upstream_when_every_subscriber_leaves():
+    async def scenario():
+        flight, upstream = SingleFlight(), Upstream()
+        upstream.release.set()
+        first, _ = flight.stream("q", lambda: upstream.events(count=100))
+        second, _ = flight.stream("q", lambda: upstream.events(count=100))
+        await first.__anext__()
+        await second.__anext__()
+
+        await first.aclose()
+        await settle()
+        assert upstream.cancelled == 0
+        await second.aclose()
+        await settle()
+        assert upstream.cancelled == 1
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
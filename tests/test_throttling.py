@@ -0,0 +1,168 @@
+"""
+Throttling against the in-process Azure OpenAI stand-in (`scripts.standin_server`)
+
+The stand-in rejects a configurable share of requests with 429 and a
+Retry-After header; the tests flip that share at run time to drive the AIMD
+limiter down and back up.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import openai
+import pytest
+from aiohttp import web
+from openai import AsyncAzureOpenAI
+
+from app.services.throttling import ThrottledOpenAIClient, retry_after_seconds
+from scripts.standin_server import build_parser, create_app
+
+MESSAGES = [{"role": "user", "content": "What does the warranty cover?"}]
+
+
+@asynccontextmanager
+async def standin(*options: str, **throttling):
+    """A stand-in server and a throttled client pointed at it"""
+    app = create_app(build_parser().parse_args(list(options)))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = AsyncAzureOpenAI(azure_endpoint=f"http://127.0.0.1:{port}", api_key="standin", api_version="2024-10-21")
+    try:
+        yield ThrottledOpenAIClient(client, **throttling), app["state"]
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+async def complete(client: ThrottledOpenAIClient):
+    return await client.chat.completions.create(model="standin", messages=MESSAGES, max_tokens=50)
+
+
+def test_429_halves_the_limit_and_successes_restore_it():
+    async def scenario():
+        async with standin("--throttle-rate", "1", initial_concurrency=8, max_retries=0) as (client, state):
+            limiter = client.chat.completions.limiter
+            with pytest.raises(openai.RateLimitError):
+                await complete(client)
+            assert limiter.limit == 4
+
+            # A burst of 429s within one round trip is a single congestion signal
+            with pytest.raises(openai.RateLimitError):
+                await complete(client)
+            assert limiter.limit == 4
+
+            state.args.throttle_rate = 0
+            for _ in range(8):
+                await complete(client)
+            # Additive increase: about one slot per `limit` successes
+            assert 5 <= limiter.limit < 8
+            assert limiter.in_flight == 0
+            assert client.stats()["throttled"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_pauses_every_request():
+    async def scenario():
+        options = ("--throttle-rate", "1", "--retry-after", "0.5")
+        async with standin(*options, max_retries=2, retry_base_delay=0.01) as (client, state):
+            started = time.monotonic()
+            first = asyncio.create_task(complete(client))
+            while not state.counts["throttled"]:
+                await asyncio.sleep(0.01)
+            state.args.throttle_rate = 0
+            await asyncio.sleep(0.05)
+            assert client.stats()["paused_for_ms"] > 0
+
+            # Sent after the 429, so it waits for the pause like the retry does
+            second = asyncio.create_task(complete(client))
+            await asyncio.gather(first, second)
+            assert time.monotonic() - started >= 0.5
+            assert state.counts["throttled"] == 1
+            assert state.counts["chat_requests"] == 2
+            assert client.stats()["retries"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_headers():
+    request = httpx.Request("POST", "http://standin/chat/completions")
+
+    def rate_limit_error(headers: dict) -> openai.RateLimitError:
+        return openai.RateLimitError("throttled", response=httpx.Response(429, headers=headers, request=request), body=None)
+
+    assert retry_after_seconds(rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(rate_limit_error({"retry-after": "2"})) == 2
+    assert retry_after_seconds(rate_limit_error({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) is None
+    assert retry_after_seconds(rate_limit_error({})) is None
+
+
+def test_cancelled_call_releases_its_slot():
+    async def scenario():
+        async with standin("--latency-ms", "1000", initial_concurrency=1) as (client, state):
+            limiter = client.chat.completions.limiter
+            call = asyncio.create_task(complete(client))
+            while not limiter.in_flight:
+                await asyncio.sleep(0.01)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+            # The release runs in a task of its own
+            await asyncio.sleep(0.01)
+            assert limiter.in_flight == 0
+            # Neither a congestion signal nor a success
+            assert limiter.limit == 1
+            assert client.stats()["cancelled"] == 1
+
+            # The slot is free for the next call
+            state.args.latency_ms = 0
+            await asyncio.wait_for(complete(client), timeout=5)
+
+    asyncio.run(scenario())
+
+
+async def stream(client: ThrottledOpenAIClient):
+    return await client.chat.completions.create(model="standin", messages=MESSAGES, max_tokens=50, stream=True)
+
+
+def test_stream_holds_its_slot_until_it_ends():
+    async def scenario():
+        options = ("--stream-delay-ms", "20", "--answer-words", "5")
+        async with standin(*options, initial_concurrency=1) as (client, state):
+            limiter = client.chat.completions.limiter
+            response = await stream(client)
+            # The headers have arrived, but the answer is still being generated
+            assert limiter.in_flight == 1
+            second = asyncio.create_task(complete(client))
+            await asyncio.sleep(0.05)
+            assert not second.done()
+
+            chunks = [chunk async for chunk in response]
+            assert chunks
+            assert limiter.in_flight <= 1
+            await asyncio.wait_for(second, timeout=5)
+            assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_stream_closed_early_releases_its_slot():
+    async def scenario():
+        options = ("--stream-delay-ms", "50", "--answer-words", "20")
+        async with standin(*options, initial_concurrency=1) as (client, state):
+            limiter = client.chat.completions.limiter
+            response = await stream(client)
+            async for _ in response:
+                break
+            assert limiter.in_flight == 1
+            await response.close()
+            assert limiter.in_flight == 0
+            # Closing twice releases once
+            await response.close()
+            assert limiter.in_flight == 0
+
+    asyncio.run(scenario())